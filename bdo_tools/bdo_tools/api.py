@@ -0,0 +1,122 @@
+"""
+Shared pieces of the read-only JSON API.
+
+Clients such as the map front end want the whole world in a request or two.
+:class:`ReadOnlyBulkViewSet` lets them ask for many ids at once and only the
+fields they need, loads just the relations those fields use, and streams list
+responses in batches instead of building them in memory.
+"""
+
+from django.http import StreamingHttpResponse
+from rest_framework import serializers, viewsets
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def parse_list(value, cast=str):
+    """
+    Split a comma separated query parameter, ignoring empty items.
+    """
+    try:
+        return [cast(item) for item in value.split(',') if item]
+    except ValueError:
+        raise ParseError('Invalid list: {}'.format(value))
+
+
+class SparseFieldsMixin:
+    """
+    Only serialize the fields named in the ``fields`` context entry.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields')
+        if requested is not None:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+
+class SummarySerializer(serializers.Serializer):
+    """
+    The ``id`` and ``name`` of a related object, for embedding.
+    """
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+
+
+class ReadOnlyBulkViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    A read-only viewset with bulk and sparse fieldset support.
+
+    ``?ids=1,2,3`` limits the results to those ids and ``?fields=id,name``
+    limits each result to those fields. ``select_related_fields`` and
+    ``prefetch_related_fields`` map serializer field names to the lookups they
+    need, so only the relations of requested fields are loaded. Lists are
+    streamed as a JSON array, ``stream_batch_size`` rows per query batch.
+    """
+    select_related_fields = {}
+    prefetch_related_fields = {}
+    stream_batch_size = 500
+
+    def get_requested_fields(self):
+        if 'fields' not in self.request.query_params:
+            return None
+        fields = parse_list(self.request.query_params['fields'])
+        unknown = set(fields) - set(self.get_serializer_class()().fields)
+        if unknown:
+            raise ParseError('Unknown fields: {}'.format(
+                ', '.join(sorted(unknown))))
+        return fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'ids' in self.request.query_params:
+            ids = parse_list(self.request.query_params['ids'], int)
+            queryset = queryset.filter(pk__in=ids)
+
+        fields = self.get_requested_fields()
+        if fields is None:
+            fields = list(self.select_related_fields) + \
+                list(self.prefetch_related_fields)
+        for field in fields:
+            if field in self.select_related_fields:
+                queryset = queryset.select_related(
+                    *self.select_related_fields[field])
+            if field in self.prefetch_related_fields:
+                queryset = queryset.prefetch_related(
+                    *self.prefetch_related_fields[field])
+        return queryset.order_by('pk')
+
+    def stream(self, queryset, context):
+        """
+        Yield a JSON array of the serialized queryset, querying
+        ``stream_batch_size`` rows at a time so that prefetching still
+        works without holding every row in memory.
+        """
+        encoder = JSONEncoder()
+        serializer_class = self.get_serializer_class()
+        yield '['
+        last_pk = None
+        first = True
+        while True:
+            batch = queryset
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch[:self.stream_batch_size])
+            if not batch:
+                break
+            for data in serializer_class(batch, many=True, context=context).data:
+                yield ('' if first else ',') + encoder.encode(data)
+                first = False
+            last_pk = batch[-1].pk
+        yield ']'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        return StreamingHttpResponse(self.stream(queryset, context),
+                                     content_type='application/json')
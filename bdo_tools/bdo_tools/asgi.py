@@ -0,0 +1,195 @@
+"""
+ASGI config for bdo_tools project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+for any ASGI 3 server, e.g. ``uvicorn bdo_tools.asgi:application``.
+
+Django 1.11 views are synchronous, so each request still runs through the
+WSGI application, but on one of two bounded thread pools instead of holding a
+server worker. Views named in ``ASGI_HEAVY_VIEWS`` (planners, routes, the
+snapshot) run on a small pool of their own and the rest on the light pool,
+so a burst of slow requests queues behind itself rather than in front of the
+cheap list and detail pages. Responses are sent as the view produces them, so
+streaming responses like those of the bulk API are never held in memory.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import sys
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from nodes.autocomplete import get_autocomplete_index
+from .wsgi import application as wsgi_application
+
+
+def build_environ(scope, body):
+    """
+    Return the WSGI environ for an ASGI HTTP ``scope`` and request ``body``.
+    """
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI carries the raw path bytes as latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'] = server[0]
+    environ['SERVER_PORT'] = str(server[1])
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+def call_wsgi(wsgi, environ, send, loop):
+    """
+    Run ``wsgi`` for ``environ`` and pass its response to the ASGI ``send``
+    of ``loop`` chunk by chunk, waiting for each to be sent.
+
+    The whole response is read on the calling thread, since the database
+    connection a streaming response reads from belongs to it.
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    def send_message(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def send_start():
+        status, headers = started
+        send_message({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1'))
+                        for name, value in headers],
+        })
+
+    result = wsgi(environ, start_response)
+    try:
+        # Hold each chunk back until the next one shows whether it is last
+        pending = None
+        for chunk in result:
+            if not chunk:
+                continue
+            if pending is None:
+                send_start()
+            else:
+                send_message({'type': 'http.response.body', 'body': pending,
+                              'more_body': True})
+            pending = chunk
+        if pending is None:
+            send_start()
+        send_message({'type': 'http.response.body', 'body': pending or b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+class ASGIApplication:
+    """
+    Serve ``wsgi`` over ASGI with ``light_workers`` threads for most views
+    and ``heavy_workers`` for the view names in ``heavy_views``. With no
+    heavy workers every request shares the light pool. The ``startup``
+    callables run on the light pool when the server starts.
+    """
+    def __init__(self, wsgi, light_workers, heavy_workers, heavy_views,
+                 startup=()):
+        self.wsgi = wsgi
+        self.startup = list(startup)
+        self.light = ThreadPoolExecutor(light_workers)
+        self.heavy = ThreadPoolExecutor(heavy_workers) if heavy_workers else None
+        self.heavy_views = set(heavy_views)
+
+    def is_heavy(self, path):
+        """
+        Whether the view at ``path`` runs on the heavy pool.
+        """
+        if self.heavy is None:
+            return False
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return False
+        return match.view_name in self.heavy_views
+
+    def shutdown(self):
+        for executor in (self.light, self.heavy):
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError('Unsupported scope type {}'.format(scope['type']))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                loop = asyncio.get_event_loop()
+                try:
+                    for function in self.startup:
+                        await loop.run_in_executor(self.light, function)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed',
+                                'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        executor = self.heavy if self.is_heavy(scope['path']) else self.light
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(executor, call_wsgi, self.wsgi,
+                                   build_environ(scope, b''.join(chunks)),
+                                   send, loop)
+
+application = ASGIApplication(wsgi_application,
+                              settings.ASGI_LIGHT_WORKERS,
+                              settings.ASGI_HEAVY_WORKERS,
+                              settings.ASGI_HEAVY_VIEWS,
+                              # Before the first keystroke arrives
+                              startup=[get_autocomplete_index])
@@ -0,0 +1,223 @@
+"""
+Per-route request metrics.
+
+:class:`MetricsMiddleware` times every request and reads the queries it ran
+from the database connections, then adds them to histograms by URL name:
+wall time, time in the database, query count, queries repeated with the same
+SQL and parameters, and response size. :func:`metrics_view` serves the
+histograms in the Prometheus text format.
+
+The histograms are kept in memory and belong to one process, so scrapes of a
+host with several workers each see the worker that answered. Requests slower
+than ``METRICS_SLOW_SECONDS`` are sampled at ``METRICS_SLOW_SAMPLE_RATE`` and
+written, with their slowest and repeated queries, as JSON lines to
+``METRICS_SLOW_LOG``.
+"""
+from bisect import bisect_left
+from collections import Counter
+import datetime
+import json
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+
+# (name, help, bucket upper bounds)
+METRICS = [
+    ('request_seconds', 'Wall time of the request',
+     [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]),
+    ('db_seconds', 'Time spent in database queries',
+     [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]),
+    ('queries', 'Database queries run',
+     [0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500]),
+    ('duplicate_queries', 'Queries run again with the same SQL and parameters',
+     [0, 1, 2, 5, 10, 20, 50, 100]),
+    ('response_bytes', 'Size of the response body',
+     [1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000]),
+]
+
+# Queries kept in each slow request trace
+TRACE_QUERIES = 10
+
+
+class Histogram:
+    """
+    Counts of observed values at or below each of ``buckets``, plus their sum.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    The histograms of every metric by route, and response counts by route
+    and status.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.responses = Counter()
+
+    def observe(self, route, status, values):
+        """
+        Add one request to ``route``. ``values`` maps metric names to the
+        request's values.
+        """
+        with self.lock:
+            histograms = self.routes.get(route)
+            if histograms is None:
+                histograms = self.routes[route] = {
+                    name: Histogram(buckets) for name, _, buckets in METRICS}
+            for name, value in values.items():
+                histograms[name].observe(value)
+            self.responses[route, status] += 1
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            routes = {route: {name: (list(h.counts), h.sum)
+                              for name, h in histograms.items()}
+                      for route, histograms in self.routes.items()}
+            responses = dict(self.responses)
+
+        lines = []
+        for name, help, buckets in METRICS:
+            metric = 'bdo_' + name
+            lines.append('# HELP {} {}'.format(metric, help))
+            lines.append('# TYPE {} histogram'.format(metric))
+            for route in sorted(routes):
+                counts, total = routes[route][name]
+                label = 'route="{}"'.format(escape(route))
+                cumulative = 0
+                for le, count in zip(buckets + ['+Inf'], counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        metric, label, le, cumulative))
+                lines.append('{}_sum{{{}}} {}'.format(metric, label, total))
+                lines.append('{}_count{{{}}} {}'.format(metric, label,
+                                                         cumulative))
+        lines.append('# HELP bdo_responses_total Responses by route and status')
+        lines.append('# TYPE bdo_responses_total counter')
+        for (route, status), count in sorted(responses.items()):
+            lines.append('bdo_responses_total{{route="{}",status="{}"}} {}'
+                         .format(escape(route), status, count))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+_metrics = Metrics()
+_trace_lock = threading.Lock()
+_random = random.Random()
+
+
+def get_metrics():
+    """
+    Return the :class:`Metrics` of this process.
+    """
+    return _metrics
+
+
+def write_trace(trace):
+    """
+    Append ``trace`` as a JSON line to ``METRICS_SLOW_LOG``.
+    """
+    path = settings.METRICS_SLOW_LOG
+    line = json.dumps(trace, sort_keys=True) + '\n'
+    with _trace_lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(line)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Record the metrics of every request. Put it first so its times cover the
+    other middleware too.
+    """
+    def process_request(self, request):
+        # Like CaptureQueriesContext, record queries without DEBUG. Queries
+        # of earlier requests are cleared when each request starts.
+        request._metrics_connections = []
+        for connection in connections.all():
+            request._metrics_connections.append(
+                (connection, connection.force_debug_cursor,
+                 len(connection.queries_log)))
+            connection.force_debug_cursor = True
+        request._metrics_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        if start is None:
+            return response
+        wall = time.perf_counter() - start
+        queries = []
+        for connection, debug, offset in request._metrics_connections:
+            connection.force_debug_cursor = debug
+            queries.extend(list(connection.queries_log)[offset:])
+        db = sum(float(query['time']) for query in queries)
+        duplicates = Counter(query['sql'] for query in queries)
+        duplicate_count = sum(n - 1 for n in duplicates.values())
+        size = 0 if response.streaming else len(response.content)
+
+        match = request.resolver_match
+        route = match.view_name if match is not None else 'unresolved'
+        get_metrics().observe(route, response.status_code, {
+            'request_seconds': wall,
+            'db_seconds': db,
+            'queries': len(queries),
+            'duplicate_queries': duplicate_count,
+            'response_bytes': size,
+        })
+
+        if wall >= settings.METRICS_SLOW_SECONDS and \
+                _random.random() < settings.METRICS_SLOW_SAMPLE_RATE:
+            slowest = sorted(queries, key=lambda q: -float(q['time']))
+            write_trace({
+                'time': datetime.datetime.utcnow().isoformat() + 'Z',
+                'route': route,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'seconds': round(wall, 6),
+                'db_seconds': round(db, 6),
+                'queries': len(queries),
+                'duplicate_queries': duplicate_count,
+                'response_bytes': size,
+                'slowest': [{'sql': q['sql'], 'seconds': float(q['time'])}
+                            for q in slowest[:TRACE_QUERIES]],
+                'repeated': [{'sql': sql, 'count': n}
+                             for sql, n in duplicates.most_common(TRACE_QUERIES)
+                             if n > 1],
+            })
+        return response
+
+
+def metrics_view(request):
+    """
+    The metrics of this process for Prometheus. If ``METRICS_TOKEN`` is set
+    it must be sent as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token):
+        return HttpResponse('Unauthorized', status=401,
+                            content_type='text/plain')
+    return HttpResponse(get_metrics().render(),
+                        content_type='text/plain; version=0.0.4')
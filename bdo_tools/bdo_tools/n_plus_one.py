@@ -0,0 +1,208 @@
+"""
+N+1 query detection for the nodes and crafting pages.
+
+A page that runs a query per row shows it only as the data grows, so
+:func:`render_worlds` renders every page of ``benchmark_views`` against a
+small and a large generated world and records each query with the SQL
+shape, the template line being rendered and the project code that ran it.
+:func:`growth` then lists the query shapes that ran repeatedly and more
+often on the large world, which a page with a fixed number of queries never
+has.
+
+``conftest.py`` turns this into one test per URL name.
+"""
+from collections import Counter, namedtuple
+import os
+import random
+import re
+import threading
+import traceback
+from unittest import mock
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.utils import CursorWrapper
+from django.template.base import Node
+from django.test import Client
+from django.urls import reverse
+
+# Rows per relation grow between the two worlds
+SIZES = [
+    dict(kingdoms=2, territories_per_kingdom=2, nodes=36, materials=20,
+         stations=4, recipes=10, properties_per_node=1, property_depth=1,
+         stations_per_property=1),
+    dict(kingdoms=2, territories_per_kingdom=4, nodes=144, materials=60,
+         stations=8, recipes=40, properties_per_node=3, property_depth=2,
+         stations_per_property=3),
+]
+
+Query = namedtuple('Query', ['shape', 'template', 'code'])
+
+# Placeholder lists, whose length follows the number of rows fetched
+PLACEHOLDERS = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def shape(sql):
+    """
+    The SQL with any list of placeholders collapsed to one.
+    """
+    return PLACEHOLDERS.sub('%s, ...', sql)
+
+
+class QueryRecorder:
+    """
+    Context manager recording a :class:`Query` for every query run on this
+    thread, in ``queries``.
+    """
+    def __init__(self):
+        self.queries = []
+        self.local = threading.local()
+        self.thread = threading.get_ident()
+        self.patchers = []
+
+    def template_line(self):
+        stack = getattr(self.local, 'nodes', None)
+        if not stack:
+            return None
+        node = stack[-1]
+        origin = getattr(node, 'origin', None)
+        token = getattr(node, 'token', None)
+        if origin is None or token is None:
+            return None
+        return '{}:{}'.format(origin.template_name or origin.name, token.lineno)
+
+    def code_line(self):
+        """
+        The innermost frame from this project's code, leaving out tests.
+        """
+        root = settings.BASE_DIR + os.sep
+        for frame in reversed(traceback.extract_stack()):
+            filename = frame[0]
+            if filename.startswith(root) and filename != __file__ and \
+                    os.path.basename(filename) not in ('conftest.py', 'tests.py') and \
+                    os.sep + 'site-packages' + os.sep not in filename:
+                return '{}:{}'.format(os.path.relpath(filename, root), frame[1])
+        return None
+
+    def record(self, sql):
+        if threading.get_ident() == self.thread:
+            self.queries.append(Query(shape=shape(sql),
+                                      template=self.template_line(),
+                                      code=self.code_line()))
+
+    def __enter__(self):
+        recorder = self
+        execute = CursorWrapper.execute
+        executemany = CursorWrapper.executemany
+        render_annotated = Node.render_annotated
+
+        def recorded_execute(self, sql, params=None):
+            recorder.record(sql)
+            return execute(self, sql, params)
+
+        def recorded_executemany(self, sql, param_list):
+            recorder.record(sql)
+            return executemany(self, sql, param_list)
+
+        def tracked_render(self, context):
+            stack = recorder.local.__dict__.setdefault('nodes', [])
+            stack.append(self)
+            try:
+                return render_annotated(self, context)
+            finally:
+                stack.pop()
+
+        self.patchers = [
+            mock.patch.object(CursorWrapper, 'execute', recorded_execute),
+            mock.patch.object(CursorWrapper, 'executemany', recorded_executemany),
+            mock.patch.object(Node, 'render_annotated', tracked_render),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+
+def render_pages():
+    """
+    Render every page of ``benchmark_views`` from cold caches and return
+    ``{(label, url name): [Query]}``.
+    """
+    from nodes.management.commands.benchmark_views import (Command,
+                                                          reset_caches)
+    from nodes.snapshot import save_current_snapshot
+
+    # As the nodes.build_snapshot job would have
+    save_current_snapshot()
+    client = Client()
+    pages = {}
+    for label, name, kwargs, query in Command().get_cases(random.Random(0)):
+        path = reverse(name, kwargs=kwargs)
+        if query:
+            path += '?' + query
+        reset_caches()
+        with QueryRecorder() as recorder:
+            response = client.get(path)
+        if response.status_code >= 500:
+            raise AssertionError('{} returned {}'.format(path,
+                                                         response.status_code))
+        pages[label, name] = recorder.queries
+    return pages
+
+
+def render_worlds(sizes=SIZES):
+    """
+    Render every page against a world of each of ``sizes`` in turn, rolling
+    each world back afterwards, and return the :func:`render_pages` results.
+    """
+    from nodes.generation import generate_world
+    from nodes.management.commands.benchmark_views import reset_caches
+
+    results = []
+    for i, size in enumerate(sizes):
+        with transaction.atomic():
+            generate_world(prefix='N+1 world {}'.format(i), **size)
+            results.append(render_pages())
+            transaction.set_rollback(True)
+    # Nothing cached from the worlds may outlive them
+    reset_caches()
+    return results
+
+
+def growth(small, large):
+    """
+    Return ``(shape, small count, large count, template lines, code lines)``
+    for each query shape that ran more than once in ``large`` and more often
+    than in ``small``, with the lines most common first. A query that runs
+    once only when there is something to fetch is not counted.
+    """
+    small_counts = Counter(query.shape for query in small)
+    large_counts = Counter(query.shape for query in large)
+    grown = []
+    for sql, count in large_counts.most_common():
+        if count > max(1, small_counts[sql]):
+            runs = [query for query in large if query.shape == sql]
+            templates = Counter(q.template for q in runs if q.template)
+            code = Counter(q.code for q in runs if q.code)
+            grown.append((sql, small_counts[sql], count,
+                          [line for line, _ in templates.most_common()],
+                          [line for line, _ in code.most_common()]))
+    return grown
+
+
+def format_growth(label, small, large):
+    """
+    Describe the queries of page ``label`` that grew with the world.
+    """
+    lines = ['{} ran {} queries on the small world and {} on the large '
+             'one:'.format(label, len(small), len(large))]
+    for sql, before, after, templates, code in growth(small, large):
+        lines.append('  {} -> {} times: {}'.format(before, after, sql))
+        if templates:
+            lines.append('    template: {}'.format(', '.join(templates[:3])))
+        if code:
+            lines.append('    code: {}'.format(', '.join(code[:3])))
+    return '\n'.join(lines)
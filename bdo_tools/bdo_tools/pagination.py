@@ -0,0 +1,152 @@
+"""
+Keyset (seek) pagination for list views.
+
+Offset pagination makes the database count past every earlier row, so deep
+pages get slower as the tables grow. Keyset pagination remembers the last row
+shown and asks for the rows after it, which an index on the ordering columns
+answers in the same time for every page.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .query import InvalidQuery, InvalidQueryMixin
+
+
+def encode_cursor(values):
+    """
+    Encode a list of ordering values as an opaque, URL safe cursor.
+    """
+    data = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by :func:`encode_cursor`. Raises ``ValueError`` if
+    it isn't one.
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding).decode())
+    except (TypeError, ValueError):
+        raise ValueError('Invalid page cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid page cursor')
+    return values
+
+
+class KeysetPaginationMixin(InvalidQueryMixin):
+    """
+    Paginate a ``ListView`` by seeking past the last row of the previous page.
+
+    The page is chosen with the ``after`` or ``before`` cursor query
+    parameters, the ordering with ``order`` (one of ``orderings``) and the page
+    size with ``size``. Rows are always ordered by ``id`` last so that the
+    ordering, and therefore every cursor, is stable. Each ordering needs a
+    matching ``(field, id)`` index to keep deep pages cheap. Bad parameters
+    get a 400.
+    """
+    page_size = 50
+    max_page_size = 500
+    orderings = ('id', 'name')
+
+    def get_ordering_field(self):
+        order = self.request.GET.get('order', self.orderings[0])
+        if order not in self.orderings:
+            raise InvalidQuery({'order': ['Must be one of {}'.format(
+                ', '.join(self.orderings))]})
+        return order
+
+    def get_page_size(self):
+        try:
+            size = int(self.request.GET.get('size', self.page_size))
+        except ValueError:
+            raise InvalidQuery({'size': ['Enter a whole number.']})
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering_fields(self):
+        field = self.get_ordering_field()
+        return [field] if field == 'id' else [field, 'id']
+
+    def seek(self, queryset, fields, values, lookup):
+        """
+        Filter ``queryset`` to rows strictly after (``gt``) or before (``lt``)
+        the row with the ordering ``values``. Raises ``ValueError`` if they
+        don't fit the ordering.
+        """
+        if len(values) != len(fields) or not all(
+                value is None or isinstance(value, (str, int, float))
+                for value in values):
+            raise ValueError('Invalid page cursor')
+        try:
+            values = [queryset.model._meta.get_field(field).to_python(value)
+                      for field, value in zip(fields, values)]
+            condition = Q()
+            for i, field in enumerate(fields):
+                equal = {f: v for f, v in zip(fields[:i], values[:i])}
+                past = {'{}__{}'.format(field, lookup): values[i]}
+                condition |= Q(**equal) & Q(**past)
+            return queryset.filter(condition)
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            raise ValueError('Invalid page cursor')
+
+    def seek_cursor(self, queryset, fields, param, lookup):
+        """
+        :meth:`seek` past the cursor in query parameter ``param``.
+        """
+        try:
+            values = decode_cursor(self.request.GET[param])
+            return self.seek(queryset, fields, values, lookup)
+        except ValueError as e:
+            raise InvalidQuery({param: [str(e)]})
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_ordering_fields()
+        size = self.get_page_size()
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        if before:
+            queryset = self.seek_cursor(queryset, fields, 'before', 'lt')
+            queryset = queryset.order_by(*['-' + f for f in fields])
+        else:
+            if after:
+                queryset = self.seek_cursor(queryset, fields, 'after', 'gt')
+            queryset = queryset.order_by(*fields)
+        # One extra row tells us whether there is another page
+        return queryset[:size + 1]
+
+    def get_page_query(self, **params):
+        query = self.request.GET.copy()
+        for key in ('after', 'before'):
+            query.pop(key, None)
+        query.update(params)
+        return query.urlencode()
+
+    def get_context_data(self, **kwargs):
+        fields = self.get_ordering_fields()
+        size = self.get_page_size()
+        rows = list(self.object_list)
+        more = len(rows) > size
+        rows = rows[:size]
+        backwards = bool(self.request.GET.get('before'))
+        if backwards:
+            rows.reverse()
+        has_next = more if not backwards else True
+        has_previous = more if backwards else bool(self.request.GET.get('after'))
+
+        def cursor(row):
+            return encode_cursor([getattr(row, field) for field in fields])
+
+        kwargs['object_list'] = rows
+        kwargs['page_size'] = size
+        kwargs['next_page_query'] = (self.get_page_query(after=cursor(rows[-1]))
+                                     if rows and has_next else None)
+        kwargs['previous_page_query'] = (
+            self.get_page_query(before=cursor(rows[0]))
+            if rows and has_previous else None)
+        kwargs['first_page_query'] = self.get_page_query()
+        return super().get_context_data(**kwargs)
@@ -0,0 +1,31 @@
+"""
+Bad query parameters of the HTML views.
+
+Malformed filters, cursors or page sizes are ordinary client mistakes, so
+views answer them with a 400 listing what was wrong, like the JSON views do,
+rather than logging a security event.
+"""
+from django.http import JsonResponse
+
+
+class InvalidQuery(Exception):
+    """
+    Query parameters a view can't use. ``errors`` maps each parameter to a
+    list of messages, like ``Form.errors``.
+    """
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class InvalidQueryMixin:
+    """
+    Answer an :class:`InvalidQuery` raised while handling a request with a
+    400 ``JsonResponse``.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except InvalidQuery as e:
+            return JsonResponse({'error': 'Invalid query parameters',
+                                 'errors': e.errors}, status=400)
@@ -52,12 +52,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    # 'rest_framework',
+    'rest_framework',
     'nodes.apps.NodesConfig',
     'crafting.apps.CraftingConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE_CLASSES = [
+    'bdo_tools.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -147,6 +149,63 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static')
 ]
 
+# Caches
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'detail_pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'detail-pages',
+    },
+}
+
+# Rendered detail pages, see nodes.page_cache
+DETAIL_PAGE_CACHE = 'detail_pages'
+DETAIL_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Seconds the facet counts of the node and property lists are cached, see
+# nodes.facets
+FACET_CACHE_TIMEOUT = int(os.environ.get('BDO_FACET_CACHE_TIMEOUT', 60))
+
+# Memory-mapped hub distance matrices shared by the workers on a host, see
+# nodes.distances
+HUB_DISTANCE_DIR = os.environ.get('BDO_HUB_DISTANCE_DIR',
+                                  '/tmp/bdo_tools/hub_distances')
+
+# Gzipped snapshots of the whole world served by the workers on a host, see
+# nodes.snapshot
+SNAPSHOT_DIR = os.environ.get('BDO_SNAPSHOT_DIR', '/tmp/bdo_tools/snapshots')
+
+# Seconds between checks for data changed by other processes, see
+# bdo_tools.shared_cache
+SHARED_CACHE_RECHECK_SECONDS = float(
+    os.environ.get('BDO_SHARED_CACHE_RECHECK_SECONDS', 5))
+
+# Thread pools of the ASGI entry point, see bdo_tools.asgi. Views named in
+# ASGI_HEAVY_VIEWS get their own pool so they cannot hold up the others.
+ASGI_LIGHT_WORKERS = int(os.environ.get('BDO_ASGI_LIGHT_WORKERS', 8))
+ASGI_HEAVY_WORKERS = int(os.environ.get('BDO_ASGI_HEAVY_WORKERS', 2))
+ASGI_HEAVY_VIEWS = [
+    'nodes:plan',
+    'nodes:snapshot',
+    'nodes:nodes:path',
+    'nodes:nodes:route',
+    'crafting:materials:bill',
+    'crafting:materials:production',
+]
+
+# Per-route request metrics served at /metrics/, see bdo_tools.metrics. Set
+# BDO_METRICS_TOKEN to require it as a bearer token.
+METRICS_TOKEN = os.environ.get('BDO_METRICS_TOKEN')
+METRICS_SLOW_SECONDS = float(os.environ.get('BDO_METRICS_SLOW_SECONDS', 1.0))
+METRICS_SLOW_SAMPLE_RATE = float(os.environ.get('BDO_METRICS_SLOW_SAMPLE_RATE',
+                                                0.1))
+METRICS_SLOW_LOG = os.environ.get('BDO_METRICS_SLOW_LOG',
+                                  '/tmp/bdo_tools/slow_requests.log')
+
 # Django Rest Framework
 # http://www.django-rest-framework.org/
 
@@ -1,6 +1,13 @@
 import os
 
-from .base import BASE_DIR
+from .base import BASE_DIR, CACHES
 from .base import *  # NOQA
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Share rendered detail pages, and their invalidation, between all of the
+# gunicorn workers on a host
+CACHES['detail_pages'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.environ.get('BDO_PAGE_CACHE_DIR', '/tmp/bdo_tools/detail_pages'),
+}
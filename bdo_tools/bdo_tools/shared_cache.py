@@ -0,0 +1,99 @@
+"""
+Objects built from the database once and shared by the threads of a process.
+
+Every worker process keeps its own copy of each :class:`SharedCache`. Signal
+handlers drop it when the process itself edits the data, but edits made by
+other processes, such as other workers, ``import_world`` or ``run_jobs``,
+send no signal here. So a cache also reads the :func:`data_version` of the
+models its object is built from at most every
+``SHARED_CACHE_RECHECK_SECONDS`` and rebuilds the object when it changed.
+
+The version is the row count and latest ``modified`` of each model, read
+with one query, so any insert, delete or save changes it. Writes that leave
+``modified`` alone, like ``QuerySet.update()`` without it, are not noticed.
+"""
+import hashlib
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+
+
+def table_stats(labels):
+    """
+    Return ``(count, latest modified)`` of each model in ``labels`` from one
+    query. ``modified`` is returned as the database gives it.
+    """
+    quote = connection.ops.quote_name
+    selects = []
+    for label in labels:
+        table = quote(apps.get_model(label)._meta.db_table)
+        selects.append('(SELECT COUNT(*) FROM {0}), '
+                       '(SELECT MAX({1}) FROM {0})'.format(table,
+                                                          quote('modified')))
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT {}'.format(', '.join(selects)))
+        row = cursor.fetchone()
+    return list(zip(row[::2], row[1::2]))
+
+
+def data_version(labels):
+    """
+    A hash of the :func:`table_stats` of ``labels``.
+    """
+    return hashlib.sha1(repr(table_stats(labels)).encode()).hexdigest()
+
+
+class SharedCache:
+    """
+    The object returned by ``build()``, rebuilt when the :func:`data_version`
+    of ``labels`` changes.
+    """
+    def __init__(self, build, labels):
+        self.build = build
+        self.labels = labels
+        self.lock = threading.Lock()
+        # (object, version, monotonic time of the last check)
+        self.entry = None
+
+    def is_fresh(self, entry):
+        return entry is not None and time.monotonic() - entry[2] < \
+            settings.SHARED_CACHE_RECHECK_SECONDS
+
+    def get(self):
+        """
+        Return the object, building it if needed and rebuilding it if the data
+        changed since the last check.
+        """
+        entry = self.entry
+        if self.is_fresh(entry):
+            return entry[0]
+        with self.lock:
+            entry = self.entry
+            if self.is_fresh(entry):
+                return entry[0]
+            # Read before building so that changes made meanwhile show up in
+            # the next check
+            version = data_version(self.labels)
+            if entry is None or entry[1] != version:
+                entry = (self.build(), version, time.monotonic())
+            else:
+                entry = (entry[0], version, time.monotonic())
+            self.entry = entry
+            return entry[0]
+
+    def peek(self):
+        """
+        Return the object if it is built, without checking the version.
+        """
+        entry = self.entry
+        return entry[0] if entry is not None else None
+
+    def invalidate(self):
+        """
+        Drop the object so the next :meth:`get` rebuilds it.
+        """
+        with self.lock:
+            self.entry = None
@@ -0,0 +1,46 @@
+from django.template import Context, Template
+
+from bdo_tools.n_plus_one import QueryRecorder, format_growth, growth
+from nodes.models import Kingdom, Territory
+
+
+def test_no_n_plus_one(n_plus_one_pages, n_plus_one_url_name):
+    """
+    No page should run more queries because the world has more rows.
+    """
+    small, large = n_plus_one_pages
+    failures = []
+    checked = 0
+    for (label, name), queries in sorted(large.items()):
+        if name != n_plus_one_url_name:
+            continue
+        checked += 1
+        before = small[label, name]
+        if growth(before, queries):
+            failures.append(format_growth(label, before, queries))
+    assert checked, 'No page rendered for {}'.format(n_plus_one_url_name)
+    assert not failures, '\n\n'.join(failures)
+
+
+def test_detects_per_row_queries(db):
+    """
+    The check itself should point at a template query run for every row.
+    """
+    template = Template('{% for territory in territories %}\n'
+                        '{{ territory.kingdom.name }}\n'
+                        '{% endfor %}')
+
+    def render():
+        with QueryRecorder() as recorder:
+            template.render(Context({'territories': Territory.objects.all()}))
+        return recorder.queries
+
+    kingdom = Kingdom.objects.create(name='Test Kingdom')
+    Territory.objects.create(name='Territory 0', kingdom=kingdom)
+    small = render()
+    for i in range(1, 4):
+        Territory.objects.create(name='Territory {}'.format(i), kingdom=kingdom)
+    (sql, before, after, templates, _), = growth(small, render())
+    assert 'FROM "nodes_kingdom"' in sql
+    assert (before, after) == (1, 4)
+    assert templates == ['<unknown source>:2']
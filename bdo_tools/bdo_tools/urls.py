@@ -18,6 +18,21 @@ from django.conf.urls import include, url
 from django.contrib import admin
 from django.views.generic import RedirectView
 from django.urls import reverse_lazy
+from rest_framework import routers
+
+from bdo_tools.metrics import metrics_view
+from crafting import api as crafting_api
+from nodes import api as nodes_api
+
+router = routers.DefaultRouter()
+router.register(r'kingdoms', nodes_api.KingdomViewSet)
+router.register(r'territories', nodes_api.TerritoryViewSet)
+router.register(r'nodes', nodes_api.NodeViewSet)
+router.register(r'resources', nodes_api.ResourceViewSet)
+router.register(r'properties', nodes_api.PropertyViewSet)
+router.register(r'property-stations', nodes_api.PropertyStationViewSet)
+router.register(r'materials', crafting_api.MaterialViewSet)
+router.register(r'stations', crafting_api.StationViewSet)
 
 urlpatterns = [
     url(r'^grappelli/', include('grappelli.urls')),  # grappelli URLS
@@ -26,7 +41,9 @@ urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^crafting/', include('crafting.urls', namespace='crafting')),
     url(r'^nodes/', include('nodes.urls', namespace='nodes')),
-    # url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    url(r'^api/', include(router.urls)),
+    url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    url(r'^metrics/$', metrics_view, name='metrics'),
     url(r'^$', RedirectView.as_view(pattern_name='nodes:main'), name='main'),
 ]
 
@@ -0,0 +1,50 @@
+"""
+Pytest plugin running the N+1 query check of :mod:`bdo_tools.n_plus_one`.
+
+Tests asking for ``n_plus_one_pages`` get the queries of every page on both
+generated worlds. They are rendered once, inside the first such test's
+database transaction, and reused by the rest. Deselect them with
+``-k "not n_plus_one"``.
+
+Hub distance matrices and snapshots saved by the tests go to a temporary
+directory removed at the end of the session.
+"""
+import os
+import tempfile
+
+import pytest
+
+
+def pytest_generate_tests(metafunc):
+    if 'n_plus_one_url_name' in metafunc.fixturenames:
+        from crafting import urls as crafting_urls
+        from nodes import urls as nodes_urls
+        from nodes.management.commands.benchmark_views import url_names
+
+        names = list(url_names(nodes_urls.urlpatterns, 'nodes:')) + \
+            list(url_names(crafting_urls.urlpatterns, 'crafting:'))
+        metafunc.parametrize('n_plus_one_url_name', names)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def saved_data_dir():
+    from django.test import override_settings
+
+    with tempfile.TemporaryDirectory() as directory, \
+            override_settings(
+                HUB_DISTANCE_DIR=os.path.join(directory, 'hub_distances'),
+                SNAPSHOT_DIR=os.path.join(directory, 'snapshots')):
+        yield directory
+
+
+@pytest.fixture
+def n_plus_one_pages(request, db):
+    """
+    ``(small, large)`` dicts of ``{(label, url name): [Query]}``.
+    """
+    pages = getattr(request.config, '_n_plus_one_pages', None)
+    if pages is None:
+        from bdo_tools.n_plus_one import render_worlds
+
+        pages = request.config._n_plus_one_pages = render_worlds()
+    return pages
@@ -2,6 +2,42 @@ from django.contrib import admin
 
 from . import models
 
+
+#
+# Inlines
+#
+class RecipeInputInline(admin.TabularInline):
+    model = models.RecipeInput
+    extra = 0
+    min_num = 1
+
+
+class RecipeOutputInline(admin.TabularInline):
+    model = models.RecipeOutput
+    extra = 0
+    min_num = 1
+
+
+#
+# Model Admins
+#
+class RecipeAdmin(admin.ModelAdmin):
+    # List Options
+    list_display = ('name', 'station')
+    list_filter = ('station',)
+    search_fields = ('name',)
+    ordering = ('name',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('station')
+
+    # Detail Options
+    inlines = [RecipeInputInline, RecipeOutputInline]
+
+
+#
+# Admin Setup
+#
 admin.site.register(models.Material)
 admin.site.register(models.Station)
-admin.site.register(models.Recipe)
+admin.site.register(models.Recipe, RecipeAdmin)
@@ -0,0 +1,14 @@
+from bdo_tools.api import ReadOnlyBulkViewSet
+from . import models, serializers
+
+
+class MaterialViewSet(ReadOnlyBulkViewSet):
+    queryset = models.Material.objects.all()
+    serializer_class = serializers.MaterialSerializer
+    prefetch_related_fields = {'resources': ['resources']}
+
+
+class StationViewSet(ReadOnlyBulkViewSet):
+    queryset = models.Station.objects.all()
+    serializer_class = serializers.StationSerializer
+    prefetch_related_fields = {'properties': ['properties']}
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CraftingConfig(AppConfig):
     name = 'crafting'
+
+    def ready(self):
+        from . import signals  # NOQA
@@ -0,0 +1,148 @@
+"""
+Bills of materials for crafted :model:`crafting.Material`.
+
+Working out everything a craft needs means following recipe inputs down to
+the raw materials, which the ORM would answer with a query per level.
+:class:`RecipeGraph` loads every recipe with three queries and expands bills
+in memory. The bill for one unit of each material is remembered, so a
+material's subtree is only expanded once and later bills are a sum of cached
+entries.
+
+A material is made with the first recipe, by id, that outputs it and is raw
+when no recipe does.
+"""
+from collections import namedtuple
+from fractions import Fraction
+
+from bdo_tools.shared_cache import SharedCache
+
+Bill = namedtuple('Bill', ['raw', 'crafts'])
+
+
+class RecipeCycleError(ValueError):
+    """Raised when a material is needed, directly or not, to craft itself"""
+
+    def __init__(self, material_ids):
+        self.material_ids = material_ids
+        super().__init__('Recipe cycle through materials {}'.format(
+            ' -> '.join(str(m) for m in material_ids)))
+
+
+class RecipeGraph:
+    """
+    The recipe network as a directed graph from each material to the inputs
+    of the recipe that makes it.
+
+    ``recipes`` maps recipe ids to ``(inputs, outputs)``, each a dict of
+    material id to quantity. ``makers`` maps each material to the recipes
+    that output it, in id order. ``stations`` maps recipe ids to the
+    ``(station_id, station_level)`` they are crafted at.
+    """
+    def __init__(self, recipes, stations=None):
+        """
+        ``recipes`` is an iterable of ``(recipe_id, inputs, outputs)``.
+        """
+        self.recipes = {}
+        self.makers = {}
+        self.stations = dict(stations or {})
+        for recipe_id, inputs, outputs in sorted(recipes,
+                                                 key=lambda r: r[0]):
+            self.recipes[recipe_id] = (dict(inputs), dict(outputs))
+            for material_id, quantity in outputs.items():
+                if quantity:
+                    self.makers.setdefault(material_id, []).append(recipe_id)
+        self._unit_bills = {}
+
+    @classmethod
+    def from_db(cls):
+        """
+        Build the graph with one query for the recipes and one for each of
+        their inputs and outputs.
+        """
+        from .models import Recipe, RecipeInput, RecipeOutput
+
+        recipes = {}
+        stations = {}
+        rows = Recipe.objects.values_list('id', 'station_id', 'station_level')
+        for recipe_id, station_id, station_level in rows.iterator():
+            recipes[recipe_id] = ({}, {})
+            stations[recipe_id] = (station_id, station_level)
+        for side, model in ((0, RecipeInput), (1, RecipeOutput)):
+            rows = model.objects.values_list('recipe_id', 'material_id',
+                                             'quantity')
+            for recipe_id, material_id, quantity in rows.iterator():
+                recipes[recipe_id][side][material_id] = quantity
+        return cls(((recipe_id, inputs, outputs)
+                    for recipe_id, (inputs, outputs) in recipes.items()),
+                   stations)
+
+    def recipe_for(self, material_id):
+        """
+        The id of the recipe used to make ``material_id``, or ``None`` if it
+        is raw.
+        """
+        makers = self.makers.get(material_id)
+        return makers[0] if makers else None
+
+    def unit_bill(self, material_id, _path=()):
+        """
+        Return the :class:`Bill` for one unit of ``material_id``.
+
+        ``raw`` maps raw material ids and ``crafts`` recipe ids to
+        :class:`~fractions.Fraction` amounts. Raises
+        :class:`RecipeCycleError` if the material needs itself.
+        """
+        bill = self._unit_bills.get(material_id)
+        if bill is not None:
+            return bill
+        if material_id in _path:
+            cycle = _path[_path.index(material_id):] + (material_id,)
+            raise RecipeCycleError(list(cycle))
+
+        recipe_id = self.recipe_for(material_id)
+        if recipe_id is None:
+            bill = Bill(raw={material_id: Fraction(1)}, crafts={})
+        else:
+            inputs, outputs = self.recipes[recipe_id]
+            crafts = Fraction(1, outputs[material_id])
+            raw = {}
+            needed = {recipe_id: crafts}
+            for input_id, quantity in inputs.items():
+                sub = self.unit_bill(input_id, _path + (material_id,))
+                scale = crafts * quantity
+                for key, amount in sub.raw.items():
+                    raw[key] = raw.get(key, 0) + amount * scale
+                for key, amount in sub.crafts.items():
+                    needed[key] = needed.get(key, 0) + amount * scale
+            bill = Bill(raw=raw, crafts=needed)
+        self._unit_bills[material_id] = bill
+        return bill
+
+    def bill(self, material_id, quantity=1):
+        """
+        Return the :class:`Bill` for ``quantity`` of ``material_id``.
+        """
+        unit = self.unit_bill(material_id)
+        return Bill(raw={k: v * quantity for k, v in unit.raw.items()},
+                    crafts={k: v * quantity for k, v in unit.crafts.items()})
+
+
+_graph = SharedCache(RecipeGraph.from_db, ['crafting.Recipe',
+                                           'crafting.RecipeInput',
+                                           'crafting.RecipeOutput'])
+
+
+def get_recipe_graph():
+    """
+    Return the shared :class:`RecipeGraph`, building it if needed and
+    rebuilding it if another process changed the recipes since the last
+    check.
+    """
+    return _graph.get()
+
+
+def invalidate_recipe_graph():
+    """
+    Drop the shared :class:`RecipeGraph` so the next request rebuilds it.
+    """
+    _graph.invalidate()
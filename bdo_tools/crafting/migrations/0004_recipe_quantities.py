@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:50
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crafting', '0003_unique_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeInput',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_inputs', to='crafting.Material')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeOutput',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_outputs', to='crafting.Material')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to='crafting.Station'),
+        ),
+        migrations.AddField(
+            model_name='recipeoutput',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outputs', to='crafting.Recipe'),
+        ),
+        migrations.AddField(
+            model_name='recipeinput',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inputs', to='crafting.Recipe'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='input_materials',
+            field=models.ManyToManyField(related_name='input_recipes', through='crafting.RecipeInput', to='crafting.Material'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='output_materials',
+            field=models.ManyToManyField(related_name='output_recipes', through='crafting.RecipeOutput', to='crafting.Material'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='recipeoutput',
+            unique_together=set([('recipe', 'material')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='recipeinput',
+            unique_together=set([('recipe', 'material')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crafting', '0004_recipe_quantities'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='station_level',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 
 
@@ -8,7 +9,7 @@ class Material(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
 
     # There should be some link to whether this is gatherable by the player
     # directly. In fact, is there a gathered resource that the player is unable
@@ -17,6 +18,10 @@ class Material(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        # Keyset pagination seeks on (name, id)
+        indexes = [models.Index(fields=['name', 'id'])]
+
 
 class Station(models.Model):
     """
@@ -25,27 +30,87 @@ class Station(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [models.Index(fields=['name', 'id'])]
+
 
 class Recipe(models.Model):
     """
     A recipe takes a set of :model:`crafting.Material` that is used at a
     :model:`crafting.Station` and produces a set of :model:`crafting.Material`.
+    The quantities are given by :model:`crafting.RecipeInput` and
+    :model:`crafting.RecipeOutput`.
     """
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
-
     name = models.CharField(max_length=100)
-    # input_materials = models.ManyToManyField(Material,
-    #                                          related_name='input_recipes')
-    # station = models.ForeignKey(Station,
-    #                             related_name='recipes')
-    # output_materials = models.ManyToManyField(Material,
-    #                                           related_name='output_recipes')
+    input_materials = models.ManyToManyField(Material,
+                                             through='RecipeInput',
+                                             related_name='input_recipes')
+    station = models.ForeignKey(Station,
+                                on_delete=models.CASCADE,
+                                null=True,
+                                blank=True,
+                                related_name='recipes')
+    # The lowest PropertyStation max_level that can craft this
+    station_level = models.PositiveIntegerField(default=1)
+    output_materials = models.ManyToManyField(Material,
+                                              through='RecipeOutput',
+                                              related_name='output_recipes')
 
     def __str__(self):
         return self.name
+
+    class Meta:
+        indexes = [models.Index(fields=['name', 'id'])]
+
+
+class RecipeInput(models.Model):
+    """
+    How many of a :model:`crafting.Material` one craft of a
+    :model:`crafting.Recipe` uses.
+    """
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='inputs')
+    material = models.ForeignKey(Material,
+                                 on_delete=models.CASCADE,
+                                 related_name='recipe_inputs')
+    quantity = models.PositiveIntegerField(default=1,
+                                           validators=[MinValueValidator(1)])
+
+    def __str__(self):
+        return '{} x {}'.format(self.quantity, self.material)
+
+    class Meta:
+        unique_together = ('recipe', 'material')
+
+
+class RecipeOutput(models.Model):
+    """
+    How many of a :model:`crafting.Material` one craft of a
+    :model:`crafting.Recipe` makes.
+    """
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='outputs')
+    material = models.ForeignKey(Material,
+                                 on_delete=models.CASCADE,
+                                 related_name='recipe_outputs')
+    quantity = models.PositiveIntegerField(default=1,
+                                           validators=[MinValueValidator(1)])
+
+    def __str__(self):
+        return '{} x {}'.format(self.quantity, self.material)
+
+    class Meta:
+        unique_together = ('recipe', 'material')
@@ -0,0 +1,270 @@
+"""
+Production plans for crafting a :model:`crafting.Material`.
+
+Crafting needs a :model:`nodes.Property` with each recipe's station at a high
+enough level and a :model:`nodes.Resource` for each raw material, and every
+node used must be connected to a hub. :func:`plan_production` picks the
+properties and resources that minimise the resource contribution costs plus
+the cost of connecting their nodes, as found by
+:func:`nodes.planner.steiner_tree`.
+
+Candidates come from a :class:`ProductionIndex` of properties by station and
+resources by material, loaded with two queries. The choice is a branch and
+bound search: each level picks a property or resource, partial plans are
+pruned when a lower bound on their cost is no better than the best plan found
+so far, and the best plan is returned when the time budget runs out.
+"""
+from collections import namedtuple
+import time
+
+from bdo_tools.shared_cache import SharedCache
+from nodes.graph import get_graph
+from nodes.planner import PlanningError, steiner_tree
+from .bom import RecipeCycleError, get_recipe_graph
+
+ProductionPlan = namedtuple('ProductionPlan', ['cost', 'node_cost',
+                                               'resource_cost', 'nodes',
+                                               'properties', 'resources',
+                                               'exhaustive'])
+
+# One way to meet a requirement: ``ref`` is the property or resource id
+Option = namedtuple('Option', ['node', 'cost', 'ref'])
+
+
+class ProductionIndex:
+    """
+    Where each station and raw material can be found.
+
+    ``stations`` maps station ids to ``(max_level, property_id, node_id)``
+    from the highest level down and ``materials`` maps material ids to
+    ``(contribution_cost, resource_id, node_id)`` from the cheapest up.
+    """
+    def __init__(self, property_stations, resources):
+        """
+        ``property_stations`` is an iterable of ``(station_id, max_level,
+        property_id, node_id)`` and ``resources`` one of ``(material_id,
+        contribution_cost, resource_id, node_id)``.
+        """
+        self.stations = {}
+        for station_id, max_level, property_id, node_id in property_stations:
+            self.stations.setdefault(station_id, []).append(
+                (max_level, property_id, node_id))
+        for candidates in self.stations.values():
+            candidates.sort(key=lambda c: (-c[0], c[1]))
+
+        self.materials = {}
+        for material_id, cost, resource_id, node_id in resources:
+            self.materials.setdefault(material_id, []).append(
+                (cost, resource_id, node_id))
+        for candidates in self.materials.values():
+            candidates.sort()
+
+    @classmethod
+    def from_db(cls):
+        from nodes.models import Resource, StationAvailability
+
+        property_stations = StationAvailability.objects.values_list(
+            'station_id', 'max_level', 'property_id', 'node_id')
+        resources = Resource.objects.values_list(
+            'material_id', 'contribution_cost', 'id', 'node_id')
+        return cls(property_stations.iterator(), resources.iterator())
+
+    def properties_for(self, station_id, level):
+        """
+        Return ``(property_id, node_id)`` for every property with
+        ``station_id`` at ``level`` or above.
+        """
+        candidates = []
+        for max_level, property_id, node_id in self.stations.get(station_id, ()):
+            if max_level < level:
+                break
+            candidates.append((property_id, node_id))
+        return candidates
+
+    def resources_for(self, material_id):
+        """
+        Return ``(resource_id, node_id, contribution_cost)`` for every
+        resource of ``material_id``, cheapest first.
+        """
+        return [(resource_id, node_id, cost) for cost, resource_id, node_id
+                in self.materials.get(material_id, ())]
+
+
+# The station availability rollup has no timestamps; it changes with the
+# rows it is built from
+_index = SharedCache(ProductionIndex.from_db, ['nodes.Kingdom',
+                                               'nodes.Territory',
+                                               'nodes.Node',
+                                               'nodes.Resource',
+                                               'nodes.Property',
+                                               'nodes.PropertyStation',
+                                               'crafting.Station'])
+
+
+def get_production_index():
+    """
+    Return the shared :class:`ProductionIndex`, building it if needed and
+    rebuilding it if another process changed the properties or resources
+    since the last check.
+    """
+    return _index.get()
+
+
+def invalidate_production_index():
+    """
+    Drop the shared :class:`ProductionIndex` so the next request rebuilds it.
+    """
+    _index.invalidate()
+
+
+def get_requirements(bill, recipe_graph, index, graph):
+    """
+    Return ``(kind, key, options)`` for each property and resource the
+    ``bill`` needs. Options are reachable, one per node, and ordered by their
+    cost plus the cost of reaching their node from a hub. Options no cheaper
+    than one on a hub are left out.
+    """
+    dist, _ = graph.hub_paths()
+
+    def collect(candidates):
+        best = {}
+        for ref, node_id, cost in candidates:
+            i = graph.index.get(node_id)
+            if i is None or dist[i] is None:
+                continue
+            if i not in best or cost < best[i].cost:
+                best[i] = Option(node=i, cost=cost, ref=ref)
+        # Hubs are always in the tree, so the cheapest option on a hub beats
+        # every option that costs as much
+        hub_costs = [o.cost for o in best.values() if graph.is_hub[o.node]]
+        if hub_costs:
+            cheapest = min(hub_costs)
+            hub = min(o for o in best.values()
+                      if graph.is_hub[o.node] and o.cost == cheapest)
+            best = {o.node: o for o in best.values() if o.cost < cheapest}
+            best[hub.node] = hub
+        return sorted(best.values(),
+                      key=lambda o: (o.cost + dist[o.node], o.ref))
+
+    requirements = []
+    stations = {recipe_graph.stations.get(recipe_id, (None, None))
+                for recipe_id in bill.crafts}
+    for station_id, level in sorted(s for s in stations if s[0] is not None):
+        options = collect((property_id, node_id, 0) for property_id, node_id
+                          in index.properties_for(station_id, level))
+        if not options:
+            raise PlanningError('No reachable property has station {} at '
+                                'level {}'.format(station_id, level))
+        requirements.append(('station', (station_id, level), options))
+    for material_id in sorted(bill.raw):
+        options = collect(index.resources_for(material_id))
+        if not options:
+            raise PlanningError('No reachable resource supplies material '
+                                '{}'.format(material_id))
+        requirements.append(('material', material_id, options))
+    return requirements
+
+
+def plan_production(material_id, quantity=1, time_budget=1.0, graph=None,
+                    recipe_graph=None, index=None):
+    """
+    Return the cheapest :class:`ProductionPlan` found within ``time_budget``
+    seconds for crafting ``quantity`` of ``material_id``.
+
+    ``properties`` maps ``(station_id, level)`` and ``resources`` raw
+    material ids to the chosen property and resource ids. ``exhaustive`` is
+    ``True`` if the search tried every choice of properties and resources
+    within the time budget. Node costs come from the approximate
+    :func:`~nodes.planner.steiner_tree`, so even then a cheaper plan may
+    exist. Raises :class:`~nodes.planner.PlanningError` if a station or raw
+    material is nowhere to be found.
+    """
+    if graph is None:
+        graph = get_graph()
+    if recipe_graph is None:
+        recipe_graph = get_recipe_graph()
+    if index is None:
+        index = get_production_index()
+    try:
+        bill = recipe_graph.bill(material_id, quantity)
+    except RecipeCycleError as e:
+        raise PlanningError(str(e))
+    requirements = get_requirements(bill, recipe_graph, index, graph)
+
+    dist, _ = graph.hub_paths()
+    count = len(requirements)
+    trees = {}
+
+    def evaluate(chosen):
+        nodes = frozenset(option.node for option in chosen)
+        if nodes not in trees:
+            trees[nodes] = steiner_tree(graph, [graph.ids[i] for i in nodes])
+        node_cost, node_ids = trees[nodes]
+        resource_cost = sum(option.cost for option in chosen)
+        return node_cost + resource_cost, node_cost, resource_cost, node_ids
+
+    # Start from the option nearest a hub for every requirement
+    best_chosen = [options[0] for _, _, options in requirements]
+    best = evaluate(best_chosen)
+    deadline = time.perf_counter() + time_budget
+    exhaustive = True
+    chosen = []
+
+    # Any plan using an option costs at least the option plus the path to
+    # its node, so options already no cheaper than the first plan are dropped
+    candidates = [[o for o in options if o.cost + dist[o.node] < best[0]]
+                  for _, _, options in requirements]
+    # Fewest options first keeps the search tree narrow near the root
+    order = sorted(range(count), key=lambda k: len(candidates[k]))
+    requirements = [requirements[k] for k in order]
+    candidates = [candidates[k] for k in order]
+    best_chosen = [best_chosen[k] for k in order]
+    # Whatever is chosen for the rest costs at least its cheapest option, and
+    # the tree must reach the option nearest a hub for each requirement
+    rest_cost = [0] * (count + 1)
+    rest_reach = [0] * (count + 1)
+    for k in range(count - 1, -1, -1):
+        options = candidates[k] or requirements[k][2]
+        rest_cost[k] = rest_cost[k + 1] + min(o.cost for o in options)
+        rest_reach[k] = max(rest_reach[k + 1],
+                            min(dist[o.node] for o in options))
+
+    def search(k, nodes, cost, reach):
+        nonlocal best, best_chosen, exhaustive
+        if time.perf_counter() > deadline:
+            exhaustive = False
+            return
+        if cost + rest_cost[k] + max(reach, rest_reach[k]) >= best[0]:
+            return
+        if k == count:
+            result = evaluate(chosen)
+            if result[0] < best[0]:
+                best, best_chosen = result, list(chosen)
+            return
+        options = candidates[k]
+        # Nodes already in the plan add nothing to connect, so try them first
+        for option in sorted(options, key=lambda o: o.node not in nodes):
+            chosen.append(option)
+            search(k + 1, nodes | {option.node}, cost + option.cost,
+                   max(reach, dist[option.node]))
+            chosen.pop()
+            if not exhaustive:
+                return
+
+    search(0, frozenset(), 0, 0)
+
+    cost, node_cost, resource_cost, node_ids = best
+    properties = {}
+    resources = {}
+    for (kind, key, _), option in zip(requirements, best_chosen):
+        if kind == 'station':
+            properties[key] = option.ref
+        else:
+            resources[key] = option.ref
+    return ProductionPlan(cost=cost,
+                          node_cost=node_cost,
+                          resource_cost=resource_cost,
+                          nodes=node_ids,
+                          properties=properties,
+                          resources=resources,
+                          exhaustive=exhaustive)
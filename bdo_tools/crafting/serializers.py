@@ -0,0 +1,20 @@
+from rest_framework import serializers
+
+from bdo_tools.api import SparseFieldsMixin
+from . import models
+
+
+class MaterialSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    resources = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = models.Material
+        fields = ('id', 'name', 'resources', 'modified')
+
+
+class StationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    properties = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = models.Station
+        fields = ('id', 'name', 'properties', 'modified')
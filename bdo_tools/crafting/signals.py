@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from nodes.autocomplete import update_autocomplete_index
+from nodes.facets import invalidate_facet_counts
+from nodes.models import Property, PropertyStation, Resource
+from . import bom, planner
+from .models import Material, Recipe, RecipeInput, RecipeOutput, Station
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeInput)
+@receiver(post_delete, sender=RecipeInput)
+@receiver(post_save, sender=RecipeOutput)
+@receiver(post_delete, sender=RecipeOutput)
+def recipe_changed(sender, **kwargs):
+    """Any recipe change can change the bill of every material above it"""
+    bom.invalidate_recipe_graph()
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+@receiver(post_save, sender=PropertyStation)
+@receiver(post_delete, sender=PropertyStation)
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def production_site_changed(sender, **kwargs):
+    """Stations and resources may have moved, appeared or gone"""
+    planner.invalidate_production_index()
+
+
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+@receiver(post_save, sender=Station)
+@receiver(post_delete, sender=Station)
+def name_changed(sender, instance, **kwargs):
+    """Keep typeahead completions and facet labels of this process current"""
+    update_autocomplete_index('material' if sender is Material else 'station',
+                              instance, deleted=kwargs['signal'] is post_delete)
+    invalidate_facet_counts()
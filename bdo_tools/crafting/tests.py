@@ -1,3 +1,386 @@
-from django.test import TestCase
+import json
+from fractions import Fraction
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from nodes.graph import NodeGraph, get_graph, invalidate_graph
+from nodes.models import Resource
+from nodes.planner import PlanningError
+from nodes.tests import create_world
+from .bom import (RecipeCycleError,
+                  RecipeGraph,
+                  get_recipe_graph,
+                  invalidate_recipe_graph)
+from .models import Material, Recipe, RecipeInput, RecipeOutput, Station
+from .planner import (ProductionIndex,
+                      get_production_index,
+                      get_requirements,
+                      invalidate_production_index,
+                      plan_production)
+
+
+class ViewQueryCountTests(TestCase):
+    """
+    Every route should run a fixed number of queries, no matter how many rows
+    it shows. The data has several rows for every relation a template walks.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+        cls.recipe = create_recipe('Test Recipe', cls.world['stations'][0],
+                                   inputs=[(cls.world['materials'][0], 2)],
+                                   outputs=[(cls.world['materials'][2], 1)])
+
+    def setUp(self):
+        # Built once per process in production
+        get_graph()
+        get_recipe_graph()
+        get_production_index()
+
+    def assertRouteQueries(self, url_name, num, **kwargs):
+        """
+        Assert that the route renders successfully with ``num`` queries.
+        """
+        with self.assertNumQueries(num):
+            response = self.client.get(reverse(url_name, kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+
+    def test_main(self):
+        self.assertRouteQueries('crafting:main', 0)
+
+    def test_material_list(self):
+        self.assertRouteQueries('crafting:materials:list', 1)
+
+    def test_material_detail(self):
+        self.assertRouteQueries('crafting:materials:detail', 2,
+                                pk=self.world['materials'][0].pk)
+
+    def test_recipe_list(self):
+        self.assertRouteQueries('crafting:recipes:list', 1)
+
+    def test_crafted_material_detail(self):
+        self.assertRouteQueries('crafting:materials:detail', 3,
+                                pk=self.world['materials'][2].pk)
+
+    def test_material_bill(self):
+        self.assertRouteQueries('crafting:materials:bill', 3,
+                                pk=self.world['materials'][2].pk)
+
+    def test_material_production(self):
+        self.assertRouteQueries('crafting:materials:production', 4,
+                                pk=self.world['materials'][2].pk)
+
+    def test_recipe_detail(self):
+        self.assertRouteQueries('crafting:recipes:detail', 3, pk=self.recipe.pk)
+
+    def test_station_list(self):
+        self.assertRouteQueries('crafting:stations:list', 1)
+
+    def test_station_detail(self):
+        self.assertRouteQueries('crafting:stations:detail', 2,
+                                pk=self.world['stations'][0].pk)
+
+
+class APITests(TestCase):
+    """
+    Materials and Stations should be available from the read-only API.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+
+    def get_list(self, name, **params):
+        response = self.client.get('/api/{}/'.format(name), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content).decode())
+
+    def test_materials(self):
+        with self.assertNumQueries(3):
+            materials = self.get_list('materials')
+        self.assertEqual([len(material['resources']) for material in materials],
+                         [2, 2, 2])
+
+    def test_stations(self):
+        station = self.world['stations'][0]
+        stations = self.get_list('stations', ids=station.pk,
+                                 fields='name,properties')
+        self.assertEqual(len(stations), 1)
+        self.assertEqual(stations[0]['name'], station.name)
+        self.assertEqual(sorted(stations[0]['properties']),
+                         sorted(p.pk for p in self.world['properties']))
+
+
+class RecipeGraphTests(TestCase):
+    """
+    Bills of materials should expand every level of the recipe tree.
+    """
+    def test_raw(self):
+        graph = RecipeGraph([])
+        self.assertEqual(graph.bill(1, 3), ({1: 3}, {}))
+
+    def test_multi_level(self):
+        # 10 plank (2 out) <- 3 log; 20 beam <- 2 plank + 1 nail; nail raw
+        graph = RecipeGraph([
+            (1, {30: 3}, {10: 2}),
+            (2, {10: 2, 40: 1}, {20: 1}),
+        ])
+        raw, crafts = graph.bill(20, 4)
+        self.assertEqual(raw, {30: 12, 40: 4})
+        self.assertEqual(crafts, {1: 4, 2: 4})
+
+    def test_fractions(self):
+        graph = RecipeGraph([(1, {30: 1}, {10: 3})])
+        raw, crafts = graph.bill(10, 1)
+        self.assertEqual(raw, {30: Fraction(1, 3)})
+        self.assertEqual(crafts, {1: Fraction(1, 3)})
+
+    def test_first_recipe_is_used(self):
+        graph = RecipeGraph([(2, {31: 1}, {10: 1}), (1, {30: 1}, {10: 1})])
+        self.assertEqual(graph.bill(10).raw, {30: 1})
+
+    def test_subtrees_are_cached(self):
+        graph = RecipeGraph([
+            (1, {30: 1}, {10: 1}),
+            (2, {10: 1}, {20: 1}),
+        ])
+        graph.bill(20)
+        self.assertIn(10, graph._unit_bills)
+        with mock.patch.object(graph, 'recipe_for') as recipe_for:
+            graph.bill(10, 5)
+            graph.bill(20, 5)
+        recipe_for.assert_not_called()
+
+    def test_cycle(self):
+        graph = RecipeGraph([
+            (1, {20: 1}, {10: 1}),
+            (2, {30: 1}, {20: 1}),
+            (3, {10: 1}, {30: 1}),
+        ])
+        with self.assertRaises(RecipeCycleError) as cm:
+            graph.bill(10)
+        self.assertEqual(cm.exception.material_ids, [10, 20, 30, 10])
+
+
+class MaterialBillViewTests(TestCase):
+    """
+    The bill endpoint should list raw materials and crafts for a quantity and
+    follow recipe changes.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = Station.objects.create(name='Test Station')
+        cls.log, cls.plank, cls.beam = [
+            Material.objects.create(name=name) for name in ('Log', 'Plank', 'Beam')]
+        cls.planks = create_recipe('Planks', cls.station, inputs=[(cls.log, 3)],
+                                   outputs=[(cls.plank, 2)])
+        cls.beams = create_recipe('Beams', cls.station, inputs=[(cls.plank, 2)],
+                                  outputs=[(cls.beam, 1)])
+
+    def setUp(self):
+        invalidate_recipe_graph()
+
+    def get_bill(self, material, **params):
+        return self.client.get(reverse('crafting:materials:bill',
+                                       kwargs={'pk': material.pk}), params)
+
+    def test_bill(self):
+        response = self.get_bill(self.beam, quantity=5)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['raw'], [{'id': self.log.pk, 'name': 'Log',
+                                        'quantity': 15.0}])
+        self.assertEqual(sorted((c['name'], c['crafts']) for c in data['crafts']),
+                         [('Beams', 5.0), ('Planks', 5.0)])
+
+    def test_recipe_change(self):
+        self.get_bill(self.beam)
+        recipe_input = RecipeInput.objects.get(recipe=self.planks)
+        recipe_input.quantity = 1
+        recipe_input.save()
+        data = json.loads(self.get_bill(self.beam).content.decode())
+        self.assertEqual(data['raw'][0]['quantity'], 1.0)
+
+    def test_cycle(self):
+        RecipeInput.objects.create(recipe=self.planks, material=self.beam)
+        response = self.get_bill(self.beam)
+        self.assertEqual(response.status_code, 400)
+
+    def test_bad_quantity(self):
+        self.assertEqual(self.get_bill(self.beam, quantity='x').status_code, 400)
+        self.assertEqual(self.get_bill(self.beam, quantity=0).status_code, 400)
+
+    def test_unknown_material(self):
+        response = self.client.get(reverse('crafting:materials:bill',
+                                           kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductionPlannerTests(TestCase):
+    """
+    Production plans should pick the properties and resources that are
+    cheapest to connect and use together.
+    """
+    def setUp(self):
+        # Hub 1 reaches 2 and 3 for 2 each and 4 for 3
+        self.graph = NodeGraph([(1, 'Hub', True, None),
+                                (2, 'Two', False, 2),
+                                (3, 'Three', False, 2),
+                                (4, 'Four', False, 3)],
+                               [(1, 2), (1, 3), (1, 4)])
+        # 20 <- 30 at station 100 level 2
+        self.recipes = RecipeGraph([(1, {30: 1}, {20: 1})], {1: (100, 2)})
+
+    def plan(self, index, **kwargs):
+        return plan_production(20, graph=self.graph,
+                               recipe_graph=self.recipes, index=index, **kwargs)
+
+    def test_shared_node(self):
+        # Station and resource are each nearest on their own node, but
+        # sharing node 4 is cheaper
+        index = ProductionIndex([(100, 2, 10, 2), (100, 3, 11, 4)],
+                                [(30, 0, 20, 3), (30, 0, 21, 4)])
+        plan = self.plan(index)
+        self.assertEqual(plan.properties, {(100, 2): 11})
+        self.assertEqual(plan.resources, {30: 21})
+        self.assertEqual((plan.cost, plan.node_cost), (3, 3))
+        self.assertEqual(plan.nodes, [4])
+        self.assertTrue(plan.exhaustive)
+
+    def test_resource_cost(self):
+        index = ProductionIndex([(100, 2, 10, 1)],
+                                [(30, 5, 20, 2), (30, 1, 21, 4)])
+        plan = self.plan(index, quantity=3)
+        self.assertEqual(plan.resources, {30: 21})
+        self.assertEqual((plan.node_cost, plan.resource_cost), (3, 1))
+
+    def test_station_level(self):
+        index = ProductionIndex([(100, 1, 10, 1), (100, 2, 11, 3)],
+                                [(30, 0, 20, 1)])
+        self.assertEqual(self.plan(index).properties, {(100, 2): 11})
+
+    def test_hub_options(self):
+        # Nothing costs less than the property on the hub
+        index = ProductionIndex([(100, 2, 10, 1), (100, 2, 11, 2)],
+                                [(30, 0, 20, 1), (30, 2, 21, 2), (30, 1, 22, 3)])
+        bill = self.recipes.bill(20)
+        requirements = get_requirements(bill, self.recipes, index, self.graph)
+        self.assertEqual([[o.ref for o in options]
+                          for _, _, options in requirements],
+                         [[10], [20]])
+
+    def test_no_station(self):
+        index = ProductionIndex([(100, 1, 10, 1)], [(30, 0, 20, 1)])
+        with self.assertRaises(PlanningError):
+            self.plan(index)
+
+    def test_no_resource(self):
+        index = ProductionIndex([(100, 2, 10, 1)], [])
+        with self.assertRaises(PlanningError):
+            self.plan(index)
+
+    def test_out_of_time(self):
+        index = ProductionIndex([(100, 2, 10, 2), (100, 3, 11, 4)],
+                                [(30, 0, 20, 3), (30, 0, 21, 4)])
+        plan = self.plan(index, time_budget=0)
+        self.assertFalse(plan.exhaustive)
+        self.assertEqual(plan.cost, 4)
+
+
+class MaterialProductionViewTests(TestCase):
+    """
+    The production endpoint should plan from the current nodes, properties
+    and resources.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+        cls.material = cls.world['materials'][2]
+        cls.recipe = create_recipe('Test Recipe', cls.world['stations'][1],
+                                   inputs=[(cls.world['materials'][0], 2)],
+                                   outputs=[(cls.material, 1)])
+
+    def setUp(self):
+        invalidate_graph()
+        invalidate_recipe_graph()
+        invalidate_production_index()
+
+    def get_plan(self, material, **params):
+        return self.client.get(reverse('crafting:materials:production',
+                                       kwargs={'pk': material.pk}), params)
+
+    def test_plan(self):
+        response = self.get_plan(self.material, quantity=2)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+        nodes = self.world['nodes']
+        self.assertEqual(data['cost'], 2)
+        self.assertEqual(data['node_cost'], 1)
+        self.assertEqual([n['id'] for n in data['nodes']], [nodes[1].pk])
+        self.assertEqual([(p['station']['id'], p['level'], p['node'])
+                          for p in data['properties']],
+                         [(self.world['stations'][1].pk, 1, nodes[0].pk)])
+        self.assertEqual([(r['material']['id'], r['node'])
+                          for r in data['resources']],
+                         [(self.world['materials'][0].pk, nodes[1].pk)])
+
+    def test_edit_elsewhere(self):
+        """
+        Edits without signals, as by another process, show after the recheck.
+        """
+        recipe_graph = get_recipe_graph()
+        index = get_production_index()
+        RecipeInput.objects.filter(recipe=self.recipe).update(
+            quantity=3, modified=timezone.now())
+        Resource.objects.filter(node=self.world['nodes'][1]).update(
+            contribution_cost=4, modified=timezone.now())
+        self.assertIs(get_recipe_graph(), recipe_graph)
+        self.assertIs(get_production_index(), index)
+        with override_settings(SHARED_CACHE_RECHECK_SECONDS=0):
+            self.assertEqual(get_recipe_graph().bill(self.material.pk).raw,
+                             {self.world['materials'][0].pk: 3})
+            resources = get_production_index().resources_for(
+                self.world['materials'][0].pk)
+            self.assertEqual([cost for _, _, cost in resources], [1, 4])
+
+    def test_resource_change(self):
+        self.get_plan(self.material)
+        Resource.objects.filter(node=self.world['nodes'][1]).delete()
+        data = json.loads(self.get_plan(self.material).content.decode())
+        self.assertEqual(data['resources'][0]['node'],
+                         self.world['nodes'][2].pk)
+        self.assertEqual(data['node_cost'], 2)
+
+    def test_station_level(self):
+        self.recipe.station_level = 4
+        self.recipe.save()
+        self.assertEqual(self.get_plan(self.material).status_code, 400)
+
+    def test_bad_params(self):
+        self.assertEqual(self.get_plan(self.material, quantity=0).status_code, 400)
+        self.assertEqual(self.get_plan(self.material, budget='x').status_code, 400)
+        for budget in ('nan', 'inf', '-1'):
+            self.assertEqual(self.get_plan(self.material,
+                                           budget=budget).status_code, 400)
+
+    def test_unknown_material(self):
+        response = self.client.get(reverse('crafting:materials:production',
+                                           kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+
+
+# Helper Methods
+def create_recipe(name, station, inputs=(), outputs=()):
+    """
+    Create a Recipe from ``(material, quantity)`` inputs and outputs.
+    """
+    recipe = Recipe.objects.create(name=name, station=station)
+    for material, quantity in inputs:
+        RecipeInput.objects.create(recipe=recipe, material=material,
+                                   quantity=quantity)
+    for material, quantity in outputs:
+        RecipeOutput.objects.create(recipe=recipe, material=material,
+                                    quantity=quantity)
+    return recipe
@@ -1,21 +1,24 @@
 from django.conf.urls import include, url
-from django.views.generic import DetailView, ListView, TemplateView
+from django.views.generic import TemplateView
 
-from . import models
+from . import views
 
 materials_patterns = [
-    url(r'^(?P<pk>[0-9]+)/$', DetailView.as_view(model=models.Material), name='detail'),
-    url(r'^$', ListView.as_view(model=models.Material), name='list'),
+    url(r'^(?P<pk>[0-9]+)/$', views.MaterialDetailView.as_view(), name='detail'),
+    url(r'^(?P<pk>[0-9]+)/bill/$', views.MaterialBillView.as_view(), name='bill'),
+    url(r'^(?P<pk>[0-9]+)/production/$', views.MaterialProductionView.as_view(),
+        name='production'),
+    url(r'^$', views.MaterialListView.as_view(), name='list'),
 ]
 
 recipes_patterns = [
-    url(r'^(?P<pk>[0-9]+)/$', DetailView.as_view(model=models.Recipe), name='detail'),
-    url(r'^$', ListView.as_view(model=models.Recipe), name='list'),
+    url(r'^(?P<pk>[0-9]+)/$', views.RecipeDetailView.as_view(), name='detail'),
+    url(r'^$', views.RecipeListView.as_view(), name='list'),
 ]
 
 stations_patterns = [
-    url(r'^(?P<pk>[0-9]+)/$', DetailView.as_view(model=models.Station), name='detail'),
-    url(r'^$', ListView.as_view(model=models.Station), name='list'),
+    url(r'^(?P<pk>[0-9]+)/$', views.StationDetailView.as_view(), name='detail'),
+    url(r'^$', views.StationListView.as_view(), name='list'),
 ]
 
 app_name = 'crafting'
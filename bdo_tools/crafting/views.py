@@ -0,0 +1,176 @@
+import math
+
+from django.db.models import Prefetch
+from django.http import Http404, JsonResponse
+from django.views.generic import DetailView, ListView, View
+
+from bdo_tools.pagination import KeysetPaginationMixin
+from nodes.graph import get_graph
+from nodes.models import Property, Resource, StationAvailability
+from nodes.planner import PlanningError
+from . import models
+from .bom import RecipeCycleError, get_recipe_graph
+from .planner import plan_production
+
+
+#
+# Materials
+#
+class MaterialDetailView(DetailView):
+    queryset = models.Material.objects.prefetch_related(
+        Prefetch('resources',
+                 queryset=Resource.objects.select_related('node__territory__kingdom')))
+
+    def get_context_data(self, **kwargs):
+        """Add the raw materials needed for one unit of a crafted material"""
+        context = super().get_context_data(**kwargs)
+        graph = get_recipe_graph()
+        context['raw_materials'] = []
+        if graph.recipe_for(self.object.pk) is not None:
+            try:
+                raw = graph.unit_bill(self.object.pk).raw
+            except RecipeCycleError:
+                raw = {}
+            names = models.Material.objects.in_bulk(list(raw))
+            context['raw_materials'] = sorted(
+                ((names[material_id], float(amount))
+                 for material_id, amount in raw.items()),
+                key=lambda row: row[0].name)
+        return context
+
+
+class MaterialListView(KeysetPaginationMixin, ListView):
+    model = models.Material
+
+
+class MaterialBillView(View):
+    """
+    The raw materials and crafts needed for a ``quantity`` of a
+    :model:`crafting.Material`, as JSON.
+    """
+    def get(self, request, pk):
+        try:
+            quantity = int(request.GET.get('quantity', 1))
+        except ValueError:
+            return JsonResponse({'error': 'quantity must be a number'},
+                                status=400)
+        if quantity < 1:
+            return JsonResponse({'error': 'quantity must be positive'},
+                                status=400)
+        pk = int(pk)
+        if not models.Material.objects.filter(pk=pk).exists():
+            raise Http404('No material with id {}'.format(pk))
+        try:
+            bill = get_recipe_graph().bill(pk, quantity)
+        except RecipeCycleError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        materials = dict(models.Material.objects.filter(pk__in=list(bill.raw))
+                                                .values_list('id', 'name'))
+        recipes = dict(models.Recipe.objects.filter(pk__in=list(bill.crafts))
+                                            .values_list('id', 'name'))
+        return JsonResponse({
+            'material': pk,
+            'quantity': quantity,
+            'raw': [{'id': material_id,
+                     'name': materials[material_id],
+                     'quantity': float(amount)}
+                    for material_id, amount in sorted(bill.raw.items())],
+            'crafts': [{'id': recipe_id,
+                        'name': recipes[recipe_id],
+                        'crafts': float(amount)}
+                       for recipe_id, amount in sorted(bill.crafts.items())],
+        })
+
+
+class MaterialProductionView(View):
+    """
+    The cheapest properties and resources to craft a ``quantity`` of a
+    :model:`crafting.Material` from, and the nodes to invest in, as JSON.
+    The search stops after ``budget`` seconds, up to ``max_budget``.
+    """
+    default_budget = 0.25
+    max_budget = 5.0
+
+    def get(self, request, pk):
+        try:
+            quantity = int(request.GET.get('quantity', 1))
+            budget = float(request.GET.get('budget', self.default_budget))
+        except ValueError:
+            return JsonResponse({'error': 'quantity and budget must be numbers'},
+                                status=400)
+        if quantity < 1 or not math.isfinite(budget) or budget <= 0:
+            return JsonResponse({'error': 'quantity and budget must be '
+                                          'positive'},
+                                status=400)
+        pk = int(pk)
+        if not models.Material.objects.filter(pk=pk).exists():
+            raise Http404('No material with id {}'.format(pk))
+        graph = get_graph()
+        try:
+            plan = plan_production(pk, quantity,
+                                   time_budget=min(budget, self.max_budget),
+                                   graph=graph)
+        except PlanningError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        properties = Property.objects.in_bulk(list(plan.properties.values()))
+        stations = models.Station.objects.in_bulk(
+            [station_id for station_id, _ in plan.properties])
+        resources = Resource.objects.select_related('material')\
+                                    .in_bulk(list(plan.resources.values()))
+        return JsonResponse({
+            'material': pk,
+            'quantity': quantity,
+            'cost': plan.cost,
+            'node_cost': plan.node_cost,
+            'resource_cost': plan.resource_cost,
+            'exhaustive': plan.exhaustive,
+            'nodes': [{'id': node_id, 'name': graph.names[graph.index[node_id]]}
+                      for node_id in plan.nodes],
+            'properties': [{'station': {'id': station_id,
+                                        'name': stations[station_id].name},
+                            'level': level,
+                            'id': property_id,
+                            'name': properties[property_id].name,
+                            'node': properties[property_id].node_id}
+                           for (station_id, level), property_id
+                           in sorted(plan.properties.items())],
+            'resources': [{'material': {'id': material_id,
+                                        'name': resources[resource_id].material.name},
+                           'id': resource_id,
+                           'node': resources[resource_id].node_id,
+                           'contribution_cost': resources[resource_id].contribution_cost}
+                          for material_id, resource_id
+                          in sorted(plan.resources.items())],
+        })
+
+
+#
+# Recipes
+#
+class RecipeDetailView(DetailView):
+    queryset = models.Recipe.objects.select_related('station').prefetch_related(
+        Prefetch('inputs',
+                 queryset=models.RecipeInput.objects.select_related('material')),
+        Prefetch('outputs',
+                 queryset=models.RecipeOutput.objects.select_related('material')))
+
+
+class RecipeListView(KeysetPaginationMixin, ListView):
+    model = models.Recipe
+
+
+#
+# Stations
+#
+class StationDetailView(DetailView):
+    queryset = models.Station.objects.prefetch_related(
+        Prefetch('availability',
+                 queryset=StationAvailability.objects.order_by(
+                     'kingdom_name', 'territory_name', 'node_name',
+                     'property_name')))
+
+
+class StationListView(KeysetPaginationMixin, ListView):
+    model = models.Station
@@ -0,0 +1,12 @@
+"""
+Gunicorn settings, used by the Procfile.
+"""
+
+
+def post_worker_init(worker):
+    """
+    Build the in-memory autocomplete index before the worker takes requests.
+    """
+    from nodes.autocomplete import get_autocomplete_index
+
+    get_autocomplete_index()
@@ -0,0 +1,37 @@
+from django.contrib import admin
+
+from . import models
+from .queue import enqueue
+
+
+#
+# Admins
+#
+class JobAdmin(admin.ModelAdmin):
+    # List options
+    list_display = ('name', 'status', 'requests', 'attempts', 'created',
+                    'run_after', 'started', 'finished')
+    list_filter = ('status', 'name')
+    ordering = ('-created',)
+    actions = ['run_again']
+
+    # Detail options
+    readonly_fields = ('name', 'status', 'requests', 'attempts', 'created',
+                       'run_after', 'started', 'finished', 'error')
+
+    def has_add_permission(self, request):
+        # Jobs come from enqueue() so they are always registered
+        return False
+
+    def run_again(self, request, queryset):
+        names = set(queryset.values_list('name', flat=True))
+        for name in names:
+            enqueue(name)
+        self.message_user(request, 'Queued {}.'.format(', '.join(sorted(names))))
+    run_again.short_description = 'Queue the selected jobs to run again'
+
+
+#
+# Admin Setup
+#
+admin.site.register(models.Job, JobAdmin)
@@ -0,0 +1,71 @@
+import datetime
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from jobs.queue import claim, purge, requeue_stale, run, run_pending
+
+
+class Command(BaseCommand):
+    help = ('Run queued background jobs until stopped. Start as many as '
+            'needed; each job runs in one of them. Run them on the hosts '
+            'that serve requests, since some jobs write files the web '
+            'workers read.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due and exit')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when no job is due')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Delete finished jobs older than this')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Minutes after which a running job is taken '
+                                 'for dead and queued again')
+
+    def handle(self, *args, **options):
+        keep = datetime.timedelta(days=options['keep_days'])
+        timeout = datetime.timedelta(minutes=options['timeout'])
+        if options['once']:
+            requeue_stale(timeout)
+            self.stdout.write('Ran {} job(s)'.format(run_pending()))
+            purge(keep)
+            return
+
+        stopping = []
+
+        def stop(signum, frame):
+            # Let the current job finish
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        purged = requeued = 0
+        while not stopping:
+            # Like the request cycle, drop connections that went stale
+            close_old_connections()
+            try:
+                if time.monotonic() - requeued > 60:
+                    count = requeue_stale(timeout)
+                    if count:
+                        self.stderr.write('Queued {} stale job(s) again'
+                                          .format(count))
+                    requeued = time.monotonic()
+                job = claim()
+                if job is None:
+                    if time.monotonic() - purged > 60 * 60:
+                        purge(keep)
+                        purged = time.monotonic()
+                    time.sleep(options['interval'])
+                    continue
+                started = time.perf_counter()
+                run(job)
+            except DatabaseError as e:
+                # A deadlock or lost connection; try again on the next round
+                self.stderr.write('Database error: {}'.format(e))
+                time.sleep(options['interval'])
+                continue
+            self.stdout.write('{} {} after {} request(s) in {:.1f} s'.format(
+                job, job.status, job.requests, time.perf_counter() - started))
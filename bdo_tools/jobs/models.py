@@ -0,0 +1,44 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A queued run of a registered job function, see :mod:`jobs.queue`.
+
+    There is at most one queued job per ``name``; enqueueing it again while
+    it waits only counts another request, so a burst of edits runs it once.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10,
+                              choices=STATUS_CHOICES,
+                              default=QUEUED)
+    requests = models.PositiveIntegerField(
+        default=1,
+        help_text='How many times it was enqueued before it started')
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return '{} #{}'.format(self.name, self.pk)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after']),
+                   models.Index(fields=['name', 'status'])]
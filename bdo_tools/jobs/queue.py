@@ -0,0 +1,156 @@
+"""
+A job queue kept in the database, so it needs no broker.
+
+Apps register job functions in their ``jobs`` module with :func:`register`
+and :func:`enqueue` them, usually from signal handlers through
+:func:`enqueue_on_commit`, instead of doing slow rebuilds inside the request
+that changed the data. ``manage.py run_jobs`` worker processes :func:`claim`
+due jobs and run them.
+
+A job enqueued while one of the same name is still waiting is folded into it.
+Each registration sets how long a job waits after the last request before it
+is due, and the longest it waits after the first, so a burst of edits runs
+the job once unless it lasts longer than that. A job enqueued while another of
+its name runs is queued again, since the running one may have read the data
+before the edit. A job left running by a worker that died is queued again by
+:func:`requeue_stale` once it has run for longer than a timeout.
+"""
+from collections import namedtuple
+import datetime
+import traceback
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+Registration = namedtuple('Registration', ['function', 'delay', 'max_wait'])
+
+_registry = {}
+
+
+def register(name, delay=0, max_wait=None):
+    """
+    Decorator registering a function taking no arguments as job ``name``.
+    A job is due ``delay`` seconds after it was last enqueued, but no more
+    than ``max_wait`` seconds, by default ``delay``, after it was first.
+    """
+    def decorator(function):
+        _registry[name] = Registration(
+            function=function, delay=delay,
+            max_wait=delay if max_wait is None else max_wait)
+        return function
+    return decorator
+
+
+def enqueue(name):
+    """
+    Queue job ``name``, or count another request on the one already waiting
+    and put it off, and return the :model:`jobs.Job`.
+
+    The waiting job is locked until the surrounding transaction ends, so call
+    :func:`enqueue_on_commit` from inside one.
+    """
+    registration = _registry[name]
+    now = timezone.now()
+    with transaction.atomic():
+        job = Job.objects.select_for_update()\
+                         .filter(name=name, status=Job.QUEUED)\
+                         .order_by('id').first()
+        if job is not None:
+            delay = datetime.timedelta(seconds=registration.delay)
+            max_wait = datetime.timedelta(seconds=registration.max_wait)
+            run_after = min(now + delay, job.created + max_wait)
+            Job.objects.filter(pk=job.pk).update(
+                requests=F('requests') + 1,
+                run_after=max(run_after, job.run_after))
+            return job
+        run_after = now + datetime.timedelta(seconds=registration.delay)
+        return Job.objects.create(name=name, run_after=run_after)
+
+
+def enqueue_on_commit(name):
+    """
+    :func:`enqueue` job ``name`` once the current transaction commits, so
+    concurrent edits don't queue behind each other's lock on the job.
+    """
+    transaction.on_commit(lambda: enqueue(name))
+
+
+def claim():
+    """
+    Mark the next due job running and return it, or ``None`` if nothing is
+    due. Jobs locked by another worker are skipped.
+    """
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True)\
+                         .filter(status=Job.QUEUED, run_after__lte=timezone.now())\
+                         .order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        # Two enqueues racing can each create a job; run them as one. Only
+        # those this worker could lock are folded, so two workers claiming
+        # at once never wait on each other.
+        duplicates = list(Job.objects.select_for_update(skip_locked=True)
+                                     .filter(name=job.name, status=Job.QUEUED)
+                                     .exclude(pk=job.pk)
+                                     .values_list('pk', 'requests'))
+        if duplicates:
+            job.requests += sum(requests for _, requests in duplicates)
+            Job.objects.filter(pk__in=[pk for pk, _ in duplicates]).delete()
+        job.status = Job.RUNNING
+        job.started = timezone.now()
+        job.attempts += 1
+        job.error = ''
+        job.save()
+    return job
+
+
+def requeue_stale(timeout):
+    """
+    Queue again the jobs that have been running for longer than ``timeout``
+    (a timedelta), as their worker most likely died, and return how many.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, started__lt=now - timeout)
+    return stale.update(status=Job.QUEUED, run_after=now, modified=now)
+
+
+def run(job):
+    """
+    Run a claimed ``job`` and record whether it succeeded.
+    """
+    try:
+        _registry[job.name].function()
+    except Exception:
+        job.status = Job.FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = Job.DONE
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished', 'modified'])
+    return job
+
+
+def run_pending():
+    """
+    Run every due job in this process and return how many ran.
+    """
+    count = 0
+    job = claim()
+    while job is not None:
+        run(job)
+        count += 1
+        job = claim()
+    return count
+
+
+def purge(age):
+    """
+    Delete jobs that finished more than ``age`` (a timedelta) ago and return
+    how many were deleted.
+    """
+    finished = Job.objects.filter(status__in=[Job.DONE, Job.FAILED],
+                                  finished__lt=timezone.now() - age)
+    return finished.delete()[0]
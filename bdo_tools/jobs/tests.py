@@ -0,0 +1,165 @@
+import datetime
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from nodes.distances import HubDistances
+from nodes.graph import NodeGraph
+from nodes.snapshot import get_version, load_snapshot
+from nodes.tests import create_node, run_on_commit
+from . import queue
+from .models import Job
+
+
+class JobQueueTests(TestCase):
+    """
+    Jobs should be folded together while they wait, run once when due, and
+    record how they went.
+    """
+    def setUp(self):
+        self.calls = []
+        registry = {
+            'test.ok': queue.Registration(function=lambda: self.calls.append(1),
+                                          delay=0, max_wait=0),
+            'test.later': queue.Registration(function=lambda: None, delay=60,
+                                             max_wait=300),
+            'test.fail': queue.Registration(function=lambda: 1 / 0, delay=0,
+                                            max_wait=0),
+        }
+        patcher = mock.patch.dict(queue._registry, registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_coalesce(self):
+        for _ in range(50):
+            queue.enqueue('test.ok')
+        job = Job.objects.get(name='test.ok')
+        self.assertEqual(job.requests, 50)
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(self.calls, [1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+
+    def test_enqueue_while_running(self):
+        queue.enqueue('test.ok')
+        running = queue.claim()
+        queued = queue.enqueue('test.ok')
+        self.assertNotEqual(running.pk, queued.pk)
+        self.assertEqual(queued.status, Job.QUEUED)
+
+    def test_delay(self):
+        queue.enqueue('test.later')
+        self.assertIsNone(queue.claim())
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(queue.claim().name, 'test.later')
+
+    def test_burst_puts_off(self):
+        """
+        Each request puts the job off by its delay, up to its longest wait.
+        """
+        queue.enqueue('test.later')
+        now = timezone.now()
+        Job.objects.update(created=now - datetime.timedelta(seconds=100),
+                           run_after=now)
+        queue.enqueue('test.later')
+        run_after = Job.objects.get().run_after
+        self.assertGreater(run_after, now + datetime.timedelta(seconds=50))
+        Job.objects.update(created=now - datetime.timedelta(seconds=290))
+        queue.enqueue('test.later')
+        # Never brought forward either
+        self.assertEqual(Job.objects.get().run_after, run_after)
+        Job.objects.update(created=now - datetime.timedelta(seconds=400),
+                           run_after=now)
+        queue.enqueue('test.later')
+        self.assertEqual(Job.objects.get().run_after, now)
+
+    def test_duplicates_run_once(self):
+        Job.objects.create(name='test.ok', requests=2)
+        Job.objects.create(name='test.ok', requests=3)
+        job = queue.claim()
+        self.assertEqual(job.requests, 5)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_requeue_stale(self):
+        queue.enqueue('test.ok')
+        job = queue.claim()
+        self.assertEqual(queue.requeue_stale(datetime.timedelta(hours=1)), 0)
+        Job.objects.update(started=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(queue.requeue_stale(datetime.timedelta(hours=1)), 1)
+        self.assertEqual(queue.claim().pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 2))
+
+    def test_failure(self):
+        queue.enqueue('test.fail')
+        queue.run_pending()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('ZeroDivisionError', job.error)
+        self.assertIsNotNone(job.finished)
+
+    def test_unknown_job(self):
+        with self.assertRaises(KeyError):
+            queue.enqueue('test.missing')
+
+    def test_purge(self):
+        old = timezone.now() - datetime.timedelta(days=8)
+        Job.objects.create(name='test.ok', status=Job.DONE, finished=old)
+        Job.objects.create(name='test.ok', status=Job.FAILED, finished=old)
+        queue.enqueue('test.ok')
+        self.assertEqual(queue.purge(datetime.timedelta(days=7)), 2)
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+    def test_admin(self):
+        user = User.objects.create_superuser('admin', 'admin@test.com',
+                                             'password')
+        self.client.force_login(user)
+        job = Job.objects.create(name='test.ok', status=Job.DONE)
+        response = self.client.get(reverse('admin:jobs_job_changelist'))
+        self.assertContains(response, 'test.ok')
+        self.client.post(reverse('admin:jobs_job_changelist'),
+                         {'action': 'run_again', '_selected_action': [job.pk]})
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+
+class NodeJobTests(TestCase):
+    """
+    Network edits should queue one rebuild of the hub distances, which the
+    worker command saves for the web workers.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(HUB_DISTANCE_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_edits_queue_one_rebuild(self):
+        hub = create_node(name='Hub', is_hub=True, contribution_cost=None)
+        for i in range(5):
+            node = create_node(name='Node {}'.format(i),
+                               territory=hub.territory)
+            hub.connected_nodes.add(node)
+        # Nothing is locked until the edits commit
+        self.assertFalse(Job.objects.exists())
+        run_on_commit()
+        job = Job.objects.get(name='nodes.build_hub_distances')
+        self.assertGreater(job.requests, 5)
+
+        Job.objects.update(run_after=timezone.now())
+        out = StringIO()
+        call_command('run_jobs', once=True, stdout=out)
+        # The rebuild and the snapshot
+        self.assertIn('Ran 2 job(s)', out.getvalue())
+        self.assertEqual(Job.objects.get(name='nodes.build_hub_distances')
+                                    .status, Job.DONE)
+        saved = HubDistances.load(self.directory)
+        self.assertEqual(saved.fingerprint, NodeGraph.from_db().fingerprint)
+        self.assertIsNotNone(load_snapshot(get_version()))
@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib import admin
+from django.db.models import Prefetch
 import nested_admin
 
 from . import models
@@ -58,6 +59,9 @@ class TerritoryAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     ordering = ('name',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('kingdom')
+
 
 class NodeAdmin(nested_admin.NestedModelAdmin):
     # List options
@@ -67,6 +71,10 @@ class NodeAdmin(nested_admin.NestedModelAdmin):
     ordering = ('name',)
     form = ConnectedNodeForm
 
+    def get_queryset(self, request):
+        return super().get_queryset(request)\
+                      .select_related('territory__kingdom')
+
     def get_kingdom(self, obj):
         return obj.territory.kingdom.name
 
@@ -86,6 +94,9 @@ class ResourceAdmin(admin.ModelAdmin):
     list_display = ('node', 'material', 'contribution_cost')
     list_filter = ('node', 'material', 'contribution_cost')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('node', 'material')
+
 
 class PropertyAdmin(admin.ModelAdmin):
     # List Options
@@ -93,44 +104,47 @@ class PropertyAdmin(admin.ModelAdmin):
                     'get_station_1', 'get_station_2', 'get_station_3',
                     'get_station_4', 'get_station_5')
 
+    def get_queryset(self, request):
+        # Load every row's stations in one query, in the order they were added
+        property_stations = models.PropertyStation.objects\
+                                                  .select_related('station')\
+                                                  .order_by('id')
+        return super().get_queryset(request)\
+                      .select_related('parent_property', 'node__territory')\
+                      .prefetch_related(Prefetch('propertystation_set',
+                                                 queryset=property_stations,
+                                                 to_attr='ordered_property_stations'))
+
     def get_territory(self, obj):
         return obj.node.territory
     get_territory.short_description = 'Territory'
     get_territory.admin_order_field = 'node__territory__name'
 
-    def get_station_1(self, obj):
-        if obj.stations.count() >= 1:
-            return obj.stations.all()[0]
+    def _get_station(self, obj, index):
+        property_stations = obj.ordered_property_stations
+        if len(property_stations) > index:
+            return property_stations[index].station
         else:
             return None
+
+    def get_station_1(self, obj):
+        return self._get_station(obj, 0)
     get_station_1.short_description = 'Station 1'
 
     def get_station_2(self, obj):
-        if obj.stations.count() >= 2:
-            return obj.stations.all()[1]
-        else:
-            return None
+        return self._get_station(obj, 1)
     get_station_2.short_description = 'Station 2'
 
     def get_station_3(self, obj):
-        if obj.stations.count() >= 3:
-            return obj.stations.all()[2]
-        else:
-            return None
+        return self._get_station(obj, 2)
     get_station_3.short_description = 'Station 3'
 
     def get_station_4(self, obj):
-        if obj.stations.count() >= 4:
-            return obj.stations.all()[3]
-        else:
-            return None
+        return self._get_station(obj, 3)
     get_station_4.short_description = 'Station 4'
 
     def get_station_5(self, obj):
-        if obj.stations.count() >= 5:
-            return obj.stations.all()[4]
-        else:
-            return None
+        return self._get_station(obj, 4)
     get_station_5.short_description = 'Station 5'
 
     # Detail Options
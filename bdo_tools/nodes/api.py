@@ -0,0 +1,55 @@
+from django.db.models import Prefetch
+
+from bdo_tools.api import ReadOnlyBulkViewSet
+from . import models, serializers
+
+
+class KingdomViewSet(ReadOnlyBulkViewSet):
+    queryset = models.Kingdom.objects.all()
+    serializer_class = serializers.KingdomSerializer
+    prefetch_related_fields = {'territories': ['territories']}
+
+
+class TerritoryViewSet(ReadOnlyBulkViewSet):
+    queryset = models.Territory.objects.all()
+    serializer_class = serializers.TerritorySerializer
+    select_related_fields = {'kingdom': ['kingdom']}
+    prefetch_related_fields = {'nodes': ['nodes']}
+
+
+class NodeViewSet(ReadOnlyBulkViewSet):
+    queryset = models.Node.objects.all()
+    serializer_class = serializers.NodeSerializer
+    select_related_fields = {'territory': ['territory'],
+                             'kingdom': ['territory__kingdom']}
+    prefetch_related_fields = {
+        'connected_nodes': ['connected_nodes'],
+        'resources': [Prefetch('resources',
+                               queryset=models.Resource.objects.select_related('material'))],
+        'properties': ['properties'],
+    }
+
+
+class ResourceViewSet(ReadOnlyBulkViewSet):
+    queryset = models.Resource.objects.all()
+    serializer_class = serializers.ResourceSerializer
+    select_related_fields = {'node': ['node'],
+                             'material': ['material']}
+
+
+class PropertyViewSet(ReadOnlyBulkViewSet):
+    queryset = models.Property.objects.all()
+    serializer_class = serializers.PropertySerializer
+    select_related_fields = {'node': ['node']}
+    prefetch_related_fields = {
+        'child_properties': ['child_properties'],
+        'stations': [Prefetch('propertystation_set',
+                              queryset=models.PropertyStation.objects.select_related('station'))],
+    }
+
+
+class PropertyStationViewSet(ReadOnlyBulkViewSet):
+    queryset = models.PropertyStation.objects.all()
+    serializer_class = serializers.PropertyStationSerializer
+    select_related_fields = {'property': ['property'],
+                             'station': ['station']}
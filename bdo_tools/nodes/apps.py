@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class NodesConfig(AppConfig):
     name = 'nodes'
+
+    def ready(self):
+        from . import signals  # NOQA
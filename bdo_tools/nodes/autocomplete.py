@@ -0,0 +1,215 @@
+"""
+Typeahead completion of node, material, station and property names from
+memory.
+
+:class:`AutocompleteIndex` keeps the names of each type in sorted lists and
+finds those starting with a prefix with :func:`bisect.bisect_left`, so a
+keystroke costs a few list lookups and no query. Names whose first word
+matches come first; names with a later word that matches follow.
+
+Each worker builds its index at startup (see ``gunicorn_conf.py`` and
+``bdo_tools.asgi``) and the signal handlers apply the edits it makes once
+they commit. Edits made by other processes are picked up by the version check
+of :class:`~bdo_tools.shared_cache.SharedCache`.
+"""
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+import re
+import threading
+
+from django.apps import apps
+from django.db import transaction
+
+from bdo_tools.shared_cache import SharedCache
+
+# type: model
+AUTOCOMPLETE_TYPES = OrderedDict([
+    ('node', 'nodes.Node'),
+    ('material', 'crafting.Material'),
+    ('station', 'crafting.Station'),
+    ('property', 'nodes.Property'),
+])
+
+WORD_STARTS = re.compile(r'(?<=[\W_])[^\W_]')
+
+Completion = namedtuple('Completion', ['type', 'id', 'name'])
+
+
+def normalize(value):
+    return value.casefold()
+
+
+def word_keys(key):
+    """
+    ``key`` from each word after the first on.
+    """
+    return [key[match.start():] for match in WORD_STARTS.finditer(key)]
+
+
+class TypeIndex:
+    """
+    The names of one type as sorted ``(key, name, id)`` tuples, once from the
+    start of the name in ``names`` and once from every later word in
+    ``words``.
+
+    Completions read the lists without a lock, so edits replace them with
+    changed copies instead of changing them in place.
+    """
+    def __init__(self, rows):
+        self.by_id = {}
+        self.names = []
+        self.words = []
+        for id, name in rows:
+            self.by_id[id] = name
+            key = normalize(name)
+            self.names.append((key, name, id))
+            self.words.extend((word, name, id) for word in word_keys(key))
+        self.names.sort()
+        self.words.sort()
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def add(self, id, name):
+        self.by_id[id] = name
+        key = normalize(name)
+        names = list(self.names)
+        insort(names, (key, name, id))
+        words = list(self.words)
+        for word in word_keys(key):
+            insort(words, (word, name, id))
+        self.names, self.words = names, words
+
+    def remove(self, id):
+        name = self.by_id.pop(id, None)
+        if name is None:
+            return
+        key = normalize(name)
+        names = list(self.names)
+        words = list(self.words)
+        for entries, entry_key in [(names, key)] + \
+                [(words, word) for word in word_keys(key)]:
+            entry = (entry_key, name, id)
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        self.names, self.words = names, words
+
+    @staticmethod
+    def starting_with(entries, prefix, limit):
+        """
+        Up to ``limit`` of ``entries`` whose key starts with ``prefix``.
+        """
+        found = []
+        i = bisect_left(entries, (prefix,))
+        while i < len(entries) and len(found) < limit:
+            entry = entries[i]
+            if not entry[0].startswith(prefix):
+                break
+            found.append(entry)
+            i += 1
+        return found
+
+
+class AutocompleteIndex:
+    """
+    A :class:`TypeIndex` for each of ``AUTOCOMPLETE_TYPES``.
+    """
+    def __init__(self, types):
+        self.types = types
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_db(cls):
+        types = OrderedDict()
+        for type, label in AUTOCOMPLETE_TYPES.items():
+            rows = apps.get_model(label).objects.order_by()\
+                                                .values_list('pk', 'name')
+            types[type] = TypeIndex(rows.iterator())
+        return cls(types)
+
+    def __len__(self):
+        return sum(len(index) for index in self.types.values())
+
+    def update(self, type, id, name):
+        """
+        Add or rename object ``id`` of ``type``.
+        """
+        index = self.types[type]
+        with self.lock:
+            if index.by_id.get(id) != name:
+                index.remove(id)
+                index.add(id, name)
+
+    def remove(self, type, id):
+        with self.lock:
+            self.types[type].remove(id)
+
+    def complete(self, prefix, type=None, limit=10):
+        """
+        Up to ``limit`` :class:`Completion` for names of ``type``, or of any
+        type, starting with ``prefix``, then those with a later word starting
+        with it. Each group is in alphabetical order.
+        """
+        prefix = normalize(prefix.strip())
+        if not prefix:
+            return []
+        types = [type] if type else list(self.types)
+        first = []
+        later = []
+        for name in types:
+            index = self.types[name]
+            first.extend((key, name, id, value) for key, value, id
+                         in index.starting_with(index.names, prefix, limit))
+            if len(first) < limit:
+                later.extend((normalize(value), name, id, value)
+                             for _, value, id
+                             in index.starting_with(index.words, prefix, limit))
+        completions = []
+        seen = set()
+        for group in (first, later):
+            for _, name, id, value in sorted(group):
+                if len(completions) == limit:
+                    return completions
+                if (name, id) not in seen:
+                    seen.add((name, id))
+                    completions.append(Completion(type=name, id=id, name=value))
+        return completions
+
+
+_index = SharedCache(AutocompleteIndex.from_db,
+                     list(AUTOCOMPLETE_TYPES.values()))
+
+
+def get_autocomplete_index():
+    """
+    Return the shared :class:`AutocompleteIndex`, building it if needed and
+    rebuilding it if another process changed the names since the last check.
+    """
+    return _index.get()
+
+
+def invalidate_autocomplete_index():
+    """
+    Drop the shared :class:`AutocompleteIndex` so the next request rebuilds
+    it.
+    """
+    _index.invalidate()
+
+
+def update_autocomplete_index(type, instance, deleted=False):
+    """
+    Apply a save or delete of ``instance`` to the shared index, if built,
+    once the transaction commits.
+    """
+    pk, name = instance.pk, instance.name
+
+    def apply():
+        index = _index.peek()
+        if index is None:
+            return
+        if deleted:
+            index.remove(type, pk)
+        else:
+            index.update(type, pk, name)
+    transaction.on_commit(apply)
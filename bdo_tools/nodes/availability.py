@@ -0,0 +1,73 @@
+"""
+The :model:`nodes.StationAvailability` rollup.
+
+Asking where a :model:`crafting.Station` can be used means walking property,
+node, territory and kingdom for every :model:`nodes.PropertyStation`. The
+rollup keeps one row per property station with those already joined, so
+lookups, filters and counts by station or place are one indexed query.
+
+The signal handlers in :mod:`nodes.signals` keep it current as objects are
+saved, and deletes cascade to it. Bulk writes skip signals and call
+:func:`rebuild_station_availability` instead.
+"""
+from django.db import connection, transaction
+
+from .models import PropertyStation, StationAvailability
+
+# StationAvailability fields and the PropertyStation values they copy
+COLUMNS = [
+    ('property_station_id', 'pk'),
+    ('station_id', 'station_id'),
+    ('max_level', 'max_level'),
+    ('property_id', 'property_id'),
+    ('property_name', 'property__name'),
+    ('node_id', 'property__node_id'),
+    ('node_name', 'property__node__name'),
+    ('territory_id', 'property__node__territory_id'),
+    ('territory_name', 'property__node__territory__name'),
+    ('kingdom_id', 'property__node__territory__kingdom_id'),
+    ('kingdom_name', 'property__node__territory__kingdom__name'),
+]
+
+
+def insert_availability(property_stations):
+    """
+    Add a rollup row for each property station in the ``property_stations``
+    queryset and return how many were added.
+
+    The rows are copied by the database with one ``INSERT ... SELECT`` built
+    from the queryset, so no model instances are made.
+    """
+    select = property_stations.order_by()\
+                              .values_list(*[value for _, value in COLUMNS])
+    sql, params = select.query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = [StationAvailability._meta.get_field(field).column
+               for field, _ in COLUMNS]
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO {} ({}) {}'.format(
+            quote(StationAvailability._meta.db_table),
+            ', '.join(quote(column) for column in columns),
+            sql), params)
+        return cursor.rowcount
+
+
+@transaction.atomic
+def rebuild_station_availability():
+    """
+    Replace the whole rollup with rows built from the current data and return
+    how many were written.
+    """
+    StationAvailability.objects.all().delete()
+    return insert_availability(PropertyStation.objects.all())
+
+
+@transaction.atomic
+def refresh_station_availability(property_stations):
+    """
+    Rewrite the rollup rows of the property stations in the
+    ``property_stations`` queryset.
+    """
+    StationAvailability.objects.filter(
+        property_station__in=property_stations.values('pk')).delete()
+    insert_availability(property_stations)
@@ -0,0 +1,355 @@
+"""
+Connection costs from every hub to every node, kept on disk.
+
+Route and planning questions keep asking what it costs to connect a
+:model:`nodes.Node` from each hub. :class:`HubDistances` holds that as a hub
+by node matrix of costs, and another of the previous node on each cheapest
+path, in NumPy arrays saved under ``settings.HUB_DISTANCE_DIR``. Saved arrays
+are memory-mapped read only, so all the workers on a host share one copy
+through the page cache.
+
+Each saved version is named after the :class:`~nodes.graph.NodeGraph`
+fingerprint it was computed from. When the graph changes,
+:func:`get_hub_distances` diffs the edges and contribution costs against the
+last version and repairs only the nodes whose cheapest paths they touch. A new
+node or a change of hubs recomputes everything.
+
+Workers look up the version of their shared graph, which
+:func:`~nodes.graph.get_graph` rebuilds when another process edits the nodes.
+So once a worker notices an edit it maps the version the
+``nodes.build_hub_distances`` job saved for it, if the job got there first.
+"""
+from collections import defaultdict
+import heapq
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+import numpy as np
+
+from .graph import Path, get_graph
+
+# Array names, each saved as <name>.npy in a version directory
+ARRAYS = ['ids', 'hubs', 'dist', 'pred', 'nearest', 'costs', 'offsets',
+          'targets']
+CURRENT = 'CURRENT'
+# Older versions kept for workers that still have them mapped
+KEEP_VERSIONS = 2
+# More changes than this fraction of the nodes is cheaper to recompute
+REPAIR_LIMIT = 0.1
+UNREACHABLE = -1
+
+
+class HubDistances:
+    """
+    ``dist[row, i]`` is the cheapest cost of connecting the node at index
+    ``i`` from the hub at index ``hubs[row]``, or ``-1`` if it cannot be
+    reached, and ``pred[row, i]`` the index before it on that path.
+    ``nearest[i]`` is the row of the cheapest hub for node ``i``.
+
+    Indexes are those of the :class:`~nodes.graph.NodeGraph` the distances
+    were computed from, whose ``ids``, ``costs`` and adjacency arrays are
+    kept alongside to diff against later graphs.
+    """
+    def __init__(self, fingerprint, ids, hubs, dist, pred, nearest, costs,
+                 offsets, targets):
+        self.fingerprint = fingerprint
+        self.ids = ids
+        self.hubs = hubs
+        self.dist = dist
+        self.pred = pred
+        self.nearest = nearest
+        self.costs = costs
+        self.offsets = offsets
+        self.targets = targets
+        self.index = {node_id: i for i, node_id in enumerate(ids.tolist())}
+        self.rows = {int(ids[hub]): row for row, hub in enumerate(hubs.tolist())}
+
+    @classmethod
+    def compute(cls, graph):
+        """
+        Run Dijkstra from every hub of ``graph``.
+        """
+        dist = np.full((len(graph.hubs), len(graph)), UNREACHABLE, dtype=np.int64)
+        pred = np.full((len(graph.hubs), len(graph)), -1, dtype=np.int64)
+        for row, hub in enumerate(graph.hubs):
+            hub_dist, hub_pred = graph.shortest_paths([hub])
+            dist[row] = [UNREACHABLE if d is None else d for d in hub_dist]
+            pred[row] = hub_pred
+        return cls.from_arrays(graph, dist, pred)
+
+    @classmethod
+    def from_arrays(cls, graph, dist, pred):
+        return cls(graph.fingerprint,
+                   ids=np.array(graph.ids, dtype=np.int64),
+                   hubs=np.array(graph.hubs, dtype=np.int64),
+                   dist=dist,
+                   pred=pred,
+                   nearest=nearest_rows(dist),
+                   costs=np.array(graph.costs, dtype=np.int64),
+                   offsets=np.array(graph.offsets, dtype=np.int64),
+                   targets=np.array(graph.targets, dtype=np.int64))
+
+    def updated(self, graph):
+        """
+        Return the distances for ``graph``, repairing only what changed
+        since these were computed, or ``None`` if the nodes or hubs differ or
+        so much changed that :meth:`compute` is cheaper.
+        """
+        if len(graph) != len(self.ids) or \
+                not np.array_equal(np.array(graph.ids, dtype=np.int64), self.ids) or \
+                not np.array_equal(np.array(graph.hubs, dtype=np.int64), self.hubs):
+            return None
+        old_edges = edge_keys(self.offsets, self.targets)
+        new_edges = edge_keys(np.array(graph.offsets, dtype=np.int64),
+                              np.array(graph.targets, dtype=np.int64))
+        removed = [divmod(key, len(graph))
+                   for key in np.setdiff1d(old_edges, new_edges).tolist()]
+        added = [divmod(key, len(graph))
+                 for key in np.setdiff1d(new_edges, old_edges).tolist()]
+        changed = np.flatnonzero(np.array(graph.costs, dtype=np.int64) !=
+                                 self.costs).tolist()
+        if len(removed) + len(added) + len(changed) > REPAIR_LIMIT * len(graph):
+            return None
+
+        dist = np.array(self.dist)
+        pred = np.array(self.pred)
+        costs = np.array(graph.costs, dtype=np.int64)
+        # Only hubs whose paths use a removed edge or changed node, or that a
+        # new edge brings closer, need repairing
+        touched = np.zeros(len(graph.hubs), dtype=bool)
+        for a, b in removed:
+            touched |= (pred[:, b] == a) | (pred[:, a] == b)
+        if changed:
+            touched |= (dist[:, changed] != UNREACHABLE).any(axis=1)
+        for a, b in added:
+            for i, j in ((a, b), (b, a)):
+                touched |= (dist[:, i] != UNREACHABLE) & (
+                    (dist[:, j] == UNREACHABLE) | (dist[:, i] + costs[j] < dist[:, j]))
+        for row in np.flatnonzero(touched).tolist():
+            row_dist = [None if d == UNREACHABLE else d
+                        for d in dist[row].tolist()]
+            row_pred = pred[row].tolist()
+            repair(graph, row_dist, row_pred, removed, added, changed)
+            dist[row] = [UNREACHABLE if d is None else d for d in row_dist]
+            pred[row] = row_pred
+        return HubDistances.from_arrays(graph, dist, pred)
+
+    #
+    # Lookups
+    #
+    def distance(self, hub_id, node_id):
+        """
+        The cost of connecting ``node_id`` from the hub ``hub_id``, or
+        ``None`` if it cannot be reached. Raises ``KeyError`` for unknown ids.
+        """
+        d = int(self.dist[self.rows[hub_id], self.index[node_id]])
+        return None if d == UNREACHABLE else d
+
+    def nearest_hub(self, node_id):
+        """
+        The id of the cheapest hub to connect ``node_id`` from, or ``None``.
+        """
+        i = self.index[node_id]
+        row = int(self.nearest[i])
+        return None if row == UNREACHABLE else int(self.ids[self.hubs[row]])
+
+    def path(self, node_id, hub_id=None):
+        """
+        Return the cheapest :class:`~nodes.graph.Path` to ``node_id`` from
+        ``hub_id``, or from the nearest hub, or ``None`` if it is unreachable.
+        """
+        if hub_id is None:
+            hub_id = self.nearest_hub(node_id)
+            if hub_id is None:
+                return None
+        row, i = self.rows[hub_id], self.index[node_id]
+        cost = int(self.dist[row, i])
+        if cost == UNREACHABLE:
+            return None
+        pred = self.pred[row]
+        indexes = [i]
+        while pred[i] != -1:
+            i = pred[i]
+            indexes.append(i)
+        return Path(cost=cost,
+                    nodes=[int(self.ids[i]) for i in reversed(indexes)])
+
+    #
+    # Storage
+    #
+    @classmethod
+    def load(cls, directory, version=None):
+        """
+        Memory-map the saved ``version``, or the current one, from
+        ``directory``. Returns ``None`` if there is none.
+        """
+        try:
+            if version is None:
+                with open(os.path.join(directory, CURRENT)) as f:
+                    version = f.read().strip()
+            arrays = {name: np.load(os.path.join(directory, version,
+                                                 name + '.npy'),
+                                    mmap_mode='r')
+                      for name in ARRAYS}
+        except (OSError, ValueError):
+            return None
+        return cls(version, **arrays)
+
+    def save(self, directory):
+        """
+        Write these distances as a new version in ``directory`` and make it
+        the current one. Readers only ever see complete versions.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.fingerprint)
+        if not os.path.isdir(path):
+            temporary = tempfile.mkdtemp(prefix='.tmp-', dir=directory)
+            for name in ARRAYS:
+                np.save(os.path.join(temporary, name + '.npy'),
+                        getattr(self, name))
+            try:
+                os.rename(temporary, path)
+            except OSError:
+                # Another process saved the same version first
+                shutil.rmtree(temporary, ignore_errors=True)
+        pointer = tempfile.NamedTemporaryFile('w', prefix='.tmp-',
+                                              dir=directory, delete=False)
+        with pointer:
+            pointer.write(self.fingerprint)
+        os.replace(pointer.name, os.path.join(directory, CURRENT))
+
+        versions = sorted((entry for entry in os.listdir(directory)
+                           if entry != CURRENT and not entry.startswith('.')),
+                          key=lambda entry: os.path.getmtime(
+                              os.path.join(directory, entry)))
+        for version in versions[:-KEEP_VERSIONS]:
+            if version != self.fingerprint:
+                shutil.rmtree(os.path.join(directory, version),
+                              ignore_errors=True)
+
+
+def nearest_rows(dist):
+    """
+    The row of the smallest reachable distance in each column of ``dist``.
+    """
+    if not len(dist):
+        return np.full(dist.shape[1], UNREACHABLE, dtype=np.int64)
+    reachable = dist != UNREACHABLE
+    masked = np.where(reachable, dist, np.iinfo(np.int64).max)
+    return np.where(reachable.any(axis=0), masked.argmin(axis=0), UNREACHABLE)
+
+
+def edge_keys(offsets, targets):
+    """
+    Encode each undirected edge of an adjacency array once as
+    ``low * n + high``.
+    """
+    n = len(offsets) - 1
+    sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets))
+    lower = sources < targets
+    return sources[lower] * n + targets[lower]
+
+
+def repair(graph, dist, pred, removed, added, changed):
+    """
+    Bring one hub's ``dist`` and ``pred`` lists up to date with ``graph``
+    after the ``removed`` and ``added`` ``(a, b)`` edges and the ``changed``
+    node costs.
+
+    Nodes whose cheapest path used a removed edge or passes a changed node
+    are forgotten and found again from their neighbours. Everything else
+    keeps its distance unless a new edge or cheaper node makes it shorter,
+    which Dijkstra spreads from the nodes it touches.
+    """
+    roots = set(changed)
+    for a, b in removed:
+        if pred[b] == a:
+            roots.add(b)
+        if pred[a] == b:
+            roots.add(a)
+    affected = set()
+    if roots:
+        children = defaultdict(list)
+        for i, p in enumerate(pred):
+            if p != -1:
+                children[p].append(i)
+        stack = list(roots)
+        while stack:
+            i = stack.pop()
+            if i not in affected:
+                affected.add(i)
+                stack.extend(children[i])
+
+    offsets, targets, costs = graph.offsets, graph.targets, graph.costs
+    # The hub has no path to lose, so it is never affected
+    for i in affected:
+        dist[i] = None
+        pred[i] = -1
+    heap = []
+    for i in affected:
+        for j in targets[offsets[i]:offsets[i + 1]]:
+            if j not in affected and dist[j] is not None:
+                d = dist[j] + costs[i]
+                if dist[i] is None or d < dist[i]:
+                    dist[i] = d
+                    pred[i] = j
+        if dist[i] is not None:
+            heap.append((dist[i], i))
+    for a, b in added:
+        for i, j in ((a, b), (b, a)):
+            if dist[i] is not None:
+                d = dist[i] + costs[j]
+                if dist[j] is None or d < dist[j]:
+                    dist[j] = d
+                    pred[j] = i
+                    heap.append((d, j))
+    heapq.heapify(heap)
+
+    while heap:
+        d, i = heapq.heappop(heap)
+        if d > dist[i]:
+            continue
+        for j in targets[offsets[i]:offsets[i + 1]]:
+            nd = d + costs[j]
+            if dist[j] is None or nd < dist[j]:
+                dist[j] = nd
+                pred[j] = i
+                heapq.heappush(heap, (nd, j))
+
+
+_distances = None
+_distances_lock = threading.Lock()
+
+
+def get_hub_distances(graph=None):
+    """
+    Return the :class:`HubDistances` for ``graph``, or the shared graph.
+
+    The saved version for the graph is mapped if there is one. Otherwise the
+    current version is repaired, or everything recomputed, and saved for the
+    other workers.
+    """
+    global _distances
+    if graph is None:
+        graph = get_graph()
+    distances = _distances
+    if distances is not None and distances.fingerprint == graph.fingerprint:
+        return distances
+    with _distances_lock:
+        if _distances is None or _distances.fingerprint != graph.fingerprint:
+            directory = settings.HUB_DISTANCE_DIR
+            distances = HubDistances.load(directory, graph.fingerprint)
+            if distances is None:
+                base = _distances or HubDistances.load(directory)
+                distances = base.updated(graph) if base is not None else None
+                if distances is None:
+                    distances = HubDistances.compute(graph)
+                distances.save(directory)
+                # Map the saved copy so this worker shares it too
+                distances = HubDistances.load(directory, graph.fingerprint) or \
+                    distances
+            _distances = distances
+        return _distances
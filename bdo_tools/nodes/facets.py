@@ -0,0 +1,249 @@
+"""
+Filters and facet counts for the node and property lists.
+
+:class:`FacetFilterForm` reads the filters from the query string and
+:class:`Faceting` applies them to a list and counts, for each option of every
+facet, the rows picking it would leave. Each facet is counted with the
+filters of the other facets applied, so picking an option keeps the other
+options of its facet in view. Everything comes from one query, a ``UNION
+ALL`` of one ``GROUP BY`` per facet, whatever the number of options.
+Stations and their levels are counted from the
+:model:`nodes.StationAvailability` rollup.
+
+Counting every facet still reads most of the rollup, so the counts of each
+combination of filters are cached for ``FACET_CACHE_TIMEOUT`` seconds. The
+signal handlers drop them when this process edits the data; edits made by
+other processes show once they expire.
+"""
+from collections import OrderedDict, namedtuple
+import itertools
+
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, IntegerField, Q, \
+    Value, When
+
+from .models import Resource, StationAvailability
+
+FacetOption = namedtuple('FacetOption', ['value', 'label', 'count',
+                                         'selected'])
+
+
+class FacetFilterForm(forms.Form):
+    """
+    Every filter of the lists. A list ignores those it has no facet for.
+    """
+    territory = forms.IntegerField(required=False)
+    kingdom = forms.IntegerField(required=False)
+    is_hub = forms.TypedChoiceField(required=False,
+                                    choices=[('true', 'true'),
+                                             ('false', 'false')],
+                                    coerce=lambda value: value == 'true',
+                                    empty_value=None)
+    material = forms.IntegerField(required=False)
+    station = forms.IntegerField(required=False)
+    min_level = forms.IntegerField(required=False, min_value=0)
+    max_level = forms.IntegerField(required=False, min_value=0)
+    min_cost = forms.IntegerField(required=False, min_value=0)
+    max_cost = forms.IntegerField(required=False, min_value=0)
+
+
+# facet: (option, label) lookups from the node of each row
+NODE_FACETS = {
+    'territory': ('territory_id', 'territory__name'),
+    'kingdom': ('territory__kingdom_id', 'territory__kingdom__name'),
+    'is_hub': ('is_hub', None),
+    'cost': ('contribution_cost', None),
+}
+
+# Facets filtered by a range of ``min_<facet>`` and ``max_<facet>``
+RANGE_FACETS = ('level', 'cost')
+
+HUB_LABELS = {True: 'Hub', False: 'Not a hub'}
+
+# Part of every cache key, moved on by invalidate_facet_counts()
+_generations = itertools.count()
+_generation = next(_generations)
+
+
+def invalidate_facet_counts():
+    """
+    Retire every cached facet count of this process.
+    """
+    global _generation
+    _generation = next(_generations)
+
+
+class Faceting:
+    """
+    Filter and facet ``queryset``. ``node`` is the lookup from its rows to
+    their :model:`nodes.Node`, empty for nodes themselves, and ``owner`` the
+    field of the rollup and of resources that points at its rows.
+    """
+    def __init__(self, queryset, facets, node='', owner='node_id'):
+        self.queryset = queryset.order_by()
+        self.facets = facets
+        self.node = node
+        self.owner = owner
+
+    def lookup(self, field):
+        return self.node + field
+
+    def is_set(self, data, facet):
+        if facet in RANGE_FACETS:
+            return data.get('min_' + facet) is not None or \
+                data.get('max_' + facet) is not None
+        return data.get(facet) is not None
+
+    def availability(self, data, exclude=None):
+        """
+        Lookups on the rollup for the station and level filters.
+        """
+        lookups = {}
+        if 'station' in self.facets and exclude != 'station' and \
+                data.get('station') is not None:
+            lookups['station_id'] = data['station']
+        if 'level' in self.facets and exclude != 'level':
+            if data.get('min_level') is not None:
+                lookups['max_level__gte'] = data['min_level']
+            if data.get('max_level') is not None:
+                lookups['max_level__lte'] = data['max_level']
+        return lookups
+
+    def conditions(self, data, exclude=None):
+        """
+        A ``Q`` for every filter in ``data`` except that of facet ``exclude``.
+        """
+        condition = Q()
+        for facet in self.facets:
+            if facet == exclude or not self.is_set(data, facet) or \
+                    facet in ('station', 'level'):
+                continue
+            if facet == 'material':
+                nodes = Resource.objects.filter(material_id=data['material'])\
+                                        .values('node_id')
+                condition &= Q(**{self.lookup('pk__in'): nodes})
+            elif facet in RANGE_FACETS:
+                field = self.lookup(NODE_FACETS[facet][0])
+                if data.get('min_' + facet) is not None:
+                    condition &= Q(**{field + '__gte': data['min_' + facet]})
+                if data.get('max_' + facet) is not None:
+                    condition &= Q(**{field + '__lte': data['max_' + facet]})
+            else:
+                condition &= Q(**{self.lookup(NODE_FACETS[facet][0]):
+                                  data[facet]})
+        lookups = self.availability(data, exclude)
+        if lookups:
+            rows = StationAvailability.objects.filter(**lookups)\
+                                              .values(self.owner)
+            condition &= Q(pk__in=rows)
+        return condition
+
+    def filter(self, data):
+        return self.queryset.filter(self.conditions(data))
+
+    def facet_queryset(self, facet, data):
+        """
+        ``(facet, option, label, count)`` rows for the options of ``facet``.
+        """
+        condition = self.conditions(data, exclude=facet)
+        rows = self.queryset.filter(condition)
+        name = Value(facet, output_field=CharField())
+        if facet in NODE_FACETS:
+            option, label = NODE_FACETS[facet]
+            if facet == 'is_hub':
+                # Booleans and integers can't share a column of the union
+                value = Case(When(**{self.lookup('is_hub'): True}, then=1),
+                             default=0, output_field=IntegerField())
+            else:
+                value = F(self.lookup(option))
+            label = F(self.lookup(label)) if label else \
+                Value('', output_field=CharField())
+            queryset = rows.annotate(facet_name=name, facet_option=value,
+                                     facet_label=label)
+            count = Count('pk')
+        elif facet == 'material':
+            resources = Resource.objects.all()
+            if condition:
+                resources = resources.filter(node__in=rows)
+            queryset = resources.annotate(
+                facet_name=name, facet_option=F('material_id'),
+                facet_label=F('material__name'))
+            count = Count('node_id', distinct=True)
+        else:
+            availability = StationAvailability.objects.filter(
+                **self.availability(data, exclude=facet))
+            if facet == 'station':
+                option, label = F('station_id'), F('station__name')
+            else:
+                option = F('max_level')
+                label = Value('', output_field=CharField())
+            if condition:
+                availability = availability.filter(
+                    **{self.owner + '__in': rows.values('pk')})
+            queryset = availability.annotate(facet_name=name,
+                                             facet_option=option,
+                                             facet_label=label)
+            count = Count(self.owner, distinct=True)
+        return queryset.values_list('facet_name', 'facet_option',
+                                    'facet_label')\
+                       .annotate(facet_count=count).order_by()
+
+    def counts(self, data):
+        """
+        Return the number of rows matching ``data`` and an ``OrderedDict`` of
+        :class:`FacetOption` lists by facet, from one query.
+        """
+        total = self.filter(data).annotate(
+            facet_name=Value('', output_field=CharField()),
+            facet_option=Value(0, output_field=IntegerField()),
+            facet_label=Value('', output_field=CharField()))\
+            .values_list('facet_name', 'facet_option', 'facet_label')\
+            .annotate(facet_count=Count('pk')).order_by()
+        querysets = [self.facet_queryset(facet, data) for facet in self.facets]
+        options = OrderedDict((facet, []) for facet in self.facets)
+        count = 0
+        for facet, option, label, n in total.union(*querysets, all=True):
+            if not facet:
+                count += n
+            elif option is not None:
+                options[facet].append(self.option(facet, option, label, n,
+                                                  data))
+        for facet, values in options.items():
+            if facet in RANGE_FACETS or facet == 'is_hub':
+                values.sort(key=lambda o: o.value)
+            else:
+                values.sort(key=lambda o: (o.label, o.value))
+        return count, options
+
+    def option(self, facet, value, label, count, data):
+        if facet == 'is_hub':
+            value = bool(value)
+            label = HUB_LABELS[value]
+        elif facet in RANGE_FACETS:
+            label = str(value)
+        if facet in RANGE_FACETS:
+            low, high = data.get('min_' + facet), data.get('max_' + facet)
+            selected = self.is_set(data, facet) and \
+                (low is None or value >= low) and \
+                (high is None or value <= high)
+        else:
+            selected = data.get(facet) == value
+        return FacetOption(value=value, label=label, count=count,
+                           selected=selected)
+
+    def cached_counts(self, data):
+        """
+        :meth:`counts`, from the cache when this combination of filters was
+        counted recently.
+        """
+        filters = sorted((key, value) for key, value in data.items()
+                         if value is not None)
+        key = 'facets:{}:{}:{}'.format(self.queryset.model._meta.label_lower,
+                                       _generation, filters)
+        counts = cache.get(key)
+        if counts is None:
+            counts = self.counts(data)
+            cache.set(key, counts, settings.FACET_CACHE_TIMEOUT)
+        return counts
@@ -0,0 +1,214 @@
+"""
+Synthetic worlds for benchmarks.
+
+:func:`generate_world` fills the database with a seeded, realistic looking
+world: kingdoms split into territories, nodes laid out on a grid and joined into
+a planar-ish network, resources on some nodes, small trees of properties with
+their stations, and recipe trees. Every row is inserted with ``bulk_create``, so
+no signal handlers run and tens of thousands of rows take seconds.
+"""
+from collections import namedtuple
+import math
+import random
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from crafting.bom import invalidate_recipe_graph
+from crafting.planner import invalidate_production_index
+from crafting.models import Material, Recipe, RecipeInput, RecipeOutput, Station
+from . import graph
+from .availability import rebuild_station_availability
+from .models import Kingdom, Node, Property, PropertyStation, Resource, Territory
+
+WorldSize = namedtuple('WorldSize', ['kingdoms', 'territories', 'nodes', 'edges',
+                                     'resources', 'properties',
+                                     'property_stations', 'materials',
+                                     'stations', 'recipes'])
+
+BATCH_SIZE = 1000
+
+
+def bulk_create(model, objects):
+    """
+    Insert ``objects`` in batches of at most ``BATCH_SIZE`` rows, or fewer if
+    the database limits the size of a statement.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if not field.primary_key]
+    batch_size = min(BATCH_SIZE,
+                     connection.ops.bulk_batch_size(fields, objects) or BATCH_SIZE)
+    model.objects.bulk_create(objects, batch_size=max(batch_size, 1))
+
+
+def bulk_create_ids(model, objects):
+    """
+    Insert ``objects`` and return their new ids in order. Only PostgreSQL sets
+    the ids on the objects, so they are read back instead.
+    """
+    last = model.objects.aggregate(last=Max('id'))['last'] or 0
+    bulk_create(model, objects)
+    return list(model.objects.filter(id__gt=last)
+                             .order_by('id')
+                             .values_list('id', flat=True))
+
+
+def grid_edges(rows, columns, rng, link_chance=0.7, diagonal_chance=0.2):
+    """
+    Return ``(a, b)`` index pairs joining a ``rows`` x ``columns`` grid.
+
+    Each row is a chain and the first column links every row, so the network
+    is always connected. Other vertical links and one diagonal per cell are
+    random, and never cross, like roads on a map.
+    """
+    edges = []
+    for row in range(rows):
+        for column in range(columns):
+            i = row * columns + column
+            if column:
+                edges.append((i - 1, i))
+            if row and (not column or rng.random() < link_chance):
+                edges.append((i - columns, i))
+            if row and column and rng.random() < diagonal_chance:
+                if rng.random() < 0.5:
+                    edges.append((i - columns - 1, i))
+                else:
+                    edges.append((i - columns, i - 1))
+    return edges
+
+
+@transaction.atomic
+def generate_world(kingdoms=5, territories_per_kingdom=4, nodes=2000,
+                   hub_every=8, materials=200, stations=40, recipes=100,
+                   resource_chance=0.3, properties_per_node=3,
+                   property_depth=2, stations_per_property=2, seed=0,
+                   prefix='Generated'):
+    """
+    Generate a world and return its :class:`WorldSize`.
+
+    Nodes sit on a grid of roughly ``nodes`` cells, each territory owns a
+    contiguous block of it and each kingdom a run of territories. Every
+    ``hub_every``-th row and column crossing is a hub. Names start with
+    ``prefix``, which must differ between worlds in the same database.
+    """
+    rng = random.Random(seed)
+
+    def named(kind, count):
+        return ['{} {} {}'.format(prefix, kind, i + 1) for i in range(count)]
+
+    kingdom_ids = bulk_create_ids(
+        Kingdom, [Kingdom(name=name) for name in named('Kingdom', kingdoms)])
+    territory_count = kingdoms * territories_per_kingdom
+    territory_ids = bulk_create_ids(
+        Territory, [Territory(name=name,
+                              kingdom_id=kingdom_ids[i // territories_per_kingdom])
+                    for i, name in enumerate(named('Territory', territory_count))])
+    material_ids = bulk_create_ids(
+        Material, [Material(name=name) for name in named('Material', materials)])
+    station_ids = bulk_create_ids(
+        Station, [Station(name=name) for name in named('Station', stations)])
+
+    # Recipe i makes one of the last materials from earlier ones, so the
+    # recipe graph has no cycles and the first materials are raw
+    recipes = min(recipes, max(materials - 1, 0))
+    recipe_ids = bulk_create_ids(
+        Recipe, [Recipe(name=name,
+                        station_id=rng.choice(station_ids) if station_ids else None)
+                 for name in named('Recipe', recipes)])
+    recipe_inputs = []
+    recipe_outputs = []
+    for i, recipe_id in enumerate(recipe_ids):
+        output = materials - recipes + i
+        recipe_outputs.append(RecipeOutput(recipe_id=recipe_id,
+                                           material_id=material_ids[output],
+                                           quantity=rng.randint(1, 2)))
+        for index in rng.sample(range(output), min(rng.randint(1, 3), output)):
+            recipe_inputs.append(RecipeInput(recipe_id=recipe_id,
+                                             material_id=material_ids[index],
+                                             quantity=rng.randint(1, 5)))
+    bulk_create(RecipeInput, recipe_inputs)
+    bulk_create(RecipeOutput, recipe_outputs)
+
+    # Territories tile the grid in blocks
+    columns = max(1, int(round(math.sqrt(nodes))))
+    rows = int(math.ceil(nodes / columns))
+    tile_columns = max(1, int(math.ceil(math.sqrt(territory_count))))
+    tile_rows = int(math.ceil(territory_count / tile_columns))
+
+    def territory_of(row, column):
+        tile = (row * tile_rows // rows) * tile_columns + \
+            column * tile_columns // columns
+        return territory_ids[tile * territory_count // (tile_rows * tile_columns)]
+
+    new_nodes = []
+    for i, name in enumerate(named('Node', rows * columns)):
+        row, column = divmod(i, columns)
+        is_hub = row % hub_every == 0 and column % hub_every == 0
+        new_nodes.append(Node(
+            name=name,
+            territory_id=territory_of(row, column),
+            is_hub=is_hub,
+            contribution_cost=None if is_hub else rng.randint(1, 3),
+            node_manager=None if is_hub else '{} Manager {}'.format(prefix,
+                                                                    i + 1)))
+    node_ids = bulk_create_ids(Node, new_nodes)
+
+    # The self relation is symmetrical, so each edge is stored both ways
+    edges = [(node_ids[a], node_ids[b])
+             for a, b in grid_edges(rows, columns, rng)]
+    Through = Node.connected_nodes.through
+    bulk_create(Through,
+                [Through(from_node_id=a, to_node_id=b) for a, b in edges] +
+                [Through(from_node_id=b, to_node_id=a) for a, b in edges])
+
+    new_resources = []
+    for node_id in node_ids:
+        if rng.random() < resource_chance:
+            for material_id in rng.sample(material_ids,
+                                          min(rng.randint(1, 2), materials)):
+                new_resources.append(Resource(node_id=node_id,
+                                              material_id=material_id,
+                                              contribution_cost=rng.randint(1, 3)))
+    bulk_create(Resource, new_resources)
+
+    # Each level of the property trees needs the ids of the one above it
+    property_ids = []
+    parents = [(node_id, None) for node_id in node_ids]
+    for depth in range(property_depth):
+        level = []
+        for node_id, parent_id in parents:
+            count = rng.randint(1, properties_per_node) if depth == 0 else \
+                rng.randint(0, properties_per_node - 1)
+            for _ in range(count):
+                level.append(Property(name='{} Property {}'.format(
+                                          prefix, len(property_ids) + len(level) + 1),
+                                      node_id=node_id,
+                                      parent_property_id=parent_id))
+        ids = bulk_create_ids(Property, level)
+        property_ids.extend(ids)
+        parents = [(p.node_id, id) for p, id in zip(level, ids)]
+
+    new_property_stations = []
+    for property_id in property_ids:
+        for station_id in rng.sample(station_ids,
+                                     min(stations_per_property, stations)):
+            new_property_stations.append(PropertyStation(
+                property_id=property_id, station_id=station_id,
+                max_level=rng.randint(1, 5)))
+    bulk_create(PropertyStation, new_property_stations)
+    rebuild_station_availability()
+
+    # bulk_create skips the signals that keep these current
+    transaction.on_commit(graph.invalidate_graph)
+    transaction.on_commit(invalidate_recipe_graph)
+    transaction.on_commit(invalidate_production_index)
+    return WorldSize(kingdoms=len(kingdom_ids),
+                     territories=len(territory_ids),
+                     nodes=len(node_ids),
+                     edges=len(edges),
+                     resources=len(new_resources),
+                     properties=len(property_ids),
+                     property_stations=len(new_property_stations),
+                     materials=len(material_ids),
+                     stations=len(station_ids),
+                     recipes=recipes)
@@ -0,0 +1,191 @@
+"""
+An in-memory copy of the :model:`nodes.Node` network for route questions.
+
+The ORM only knows about ``Node.connected_nodes`` one hop at a time, which
+turns a single route question into hundreds of queries. :class:`NodeGraph` is
+built with two queries and keeps the network as compact adjacency arrays, so
+route queries never touch the database.
+"""
+from array import array
+from collections import namedtuple
+import hashlib
+import heapq
+
+from bdo_tools.shared_cache import SharedCache
+
+Path = namedtuple('Path', ['cost', 'nodes'])
+
+
+class NodeGraph:
+    """
+    The node network stored as compressed adjacency arrays.
+
+    Nodes are addressed internally by a dense index. ``ids``, ``names``,
+    ``is_hub``, ``costs`` and ``territories`` are indexed by it, and the
+    neighbours of the node at index ``i`` are
+    ``targets[offsets[i]:offsets[i + 1]]``.
+
+    Moving along a path costs the ``contribution_cost`` of each node entered.
+    Hubs are free and a missing cost counts as zero.
+    """
+    def __init__(self, nodes, edges):
+        """
+        ``nodes`` is an iterable of ``(id, name, is_hub, contribution_cost)``,
+        optionally followed by a territory id, and ``edges`` an iterable of
+        ``(from_id, to_id)`` pairs. Edges are undirected; listing both
+        directions is allowed.
+        """
+        self.ids = array('l')
+        self.names = []
+        self.is_hub = array('b')
+        self.costs = array('l')
+        self.territories = array('l')
+        self.index = {}
+        for node_id, name, is_hub, cost, *territory in nodes:
+            self.index[node_id] = len(self.ids)
+            self.ids.append(node_id)
+            self.names.append(name)
+            self.is_hub.append(bool(is_hub))
+            self.costs.append(0 if is_hub or cost is None else cost)
+            self.territories.append(territory[0] if territory else 0)
+
+        neighbours = [set() for _ in self.ids]
+        for from_id, to_id in edges:
+            a, b = self.index[from_id], self.index[to_id]
+            if a != b:
+                neighbours[a].add(b)
+                neighbours[b].add(a)
+
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        for adjacent in neighbours:
+            self.targets.extend(sorted(adjacent))
+            self.offsets.append(len(self.targets))
+
+        self.hubs = [i for i, hub in enumerate(self.is_hub) if hub]
+        self._hub_paths = None
+
+        # Identifies everything routes depend on, for results kept elsewhere
+        digest = hashlib.sha1()
+        for values in (self.ids, self.is_hub, self.costs, self.territories,
+                       self.offsets, self.targets):
+            digest.update(values.tobytes())
+        self.fingerprint = digest.hexdigest()
+
+    @classmethod
+    def from_db(cls):
+        """
+        Build the graph from the database with one query for the nodes and
+        one for the ``connected_nodes`` table.
+        """
+        from .models import Node
+
+        nodes = Node.objects.order_by('id').values_list('id', 'name', 'is_hub',
+                                                        'contribution_cost',
+                                                        'territory_id')
+        edges = Node.connected_nodes.through.objects\
+                                            .values_list('from_node_id',
+                                                         'to_node_id')
+        return cls(nodes.iterator(), edges.iterator())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, node_id):
+        return node_id in self.index
+
+    def neighbours(self, node_id):
+        """
+        Return the ids of the nodes connected to ``node_id``.
+        """
+        i = self.index[node_id]
+        return [self.ids[j]
+                for j in self.targets[self.offsets[i]:self.offsets[i + 1]]]
+
+    def shortest_paths(self, sources, stop_at=None):
+        """
+        Run Dijkstra from every index in ``sources`` at once.
+
+        Returns ``(dist, prev)`` lists indexed by node index. Unreachable nodes
+        have a distance of ``None`` and sources have a ``prev`` of ``-1``. If
+        ``stop_at`` is a set of indexes the search ends as soon as the first of
+        them is settled, and only the distances up to it are final.
+        """
+        dist = [None] * len(self.ids)
+        prev = [-1] * len(self.ids)
+        heap = []
+        for source in sources:
+            dist[source] = 0
+            heap.append((0, source))
+        heapq.heapify(heap)
+
+        offsets, targets, costs = self.offsets, self.targets, self.costs
+        while heap:
+            d, i = heapq.heappop(heap)
+            if d > dist[i]:
+                continue
+            if stop_at is not None and i in stop_at:
+                break
+            for j in targets[offsets[i]:offsets[i + 1]]:
+                nd = d + costs[j]
+                if dist[j] is None or nd < dist[j]:
+                    dist[j] = nd
+                    prev[j] = i
+                    heapq.heappush(heap, (nd, j))
+        return dist, prev
+
+    def walk_back(self, prev, i):
+        """
+        Follow ``prev`` from index ``i`` back to its source and return the
+        indexes in source-first order.
+        """
+        indexes = [i]
+        while prev[i] != -1:
+            i = prev[i]
+            indexes.append(i)
+        indexes.reverse()
+        return indexes
+
+    def hub_paths(self):
+        """
+        Return the ``(dist, prev)`` shortest path tree from all hubs,
+        computing it on the first call.
+        """
+        if self._hub_paths is None:
+            self._hub_paths = self.shortest_paths(self.hubs)
+        return self._hub_paths
+
+    def cheapest_path(self, node_id):
+        """
+        Return the cheapest :class:`Path` from the nearest hub to
+        ``node_id``, or ``None`` when no hub can reach it.
+
+        The shortest path tree from all hubs is computed on the first call
+        and reused, so each query only walks the path itself.
+        """
+        target = self.index[node_id]
+        dist, prev = self.hub_paths()
+        if dist[target] is None:
+            return None
+        return Path(cost=dist[target],
+                    nodes=[self.ids[i] for i in self.walk_back(prev, target)])
+
+
+# Edges have no timestamp of their own; changing them marks both nodes as
+# modified
+_graph = SharedCache(NodeGraph.from_db, ['nodes.Node'])
+
+
+def get_graph():
+    """
+    Return the shared :class:`NodeGraph`, building it if needed and
+    rebuilding it if another process changed the nodes since the last check.
+    """
+    return _graph.get()
+
+
+def invalidate_graph():
+    """
+    Drop the shared :class:`NodeGraph` so the next request rebuilds it.
+    """
+    _graph.invalidate()
@@ -0,0 +1,503 @@
+"""
+Bulk import of game data dumps.
+
+A dump is a directory with one file per kind of record, named after the kind
+(``kingdoms``, ``territories``, ``materials``, ``stations``, ``nodes``,
+``edges``, ``resources``, ``properties`` and ``property_stations``) with a
+``.csv`` or ``.jsonl`` extension. Related objects are referred to by name:
+
+=================  ==========================================================
+kingdoms           name
+territories        name, kingdom
+materials          name
+stations           name
+nodes              name, territory, is_hub, contribution_cost, node_manager
+edges              node, node_territory, connected_node,
+                   connected_node_territory
+resources          node, node_territory, material, contribution_cost
+properties         name, node, node_territory, parent_property (a property
+                   of the same node)
+property_stations  node, node_territory, property, station, max_level
+=================  ==========================================================
+
+Node names are only unique within a territory, so nodes are matched on their
+name and territory and references to a node name its territory too. The
+``*_territory`` columns may be left out where the node name is unique. A dump
+with two records for the same row, or a reference matching more than one row,
+is rejected.
+
+Records are parsed one at a time and written in batches, each in its own
+transaction. Foreign keys are resolved through name to id maps loaded with one
+query per model, new rows are inserted with ``bulk_create`` and existing rows,
+matched on their natural key, are updated with one ``UPDATE`` per batch. Memory
+use grows with the number of distinct keys, not the size of the files.
+"""
+from collections import Counter, OrderedDict
+import csv
+import itertools
+import json
+import os
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from crafting.models import Material, Station
+from crafting.planner import invalidate_production_index
+from jobs.queue import enqueue_on_commit
+from . import graph
+from .availability import rebuild_station_availability
+from .models import Kingdom, Node, Property, PropertyStation, Resource, Territory
+from .page_cache import get_detail_cache
+from .snapshot import invalidate_version
+
+BATCH_SIZE = 1000
+
+# (kind, model, natural key fields, other fields) in import order
+KINDS = [
+    ('kingdoms', Kingdom, ('name',), ()),
+    ('territories', Territory, ('name',), ('kingdom_id',)),
+    ('materials', Material, ('name',), ()),
+    ('stations', Station, ('name',), ()),
+    ('nodes', Node, ('territory_id', 'name'), ('is_hub', 'contribution_cost',
+                                               'node_manager')),
+    ('edges', None, None, None),
+    ('resources', Resource, ('node_id', 'material_id'), ('contribution_cost',)),
+    ('properties', Property, ('node_id', 'name'), ('parent_property_id',)),
+    ('property_stations', PropertyStation, ('property_id', 'station_id'),
+     ('max_level',)),
+]
+
+# Sync deletes these when they are missing from the dump. The others are only
+# referred to by name and are kept.
+SYNC_DELETES = (Node, Resource, Property, PropertyStation)
+
+
+class WorldImportError(ValueError):
+    """Raised when a dump cannot be imported"""
+
+
+def read_records(path):
+    """
+    Yield the records of a ``.csv`` or ``.jsonl`` file as dicts, one at a time.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def to_str(value):
+    return None if value is None or value == '' else str(value)
+
+
+def to_int(value):
+    return None if value is None or value == '' else int(value)
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def bulk_update(model, objects, fields, modified):
+    """
+    Save ``fields`` of the existing ``objects`` with one ``UPDATE`` per chunk.
+
+    ``update()`` skips ``auto_now``, so ``modified`` is set explicitly.
+    """
+    # Each row costs a parameter per field and one for its primary key
+    size = connection.ops.bulk_batch_size([None] * (2 * len(fields) + 1),
+                                          objects)
+    for chunk in batched(objects, max(size, 1)):
+        values = {
+            field: Case(*[When(pk=obj.pk, then=Value(getattr(obj, field)))
+                          for obj in chunk],
+                        output_field=model._meta.get_field(field))
+            for field in fields
+        }
+        model.objects.filter(pk__in=[obj.pk for obj in chunk])\
+                     .update(modified=modified, **values)
+
+
+class WorldImporter:
+    """
+    Import the dump in ``directory``.
+
+    With ``sync``, rows whose fields hash the same as their record are left
+    alone and nodes, edges, resources, properties and property stations
+    missing from the dump are deleted, so importing an unchanged world writes nothing and
+    keeps every ``modified`` timestamp. ``changes`` then lists the
+    ``(kind, action, key)`` of each row written.
+
+    :meth:`run` returns a report mapping each imported kind to a
+    :class:`~collections.Counter` of ``created``, ``updated``, ``unchanged``
+    and ``deleted`` rows.
+    """
+    def __init__(self, directory, batch_size=BATCH_SIZE, sync=False):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.sync = sync
+        self.ids = {}
+        self.hashes = {}
+        self.ambiguous = {}
+        self.node_names = None
+        self.missing = []
+        self.changes = []
+        self.report = OrderedDict()
+
+    def find(self, kind):
+        for extension in ('.csv', '.jsonl'):
+            path = os.path.join(self.directory, kind + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def run(self):
+        if not os.path.isdir(self.directory):
+            raise WorldImportError('No directory {}'.format(self.directory))
+        self.modified = timezone.now()
+        for kind, model, key_fields, fields in KINDS:
+            path = self.find(kind)
+            if path is None:
+                continue
+            self.report[kind] = Counter()
+            if model is None:
+                self.import_edges(read_records(path))
+            else:
+                self.import_rows(kind, model, key_fields, fields,
+                                 read_records(path))
+        # Children go first so that cascades don't delete rows counted later
+        for kind, model, pks in reversed(self.missing):
+            self.delete(kind, model, pks)
+
+        if any(counts['created'] or counts['updated'] or counts['deleted']
+               for counts in self.report.values()):
+            # Bulk writes skip the signals that keep these current
+            graph.invalidate_graph()
+            invalidate_production_index()
+            invalidate_version()
+            enqueue_on_commit('nodes.build_snapshot')
+            rebuild_station_availability()
+            get_detail_cache().clear()
+        return self.report
+
+    #
+    # Name to id maps
+    #
+    def get_ids(self, model):
+        if model not in self.ids:
+            _, key_fields, fields = self.get_kind(model)
+            ids = self.ids[model] = {}
+            hashes = self.hashes[model] = {}
+            ambiguous = self.ambiguous[model] = set()
+            columns = key_fields + fields if self.sync else key_fields
+            rows = model.objects.values_list('id', *columns).iterator()
+            for row in rows:
+                key = row[1:len(key_fields) + 1]
+                if key in ids:
+                    ambiguous.add(key)
+                ids[key] = row[0]
+                if self.sync:
+                    hashes[row[0]] = hash(row[len(key_fields) + 1:])
+        return self.ids[model]
+
+    def get_kind(self, model):
+        return next((kind, key_fields, fields)
+                    for kind, m, key_fields, fields in KINDS if m is model)
+
+    def resolve(self, model, *key):
+        ids = self.get_ids(model)
+        if key in self.ambiguous[model]:
+            raise WorldImportError('More than one {} {}'.format(
+                model._meta.verbose_name, ' / '.join(str(k) for k in key)))
+        try:
+            return ids[key]
+        except KeyError:
+            raise WorldImportError('Unknown {} {}'.format(
+                model._meta.verbose_name, ' / '.join(str(k) for k in key)))
+
+    def node_id(self, record, field='node'):
+        """
+        The id of the node named by ``field`` of ``record`` in the territory
+        named by ``<field>_territory``, or anywhere if that is left out.
+        """
+        name = record[field]
+        territory = to_str(record.get(field + '_territory'))
+        if territory is not None:
+            key = (self.resolve(Territory, territory), name)
+            if key not in self.get_ids(Node):
+                raise WorldImportError('Unknown node {} / {}'.format(territory,
+                                                                     name))
+            return self.resolve(Node, *key)
+        if self.node_names is None:
+            self.node_names = {}
+            for (_, node_name), id in self.get_ids(Node).items():
+                self.node_names.setdefault(node_name, []).append(id)
+            # The id map holds one of the rows sharing an ambiguous key
+            for _, node_name in self.ambiguous[Node]:
+                self.node_names[node_name].append(None)
+        ids = self.node_names.get(name, [])
+        if len(ids) > 1:
+            raise WorldImportError(
+                'More than one node {}; give its {}_territory'.format(name,
+                                                                     field))
+        if not ids:
+            raise WorldImportError('Unknown node {}'.format(name))
+        return ids[0]
+
+    #
+    # Records to field values
+    #
+    def build_kingdoms(self, record):
+        return {'name': record['name']}
+
+    def build_territories(self, record):
+        return {'name': record['name'],
+                'kingdom_id': self.resolve(Kingdom, record['kingdom'])}
+
+    def build_materials(self, record):
+        return {'name': record['name']}
+
+    def build_stations(self, record):
+        return {'name': record['name']}
+
+    def build_nodes(self, record):
+        return {'name': record['name'],
+                'territory_id': self.resolve(Territory, record['territory']),
+                'is_hub': to_bool(record.get('is_hub')),
+                'contribution_cost': to_int(record.get('contribution_cost')),
+                'node_manager': to_str(record.get('node_manager'))}
+
+    def build_resources(self, record):
+        return {'node_id': self.node_id(record),
+                'material_id': self.resolve(Material, record['material']),
+                'contribution_cost': to_int(record['contribution_cost'])}
+
+    def build_properties(self, record):
+        node_id = self.node_id(record)
+        parent = to_str(record.get('parent_property'))
+        parent_id = None
+        if parent is not None:
+            if (node_id, parent) in self.get_ids(Property):
+                parent_id = self.resolve(Property, node_id, parent)
+            else:
+                # Try again once the parent has been written
+                self.orphans.append(record)
+                return None
+        return {'name': record['name'],
+                'node_id': node_id,
+                'parent_property_id': parent_id}
+
+    def build_property_stations(self, record):
+        node_id = self.node_id(record)
+        return {'property_id': self.resolve(Property, node_id, record['property']),
+                'station_id': self.resolve(Station, record['station']),
+                'max_level': to_int(record['max_level'])}
+
+    #
+    # Writing
+    #
+    def import_rows(self, kind, model, key_fields, fields, records):
+        build = getattr(self, 'build_' + kind)
+        seen = set()
+        self.orphans = []
+
+        def write_batch(batch):
+            rows = OrderedDict()
+            for record in batch:
+                values = build(record)
+                if values is None:
+                    continue
+                key = tuple(values[f] for f in key_fields)
+                if key in rows or key in seen:
+                    raise WorldImportError('Duplicate record in {}: {}'.format(
+                        kind, json.dumps(record, sort_keys=True)))
+                rows[key] = values
+            seen.update(rows)
+            with transaction.atomic():
+                self.write(kind, model, fields, rows)
+            return rows
+
+        for batch in batched(records, self.batch_size):
+            write_batch(batch)
+        while self.orphans:
+            orphans, self.orphans = self.orphans, []
+            if not write_batch(orphans):
+                record = self.orphans[0]
+                raise WorldImportError('Unknown property {} / {}'.format(
+                    record['node'], record['parent_property']))
+
+        if self.sync and model in SYNC_DELETES:
+            ids = self.get_ids(model)
+            missing = [key for key in ids if key not in seen]
+            self.missing.append((kind, model, [ids.pop(key) for key in missing]))
+            self.changes.extend((kind, 'deleted', key) for key in missing)
+        if model is Node:
+            self.node_names = None
+
+    def write(self, kind, model, fields, rows):
+        """
+        Insert the new and update the changed ``rows``, a dict of field values
+        by natural key.
+        """
+        ids = self.get_ids(model)
+        hashes = self.hashes[model]
+        new = OrderedDict()
+        changed = OrderedDict()
+        for key, values in rows.items():
+            if key in self.ambiguous[model]:
+                raise WorldImportError('More than one {} {}'.format(
+                    model._meta.verbose_name,
+                    ' / '.join(str(k) for k in key)))
+            if key not in ids:
+                new[key] = model(**values)
+                continue
+            if self.sync:
+                digest = hash(tuple(values[f] for f in fields))
+                if hashes.get(ids[key]) == digest:
+                    continue
+                hashes[ids[key]] = digest
+            elif not fields:
+                continue
+            changed[key] = model(pk=ids[key], **values)
+        if new:
+            model.objects.bulk_create(list(new.values()))
+            self.read_new_ids(model, list(new.values()))
+        if changed:
+            bulk_update(model, list(changed.values()), fields, self.modified)
+        counts = self.report[kind]
+        counts['created'] += len(new)
+        counts['updated'] += len(changed)
+        counts['unchanged'] += len(rows) - len(new) - len(changed)
+        if self.sync:
+            self.changes.extend((kind, 'created', key) for key in new)
+            self.changes.extend((kind, 'updated', key) for key in changed)
+
+    def read_new_ids(self, model, objects):
+        """
+        Add the ids of freshly inserted ``objects`` to the id map. Only
+        PostgreSQL sets them on the objects, so they are read back.
+        """
+        _, key_fields, fields = self.get_kind(model)
+        lookups = {'{}__in'.format(field): {getattr(obj, field) for obj in objects}
+                   for field in key_fields}
+        ids = self.get_ids(model)
+        hashes = self.hashes[model]
+        rows = model.objects.filter(**lookups)\
+                            .values_list('id', *key_fields + fields)
+        for row in rows:
+            ids[row[1:len(key_fields) + 1]] = row[0]
+            hashes[row[0]] = hash(row[len(key_fields) + 1:])
+
+    def delete(self, kind, model, pks):
+        with transaction.atomic():
+            size = connection.ops.bulk_batch_size(['id'], pks)
+            for batch in batched(pks, max(size, 1)):
+                _, deleted = model.objects.filter(pk__in=batch).delete()
+                self.report[kind]['deleted'] += deleted.get(model._meta.label, 0)
+
+    def import_edges(self, records):
+        """
+        Add the edges in ``records`` that are missing and, with ``sync``,
+        remove those that are not in ``records``. Nodes that gain or lose an
+        edge are marked as modified.
+        """
+        wanted = set()
+        for record in records:
+            a, b = self.node_id(record), self.node_id(record, 'connected_node')
+            if a != b:
+                wanted.add((min(a, b), max(a, b)))
+        Through = Node.connected_nodes.through
+        current = {}
+        for row_id, a, b in Through.objects.values_list('id', 'from_node_id',
+                                                        'to_node_id').iterator():
+            current.setdefault((min(a, b), max(a, b)), []).append(row_id)
+        added = wanted - set(current)
+        removed = set(current) - wanted if self.sync else set()
+        with transaction.atomic():
+            row_ids = [row_id for edge in removed for row_id in current[edge]]
+            size = connection.ops.bulk_batch_size(['id'], row_ids)
+            for batch in batched(row_ids, max(size, 1)):
+                Through.objects.filter(id__in=batch).delete()
+            # The self relation is symmetrical, so each edge is stored both ways
+            for batch in batched(sorted(added), self.batch_size):
+                Through.objects.bulk_create(
+                    [Through(from_node_id=a, to_node_id=b) for a, b in batch] +
+                    [Through(from_node_id=b, to_node_id=a) for a, b in batch])
+            touched = {node_id for edge in added | removed for node_id in edge}
+            size = connection.ops.bulk_batch_size(['id'], touched)
+            for batch in batched(touched, max(size, 1)):
+                Node.objects.filter(pk__in=batch).update(modified=self.modified)
+        self.report['edges']['created'] += len(added)
+        self.report['edges']['deleted'] += len(removed)
+        if self.sync:
+            self.changes.extend(('edges', 'created', edge) for edge in sorted(added))
+            self.changes.extend(('edges', 'deleted', edge)
+                                for edge in sorted(removed))
+
+
+def export_world(directory, extension='.jsonl'):
+    """
+    Write the current world to ``directory`` in the format read by
+    :class:`WorldImporter`, streaming each table.
+    """
+    Through = Node.connected_nodes.through
+    tables = [
+        ('kingdoms', Kingdom.objects.values_list('name'), ['name']),
+        ('territories', Territory.objects.values_list('name', 'kingdom__name'),
+         ['name', 'kingdom']),
+        ('materials', Material.objects.values_list('name'), ['name']),
+        ('stations', Station.objects.values_list('name'), ['name']),
+        ('nodes', Node.objects.values_list('name', 'territory__name', 'is_hub',
+                                           'contribution_cost', 'node_manager'),
+         ['name', 'territory', 'is_hub', 'contribution_cost', 'node_manager']),
+        ('edges', Through.objects.filter(from_node_id__lt=F('to_node_id'))
+                                 .values_list('from_node__name',
+                                              'from_node__territory__name',
+                                              'to_node__name',
+                                              'to_node__territory__name'),
+         ['node', 'node_territory', 'connected_node',
+          'connected_node_territory']),
+        ('resources', Resource.objects.values_list('node__name',
+                                                   'node__territory__name',
+                                                   'material__name',
+                                                   'contribution_cost'),
+         ['node', 'node_territory', 'material', 'contribution_cost']),
+        ('properties', Property.objects.values_list('name', 'node__name',
+                                                    'node__territory__name',
+                                                    'parent_property__name'),
+         ['name', 'node', 'node_territory', 'parent_property']),
+        ('property_stations',
+         PropertyStation.objects.values_list('property__node__name',
+                                             'property__node__territory__name',
+                                             'property__name', 'station__name',
+                                             'max_level'),
+         ['node', 'node_territory', 'property', 'station', 'max_level']),
+    ]
+    os.makedirs(directory, exist_ok=True)
+    for kind, rows, columns in tables:
+        path = os.path.join(directory, kind + extension)
+        with open(path, 'w', newline='') as f:
+            if extension == '.csv':
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for row in rows.order_by('id').iterator():
+                    writer.writerow(['' if value is None else value
+                                     for value in row])
+            else:
+                for row in rows.order_by('id').iterator():
+                    f.write(json.dumps(dict(zip(columns, row))) + '\n')
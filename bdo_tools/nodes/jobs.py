@@ -0,0 +1,25 @@
+"""
+Background jobs for :mod:`jobs.queue`.
+"""
+from jobs.queue import register
+from .distances import get_hub_distances
+from .graph import NodeGraph
+from .snapshot import save_current_snapshot
+
+
+@register('nodes.build_hub_distances', delay=5, max_wait=60)
+def build_hub_distances():
+    """
+    Save the hub distance matrices of the current network, so web workers map
+    them once their shared graph catches up with the edit instead of each
+    working them out.
+    """
+    get_hub_distances(NodeGraph.from_db())
+
+
+@register('nodes.build_snapshot', delay=5, max_wait=60)
+def build_snapshot():
+    """
+    Save the snapshot of the current data, so the web workers only serve it.
+    """
+    save_current_snapshot()
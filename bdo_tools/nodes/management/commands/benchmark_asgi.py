@@ -0,0 +1,161 @@
+import asyncio
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from bdo_tools.asgi import ASGIApplication
+from bdo_tools.wsgi import application as wsgi_application
+from crafting.models import Material
+from nodes.models import Kingdom, Node, Property, Resource, Territory
+from .benchmark_views import middle, reset_caches
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def request(app, path, query):
+    """
+    Send one GET through ``app`` and return its status.
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query.encode('latin-1'),
+        'headers': [(b'host', b'localhost')],
+        'server': ('localhost', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]['status']
+
+
+class Command(BaseCommand):
+    help = ('Compare tail latency of light pages under mixed traffic when '
+            'every request shares one thread pool and when planners and '
+            'routes have their own, as bdo_tools.asgi does. Run '
+            'generate_world first for meaningful numbers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300,
+                            help='Requests per run')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Requests in flight at once')
+        parser.add_argument('--heavy', type=float, default=0.2,
+                            help='Share of requests to heavy views')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def get_cases(self):
+        """
+        Return the light and heavy ``(path, query)`` lists.
+        """
+        node = middle(Node.objects.filter(is_hub=False))
+        hub = middle(Node.objects.filter(is_hub=True))
+        crafted = middle(Material.objects.filter(recipe_outputs__isnull=False)
+                                         .distinct())
+        if node is None or hub is None or crafted is None:
+            raise CommandError('No world to query; run generate_world first.')
+        light = [(reverse('nodes:nodes:list'), ''),
+                 (reverse('nodes:properties:list'), ''),
+                 (reverse('crafting:materials:list'), ''),
+                 (reverse('nodes:kingdoms:detail',
+                          kwargs={'pk': middle(Kingdom.objects.all()).pk}), ''),
+                 (reverse('nodes:territories:list'), ''),
+                 (reverse('nodes:properties:detail',
+                          kwargs={'pk': middle(Property.objects.all()).pk}), ''),
+                 (reverse('nodes:territories:detail',
+                          kwargs={'pk': middle(Territory.objects.all()).pk}), '')]
+        resource_ids = list(Resource.objects.order_by('id')
+                                            .values_list('id', flat=True))[:4]
+        heavy = [(reverse('crafting:materials:production',
+                          kwargs={'pk': crafted.pk}), 'quantity=10'),
+                 (reverse('nodes:plan'),
+                  'resources=' + ','.join(str(i) for i in resource_ids)),
+                 (reverse('nodes:nodes:route', kwargs={'pk': node.pk}),
+                  'to={}'.format(hub.pk))]
+        return light, heavy
+
+    def run(self, app, schedule, concurrency):
+        """
+        Send ``schedule`` through ``app`` and return ``(kind, ms)`` per
+        request.
+        """
+        results = []
+        pending = list(reversed(schedule))
+
+        async def client():
+            while pending:
+                kind, path, query = pending.pop()
+                start = time.perf_counter()
+                status = await request(app, path, query)
+                if status >= 500:
+                    raise CommandError('{}?{} returned {}'.format(path, query,
+                                                                  status))
+                results.append((kind, (time.perf_counter() - start) * 1000))
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.gather(
+                *[client() for _ in range(concurrency)]))
+        finally:
+            loop.close()
+        return results
+
+    def handle(self, *args, **options):
+        light, heavy = self.get_cases()
+        rng = random.Random(options['seed'])
+        schedule = []
+        for _ in range(options['requests']):
+            if rng.random() < options['heavy']:
+                schedule.append(('heavy',) + rng.choice(heavy))
+            else:
+                schedule.append(('light',) + rng.choice(light))
+
+        workers = settings.ASGI_LIGHT_WORKERS + settings.ASGI_HEAVY_WORKERS
+        modes = [
+            ('shared', ASGIApplication(wsgi_application, workers, 0,
+                                       settings.ASGI_HEAVY_VIEWS)),
+            ('split', ASGIApplication(wsgi_application,
+                                      settings.ASGI_LIGHT_WORKERS,
+                                      settings.ASGI_HEAVY_WORKERS,
+                                      settings.ASGI_HEAVY_VIEWS)),
+        ]
+        self.stdout.write('{} requests, {} in flight, {:.0%} heavy'.format(
+            len(schedule), options['concurrency'], options['heavy']))
+        self.stdout.write('{:<8} {:<6} {:>6} {:>9} {:>9} {:>9} {:>8}'.format(
+            'pools', 'kind', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s'))
+        for label, app in modes:
+            reset_caches()
+            # Warm the shared graphs so both runs start alike
+            self.run(app, [('light',) + case for case in light] +
+                     [('heavy',) + case for case in heavy], 1)
+            start = time.perf_counter()
+            results = self.run(app, schedule, options['concurrency'])
+            rate = len(results) / (time.perf_counter() - start)
+            app.shutdown()
+            for kind in ('light', 'heavy'):
+                timings = [ms for k, ms in results if k == kind]
+                if not timings:
+                    continue
+                self.stdout.write(
+                    '{:<8} {:<6} {:>6} {:>9.1f} {:>9.1f} {:>9.1f} {:>8.1f}'.format(
+                        label, kind, len(timings), percentile(timings, 0.5),
+                        percentile(timings, 0.95), percentile(timings, 0.99),
+                        rate))
@@ -0,0 +1,69 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from nodes.autocomplete import (AutocompleteIndex, get_autocomplete_index,
+                                invalidate_autocomplete_index)
+
+
+class Command(BaseCommand):
+    help = ('Measure building the in-memory autocomplete index, its size and '
+            'the latency of completions and of the endpoint, typing names '
+            'out one keystroke at a time. Run generate_world first for '
+            'meaningful numbers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=100,
+                            help='Names to type out')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            index = AutocompleteIndex.from_db()
+            build = (time.perf_counter() - start) * 1000
+            size, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if not len(index):
+            raise CommandError('No names; run generate_world first.')
+        self.stdout.write('{} names, built in {:.0f} ms, {:.1f} MiB'.format(
+            len(index), build, size / 2 ** 20))
+
+        rng = random.Random(options['seed'])
+        names = [name for type_index in index.types.values()
+                 for name in type_index.by_id.values()]
+        prefixes = [name[:length]
+                    for name in rng.sample(names, min(options['names'],
+                                                      len(names)))
+                    for length in range(1, len(name) + 1)]
+
+        timings = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            index.complete(prefix)
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        self.stdout.write('complete(): median {:.1f} us, p99 {:.1f} us'.format(
+            statistics.median(timings), timings[int(len(timings) * 0.99)]))
+
+        invalidate_autocomplete_index()
+        get_autocomplete_index()
+        hosts = [host for host in settings.ALLOWED_HOSTS if '*' not in host]
+        client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+        url = reverse('nodes:autocomplete')
+        start = time.perf_counter()
+        for prefix in prefixes:
+            if client.get(url, {'q': prefix}).status_code != 200:
+                raise CommandError('{} failed for {!r}'.format(url, prefix))
+        elapsed = time.perf_counter() - start
+        self.stdout.write('endpoint: {:.0f} requests/s on one thread, '
+                          '{:.2f} ms each'.format(len(prefixes) / elapsed,
+                                                  elapsed * 1000 / len(prefixes)))
@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from crafting.models import Material
+from nodes.generation import generate_world
+from nodes.models import Node, Territory
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compare the query plans and latencies of the hot name and hub '
+            'lookups with and without indexes on a generated world. '
+            'PostgreSQL only; nothing is kept.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Runs per query and mode')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Index benchmarks need PostgreSQL')
+        try:
+            with transaction.atomic():
+                generate_world(nodes=options['nodes'], seed=options['seed'],
+                               territories_per_kingdom=20, materials=1000,
+                               prefix='Bench')
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                for label, queryset in self.get_queries():
+                    self.measure(label, queryset, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def get_queries(self):
+        return [
+            ('Node name exact', Node.objects.filter(name='Bench Node 4242')),
+            ('Node name icontains', Node.objects.filter(name__icontains='de 424')),
+            ('Node first page by name', Node.objects.order_by('name', 'id')[:50]),
+            ('Hub nodes', Node.objects.filter(is_hub=True)),
+            ('Territory name icontains',
+             Territory.objects.filter(name__icontains='ory 4')),
+            ('Material name exact',
+             Material.objects.filter(name='Bench Material 42')),
+        ]
+
+    def measure(self, label, queryset, repeat):
+        sql, params = queryset.query.sql_with_params()
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        for mode, enabled in (('before', 'off'), ('after', 'on')):
+            with connection.cursor() as cursor:
+                # Planner switches stand in for the missing indexes; the
+                # sequential scan is the only plan left when they are off
+                for setting in ('enable_indexscan', 'enable_bitmapscan',
+                                'enable_indexonlyscan'):
+                    cursor.execute('SET LOCAL {} = {}'.format(setting, enabled))
+                cursor.execute('EXPLAIN ANALYZE ' + sql, params)
+                plan = [row[0] for row in cursor.fetchall()]
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write('  {}: median {:.2f} ms, max {:.2f} ms'.format(
+                mode, statistics.median(timings), max(timings)))
+            for line in plan:
+                self.stdout.write('    ' + line)
@@ -0,0 +1,66 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from nodes.graph import NodeGraph
+from nodes.planner import steiner_tree
+
+
+def grid_graph(side, hub_every, seed):
+    """
+    Build a ``side`` x ``side`` grid NodeGraph with a hub on every
+    ``hub_every``-th row and column crossing and random node costs.
+    """
+    rng = random.Random(seed)
+    nodes = []
+    edges = []
+    for row in range(side):
+        for column in range(side):
+            node_id = row * side + column + 1
+            is_hub = row % hub_every == 0 and column % hub_every == 0
+            nodes.append((node_id, 'Node {}'.format(node_id), is_hub,
+                          None if is_hub else rng.randint(1, 3)))
+            if column:
+                edges.append((node_id, node_id - 1))
+            if row:
+                edges.append((node_id, node_id - side))
+    return NodeGraph(nodes, edges)
+
+
+class Command(BaseCommand):
+    help = ('Measure how Steiner tree planning latency grows with the number '
+            'of target nodes on a synthetic grid map.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--side', type=int, default=40,
+                            help='Grid side length; the map has side^2 nodes')
+        parser.add_argument('--hub-every', type=int, default=10,
+                            help='Spacing between hubs on the grid')
+        parser.add_argument('--targets', default='1,2,4,8,16,32',
+                            help='Comma separated target counts to measure')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Random target sets per target count')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        graph = grid_graph(options['side'], options['hub_every'],
+                           options['seed'])
+        rng = random.Random(options['seed'])
+        self.stdout.write('{} nodes, {} hubs'.format(len(graph),
+                                                     len(graph.hubs)))
+        self.stdout.write('{:>8} {:>10} {:>10} {:>10}'.format(
+            'targets', 'median ms', 'max ms', 'cost'))
+        for count in [int(c) for c in options['targets'].split(',')]:
+            timings = []
+            costs = []
+            for _ in range(options['repeat']):
+                targets = rng.sample(list(graph.ids), count)
+                start = time.perf_counter()
+                cost, _ = steiner_tree(graph, targets)
+                timings.append((time.perf_counter() - start) * 1000)
+                costs.append(cost)
+            self.stdout.write('{:>8} {:>10.2f} {:>10.2f} {:>10.1f}'.format(
+                count, statistics.median(timings), max(timings),
+                statistics.mean(costs)))
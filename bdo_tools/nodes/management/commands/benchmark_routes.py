@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nodes.graph import NodeGraph
+from nodes.partitions import PartitionedGraph
+
+
+class Command(BaseCommand):
+    help = ('Measure building the territory partitions, with and without a '
+            'process pool, and point to point route latency against plain '
+            'Dijkstra on the current data. Run generate_world first for '
+            'meaningful numbers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4',
+                            help='Comma separated pool sizes to build with')
+        parser.add_argument('--routes', type=int, default=200,
+                            help='Random node pairs to route')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        graph = NodeGraph.from_db()
+        if len(graph) < 2:
+            raise CommandError('Not enough nodes; run generate_world first.')
+        rng = random.Random(options['seed'])
+
+        partitioned = None
+        for workers in [int(w) for w in options['workers'].split(',')]:
+            start = time.perf_counter()
+            partitioned = PartitionedGraph.build(graph, workers=workers)
+            self.stdout.write('build, {} worker(s): {:.0f} ms'.format(
+                workers, (time.perf_counter() - start) * 1000))
+        borders = sum(len(p.borders) for p in partitioned.partitions.values())
+        self.stdout.write('{} nodes, {} territories, {} border nodes, {} '
+                          'overlay edges'.format(
+                              len(graph), len(partitioned.partitions), borders,
+                              sum(len(e) for e in partitioned.overlay.values())))
+
+        # An edit inside one territory
+        i = rng.choice([i for i in range(len(graph)) if not graph.is_hub[i]])
+        nodes = [(graph.ids[j], graph.names[j], graph.is_hub[j],
+                  graph.costs[j] + (j == i), graph.territories[j])
+                 for j in range(len(graph))]
+        edges = [(graph.ids[j], graph.ids[k]) for j in range(len(graph))
+                 for k in graph.targets[graph.offsets[j]:graph.offsets[j + 1]]]
+        start = time.perf_counter()
+        updated = partitioned.updated(NodeGraph(nodes, edges))
+        self.stdout.write('update after one cost change: {:.0f} ms, {} '
+                          'territory rebuilt'.format(
+                              (time.perf_counter() - start) * 1000,
+                              len(updated.rebuilt)))
+
+        routed = []
+        plain = []
+        mismatches = 0
+        for _ in range(options['routes']):
+            s, t = rng.randrange(len(graph)), rng.randrange(len(graph))
+            start = time.perf_counter()
+            path = partitioned.route(graph.ids[s], graph.ids[t])
+            routed.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            dist, _ = graph.shortest_paths([s], stop_at={t})
+            plain.append((time.perf_counter() - start) * 1000)
+            if (path.cost if path else None) != dist[t]:
+                mismatches += 1
+        self.stdout.write('{:>12} {:>10} {:>10}'.format('', 'median ms',
+                                                        'max ms'))
+        for label, timings in (('partitioned', routed), ('dijkstra', plain)):
+            self.stdout.write('{:>12} {:>10.2f} {:>10.2f}'.format(
+                label, statistics.median(timings), max(timings)))
+        if mismatches:
+            raise CommandError('{} routes differ from Dijkstra'.format(
+                mismatches))
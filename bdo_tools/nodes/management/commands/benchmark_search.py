@@ -0,0 +1,60 @@
+import random
+import statistics
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from nodes.search import MIN_QUERY_LENGTH, SEARCH_TYPES, search
+
+
+class Command(BaseCommand):
+    help = ('Measure search latency as someone types names of every type, '
+            'one request per keystroke, and with a letter of each name '
+            'swapped. Run generate_world first for meaningful numbers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=20,
+                            help='Names of each type to type out')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = []
+        for label, columns in SEARCH_TYPES.values():
+            values = list(apps.get_model(label).objects.order_by('pk')
+                          .values_list(columns[0], flat=True))
+            names.extend(rng.sample(values, min(options['names'], len(values))))
+        if not names:
+            raise CommandError('Nothing to search; run generate_world first.')
+        rows = sum(apps.get_model(label).objects.count()
+                   for label, _ in SEARCH_TYPES.values())
+        self.stdout.write('{} rows on {}'.format(rows, connection.vendor))
+
+        timings = {}
+        found = 0
+        for name in names:
+            for length in range(MIN_QUERY_LENGTH, len(name) + 1):
+                start = time.perf_counter()
+                search(name[:length])
+                timings.setdefault(min(length, 8), []).append(
+                    (time.perf_counter() - start) * 1000)
+            # A typo: two neighbouring letters swapped
+            i = rng.randrange(len(name) - 1) if len(name) > 1 else 0
+            typo = name[:i] + name[i + 1:i + 2] + name[i:i + 1] + name[i + 2:]
+            start = time.perf_counter()
+            results = search(typo).results
+            timings.setdefault('typo', []).append(
+                (time.perf_counter() - start) * 1000)
+            found += any(result.name == name for result in results)
+
+        self.stdout.write('{:>8} {:>8} {:>10} {:>10}'.format(
+            'length', 'queries', 'median ms', 'p95 ms'))
+        for length, times in sorted(timings.items(), key=lambda i: str(i[0])):
+            times.sort()
+            self.stdout.write('{:>8} {:>8} {:>10.2f} {:>10.2f}'.format(
+                '8+' if length == 8 else length, len(times),
+                statistics.median(times), times[int(len(times) * 0.95)]))
+        self.stdout.write('{} of {} names found despite a typo'.format(
+            found, len(names)))
@@ -0,0 +1,217 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_started
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from bdo_tools.pagination import encode_cursor
+from crafting import urls as crafting_urls
+from crafting.bom import invalidate_recipe_graph
+from crafting.models import Material, Recipe, Station
+from crafting.planner import invalidate_production_index
+from nodes import urls as nodes_urls
+from nodes.autocomplete import invalidate_autocomplete_index
+from nodes.graph import invalidate_graph
+from nodes.models import Kingdom, Node, Property, Resource, Territory
+from nodes.page_cache import get_detail_cache
+from nodes.partitions import invalidate_partitioned_graph
+from nodes.snapshot import invalidate_version, save_current_snapshot
+
+
+def url_names(patterns, namespace):
+    """
+    Yield the full name of every named URL in ``patterns``.
+    """
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            yield from url_names(pattern.url_patterns,
+                                 '{}{}:'.format(namespace, pattern.namespace))
+        elif pattern.name:
+            yield namespace + pattern.name
+
+
+def middle(queryset):
+    """
+    The object halfway through ``queryset`` by id, or ``None``.
+    """
+    count = queryset.count()
+    return queryset.order_by('id')[count // 2] if count else None
+
+
+def reset_caches():
+    cache.clear()
+    get_detail_cache().clear()
+    invalidate_autocomplete_index()
+    invalidate_graph()
+    invalidate_partitioned_graph()
+    invalidate_recipe_graph()
+    invalidate_production_index()
+    invalidate_version()
+
+
+class Command(BaseCommand):
+    help = ('Measure latency, query count and memory of every nodes and '
+            'crafting page against the current data. Run generate_world '
+            'first for meaningful numbers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Warm requests per page')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output',
+                            help='Also write the results to this JSON file')
+
+    def get_cases(self, rng):
+        """
+        Return ``(label, url name, kwargs, query)`` for each page, using
+        objects from the middle of each table so runs are repeatable.
+        """
+        kingdom = middle(Kingdom.objects.all())
+        territory = middle(Territory.objects.all())
+        node = middle(Node.objects.filter(is_hub=False))
+        hub = middle(Node.objects.filter(is_hub=True))
+        prop = middle(Property.objects.all())
+        material = middle(Material.objects.all())
+        crafted = middle(Material.objects.filter(recipe_outputs__isnull=False)
+                                         .distinct())
+        recipe = middle(Recipe.objects.all())
+        station = middle(Station.objects.all())
+        resource_ids = list(Resource.objects.order_by('id')
+                                            .values_list('id', flat=True))
+        resource_ids = rng.sample(resource_ids, min(4, len(resource_ids)))
+
+        cases = [
+            ('main', 'nodes:main', {}, ''),
+            ('snapshot', 'nodes:snapshot', {}, ''),
+            ('plan', 'nodes:plan', {},
+             'resources=' + ','.join(str(id) for id in resource_ids)),
+            ('crafting main', 'crafting:main', {}, ''),
+        ]
+        for name, obj in (('nodes:kingdoms', kingdom),
+                          ('nodes:territories', territory),
+                          ('nodes:nodes', node),
+                          ('nodes:properties', prop),
+                          ('crafting:materials', material),
+                          ('crafting:recipes', recipe),
+                          ('crafting:stations', station)):
+            cases.append((name + ' list', name + ':list', {}, ''))
+            if obj is None:
+                continue
+            cases.append((name + ' list by name, deep', name + ':list', {},
+                          'order=name&after=' + encode_cursor([obj.name,
+                                                               obj.pk])))
+            cases.append((name + ' detail', name + ':detail', {'pk': obj.pk}, ''))
+        if territory is not None and station is not None:
+            cases.append(('node facets', 'nodes:nodes:facets', {},
+                          urlencode({'kingdom': territory.kingdom_id,
+                                     'station': station.pk,
+                                     'min_level': 2})))
+            cases.append(('node list filtered', 'nodes:nodes:list', {},
+                          urlencode({'territory': territory.pk,
+                                     'is_hub': 'false'})))
+            cases.append(('property facets', 'nodes:properties:facets', {},
+                          urlencode({'territory': territory.pk,
+                                     'station': station.pk})))
+        if node is not None:
+            cases.append(('search', 'nodes:search', {},
+                          urlencode({'q': node.name[:4]})))
+            cases.append(('autocomplete', 'nodes:autocomplete', {},
+                          urlencode({'q': node.name[:4]})))
+            cases.append(('node path', 'nodes:nodes:path', {'pk': node.pk}, ''))
+        if node is not None and hub is not None:
+            cases.append(('node route', 'nodes:nodes:route', {'pk': node.pk},
+                          'to={}'.format(hub.pk)))
+        if crafted is not None:
+            cases.append(('crafted material detail', 'crafting:materials:detail',
+                          {'pk': crafted.pk}, ''))
+            cases.append(('material bill', 'crafting:materials:bill',
+                          {'pk': crafted.pk}, 'quantity=10'))
+            cases.append(('material production', 'crafting:materials:production',
+                          {'pk': crafted.pk}, 'quantity=10'))
+        return cases
+
+    def handle(self, *args, **options):
+        cases = self.get_cases(random.Random(options['seed']))
+        covered = {name for _, name, _, _ in cases}
+        for name in list(url_names(nodes_urls.urlpatterns, 'nodes:')) + \
+                list(url_names(crafting_urls.urlpatterns, 'crafting:')):
+            if name not in covered:
+                self.stderr.write('Not benchmarked (no data?): {}'.format(name))
+
+        # As the nodes.build_snapshot job would have
+        save_current_snapshot()
+        hosts = [host for host in settings.ALLOWED_HOSTS if '*' not in host]
+        client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+        self.stdout.write('{:<45} {:>6} {:>9} {:>9} {:>7} {:>7} {:>9} {:>9}'.format(
+            'page', 'status', 'cold ms', 'warm ms', 'cold q', 'warm q',
+            'peak KiB', 'bytes'))
+        results = []
+        # Every request would otherwise empty the query log being counted
+        request_started.disconnect(reset_queries)
+        try:
+            for label, name, kwargs, query in cases:
+                path = reverse(name, kwargs=kwargs) + ('?' + query if query else '')
+                result = self.measure(client, path, options['repeat'])
+                result['page'] = label
+                results.append(result)
+                self.stdout.write(
+                    '{page:<45} {status:>6} {cold_ms:>9.2f} {warm_ms:>9.2f} '
+                    '{cold_queries:>7} {warm_queries:>7} {peak_kib:>9.1f} '
+                    '{bytes:>9}'.format(**result))
+        finally:
+            request_started.connect(reset_queries)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def measure(self, client, path, repeat):
+        reset_caches()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(path)
+            cold = (time.perf_counter() - start) * 1000
+        cold_queries = warm_queries = len(queries)
+        if response.status_code >= 500:
+            raise CommandError('{} failed with {}'.format(path,
+                                                          response.status_code))
+        size = len(b''.join(response) if response.streaming
+                   else response.content)
+
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                client.get(path)
+                timings.append((time.perf_counter() - start) * 1000)
+            warm_queries = len(queries)
+
+        # Tracing slows everything down, so memory gets a cold run of its own
+        reset_caches()
+        tracemalloc.start()
+        try:
+            client.get(path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'path': path,
+            'status': response.status_code,
+            'cold_ms': cold,
+            'warm_ms': statistics.median(timings) if timings else cold,
+            'cold_queries': cold_queries,
+            'warm_queries': warm_queries,
+            'peak_kib': peak / 1024,
+            'bytes': size,
+        }
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from nodes.distances import HubDistances, get_hub_distances
+from nodes.graph import NodeGraph
+
+
+class Command(BaseCommand):
+    help = ('Compute the hub to node distance matrices into '
+            'HUB_DISTANCE_DIR so workers start with them mapped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute everything instead of repairing '
+                                 'the current version')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        graph = NodeGraph.from_db()
+        if options['rebuild']:
+            distances = HubDistances.compute(graph)
+            distances.save(settings.HUB_DISTANCE_DIR)
+        else:
+            distances = get_hub_distances(graph)
+        self.stdout.write('{} hubs x {} nodes in {} ({:.1f} s)'.format(
+            len(distances.hubs), len(distances.ids),
+            settings.HUB_DISTANCE_DIR, time.perf_counter() - start))
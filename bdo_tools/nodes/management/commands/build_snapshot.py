@@ -0,0 +1,18 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from nodes.snapshot import save_current_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Build the snapshot of the current data into SNAPSHOT_DIR so '
+            'workers can serve it from the first request.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        snapshot = save_current_snapshot()
+        self.stdout.write('{} bytes in {} ({:.1f} s)'.format(
+            len(snapshot.content), settings.SNAPSHOT_DIR,
+            time.perf_counter() - start))
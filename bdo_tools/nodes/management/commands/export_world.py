@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from nodes.importing import export_world
+
+
+class Command(BaseCommand):
+    help = 'Write the world as a dump that import_world can read.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            default='jsonl')
+
+    def handle(self, *args, **options):
+        export_world(options['directory'], '.' + options['format'])
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from nodes.generation import generate_world
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a seeded synthetic world for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kingdoms', type=int, default=5)
+        parser.add_argument('--territories-per-kingdom', type=int, default=4)
+        parser.add_argument('--nodes', type=int, default=2000,
+                            help='Approximate node count; rounded to a grid')
+        parser.add_argument('--hub-every', type=int, default=8,
+                            help='Spacing between hubs on the grid')
+        parser.add_argument('--materials', type=int, default=200)
+        parser.add_argument('--stations', type=int, default=40)
+        parser.add_argument('--recipes', type=int, default=100)
+        parser.add_argument('--resource-chance', type=float, default=0.3,
+                            help='Chance that a node has resources')
+        parser.add_argument('--properties-per-node', type=int, default=3)
+        parser.add_argument('--property-depth', type=int, default=2)
+        parser.add_argument('--stations-per-property', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='Generated',
+                            help='Name prefix; must be new to the database')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        size = generate_world(
+            kingdoms=options['kingdoms'],
+            territories_per_kingdom=options['territories_per_kingdom'],
+            nodes=options['nodes'],
+            hub_every=options['hub_every'],
+            materials=options['materials'],
+            stations=options['stations'],
+            recipes=options['recipes'],
+            resource_chance=options['resource_chance'],
+            properties_per_node=options['properties_per_node'],
+            property_depth=options['property_depth'],
+            stations_per_property=options['stations_per_property'],
+            seed=options['seed'],
+            prefix=options['prefix'])
+        for field, count in zip(size._fields, size):
+            self.stdout.write('{:>18} {:>8}'.format(field, count))
+        self.stdout.write('Generated in {:.1f} s'.format(
+            time.perf_counter() - start))
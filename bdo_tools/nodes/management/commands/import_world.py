@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nodes.importing import BATCH_SIZE, WorldImportError, WorldImporter
+
+
+class Command(BaseCommand):
+    help = ('Import a directory of CSV or JSON Lines game data dumps, '
+            'creating new rows and updating existing ones by name.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Records per transaction')
+        parser.add_argument('--sync', action='store_true',
+                            help='Only write rows that changed and delete '
+                                 'nodes, edges, resources, properties and '
+                                 'property stations missing from the dump')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        importer = WorldImporter(options['directory'],
+                                 batch_size=options['batch_size'],
+                                 sync=options['sync'])
+        try:
+            report = importer.run()
+        except WorldImportError as e:
+            raise CommandError(e)
+        if options['verbosity'] > 1:
+            for kind, action, key in importer.changes:
+                self.stdout.write('{} {} {}'.format(
+                    action, kind, ' / '.join(str(k) for k in key)))
+        for kind, counts in report.items():
+            self.stdout.write('{:>18} {}'.format(
+                kind, ', '.join('{} {}'.format(counts[action], action)
+                                for action in sorted(counts))))
+        self.stdout.write('Imported in {:.1f} s'.format(
+            time.perf_counter() - start))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from nodes.availability import rebuild_station_availability
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the station availability rollup from the property '
+            'stations, nodes, territories and kingdoms.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_station_availability()
+        self.stdout.write('Rebuilt {} rows in {:.1f} s'.format(
+            count, time.perf_counter() - start))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kingdom',
+            index=models.Index(fields=['name', 'id'], name='nodes_kingd_name_229842_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['name', 'id'], name='nodes_node_name_1607d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['name', 'id'], name='nodes_prope_name_1ae05a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='territory',
+            index=models.Index(fields=['name', 'id'], name='nodes_terri_name_491013_idx'),
+        ),
+    ]
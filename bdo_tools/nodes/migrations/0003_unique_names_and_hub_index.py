@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def rename_duplicate_names(apps, schema_editor):
+    """
+    Give every row but the first of each duplicated name its id as a suffix,
+    so the unique constraint can be added. The rows are kept, with whatever
+    refers to them, to be merged or renamed by hand.
+    """
+    for model_name in ('Kingdom', 'Territory'):
+        model = apps.get_model('nodes', model_name)
+        duplicated = model.objects.values('name')\
+                                  .annotate(count=models.Count('id'))\
+                                  .filter(count__gt=1).order_by()\
+                                  .values_list('name', flat=True)
+        for name in list(duplicated):
+            pks = model.objects.filter(name=name).order_by('id')\
+                               .values_list('id', flat=True)
+            for pk in list(pks)[1:]:
+                suffix = ' #{}'.format(pk)
+                model.objects.filter(pk=pk).update(
+                    name=name[:100 - len(suffix)] + suffix)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0002_name_id_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='kingdom',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='node',
+            name='is_hub',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterField(
+            model_name='territory',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# (index, table, column) for the name searches done by the admin and site
+TRIGRAM_INDEXES = [
+    ('nodes_node_name_trgm', 'nodes_node', 'name'),
+    ('nodes_territory_name_trgm', 'nodes_territory', 'name'),
+    ('crafting_material_name_trgm', 'crafting_material', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Trigram GIN indexes let PostgreSQL answer ``icontains`` searches without
+    scanning the table. Other databases have no equivalent.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX {} ON {} USING gin (UPPER({}) gin_trgm_ops)'.format(
+                index, table, column))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(index))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0003_unique_names_and_hub_index'),
+        ('crafting', '0003_unique_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_station_availability(apps, schema_editor):
+    """
+    Copy the existing property stations into the new rollup.
+    """
+    PropertyStation = apps.get_model('nodes', 'PropertyStation')
+    StationAvailability = apps.get_model('nodes', 'StationAvailability')
+    rows = PropertyStation.objects.values_list(
+        'pk', 'station_id', 'max_level', 'property_id', 'property__name',
+        'property__node_id', 'property__node__name',
+        'property__node__territory_id', 'property__node__territory__name',
+        'property__node__territory__kingdom_id',
+        'property__node__territory__kingdom__name')
+    StationAvailability.objects.bulk_create(
+        StationAvailability(property_station_id=pk, station_id=station_id,
+                            max_level=max_level, property_id=property_id,
+                            property_name=property_name, node_id=node_id,
+                            node_name=node_name, territory_id=territory_id,
+                            territory_name=territory_name,
+                            kingdom_id=kingdom_id, kingdom_name=kingdom_name)
+        for (pk, station_id, max_level, property_id, property_name, node_id,
+             node_name, territory_id, territory_name, kingdom_id,
+             kingdom_name) in rows.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crafting', '0005_recipe_station_level'),
+        ('nodes', '0004_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationAvailability',
+            fields=[
+                ('property_station', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='availability', serialize=False, to='nodes.PropertyStation')),
+                ('max_level', models.IntegerField()),
+                ('property_name', models.CharField(max_length=100)),
+                ('node_name', models.CharField(max_length=100)),
+                ('territory_name', models.CharField(max_length=100)),
+                ('kingdom_name', models.CharField(max_length=100)),
+                ('kingdom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='station_availability', to='nodes.Kingdom')),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='station_availability', to='nodes.Node')),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='station_availability', to='nodes.Property')),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='crafting.Station')),
+                ('territory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='station_availability', to='nodes.Territory')),
+            ],
+            options={
+                'verbose_name_plural': 'station availability',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stationavailability',
+            index=models.Index(fields=['station', 'max_level'], name='nodes_stati_station_4238e6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationavailability',
+            index=models.Index(fields=['territory', 'station'], name='nodes_stati_territo_7f38c8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationavailability',
+            index=models.Index(fields=['kingdom', 'station'], name='nodes_stati_kingdom_e2bf56_idx'),
+        ),
+        migrations.RunPython(fill_station_availability,
+                             migrations.RunPython.noop),
+    ]
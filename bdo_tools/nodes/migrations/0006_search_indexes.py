@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# (index, table, column) added to those of 0004_trigram_indexes
+TRIGRAM_INDEXES = [
+    ('nodes_node_node_manager_trgm', 'nodes_node', 'node_manager'),
+    ('nodes_property_name_trgm', 'nodes_property', 'name'),
+    ('crafting_station_name_trgm', 'crafting_station', 'name'),
+]
+
+# (index, table, column) for the word prefix matches of nodes.search
+TSVECTOR_INDEXES = [
+    ('nodes_node_name_tsv', 'nodes_node', 'name'),
+    ('nodes_node_node_manager_tsv', 'nodes_node', 'node_manager'),
+    ('nodes_territory_name_tsv', 'nodes_territory', 'name'),
+    ('nodes_property_name_tsv', 'nodes_property', 'name'),
+    ('crafting_material_name_tsv', 'crafting_material', 'name'),
+    ('crafting_station_name_tsv', 'crafting_station', 'name'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    Trigram and ``tsvector`` GIN indexes for every column :mod:`nodes.search`
+    looks at. The expressions must match the ones it queries with.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX {} ON {} USING gin (UPPER({}) gin_trgm_ops)'.format(
+                index, table, column))
+    for index, table, column in TSVECTOR_INDEXES:
+        schema_editor.execute(
+            "CREATE INDEX {} ON {} USING gin "
+            "(to_tsvector('simple', {}))".format(index, table, column))
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index, _, _ in TRIGRAM_INDEXES + TSVECTOR_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(index))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0005_station_availability'),
+        ('crafting', '0005_recipe_station_level'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -1,5 +1,6 @@
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
 
 
 class Kingdom(models.Model):
@@ -10,11 +11,15 @@ class Kingdom(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        # Keyset pagination seeks on (name, id)
+        indexes = [models.Index(fields=['name', 'id'])]
+
 
 class Territory(models.Model):
     """
@@ -24,7 +29,7 @@ class Territory(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     kingdom = models.ForeignKey(Kingdom,
                                 on_delete=models.CASCADE,
                                 related_name='territories')
@@ -34,6 +39,7 @@ class Territory(models.Model):
 
     class Meta:
         verbose_name_plural = 'territories'
+        indexes = [models.Index(fields=['name', 'id'])]
 
 
 class Node(models.Model):
@@ -52,7 +58,7 @@ class Node(models.Model):
     territory = models.ForeignKey(Territory,
                                   on_delete=models.CASCADE,
                                   related_name='nodes')
-    is_hub = models.BooleanField(default=False)
+    is_hub = models.BooleanField(default=False, db_index=True)
     contribution_cost = models.IntegerField(null=True,
                                             blank=True,
                                             validators=[MinValueValidator(0)])
@@ -73,6 +79,9 @@ class Node(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [models.Index(fields=['name', 'id'])]
+
 
 class Resource(models.Model):
     """
@@ -95,6 +104,80 @@ class Resource(models.Model):
                                                self.node.name)
 
 
+class SubquerySQL(RawSQL):
+    """
+    Raw SQL for the right hand side of ``__in``. The lookup adds the
+    parentheses; a second pair would make it a scalar subquery.
+    """
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+class PropertyQuerySet(models.QuerySet):
+    """
+    Queries over the tree formed by ``parent_property``. Each walks the tree
+    in the database with one recursive common table expression, which both
+    PostgreSQL and SQLite support. ``UNION`` rather than ``UNION ALL`` stops
+    the walk if the data ever contains a cycle.
+    """
+    # Walks from the property with id %s; {parent} is the column to follow
+    DESCENDANTS_SQL = (
+        'WITH RECURSIVE tree (id) AS ('
+        'SELECT {id} FROM {table} WHERE {id} = %s '
+        'UNION '
+        'SELECT p.{id} FROM {table} p JOIN tree ON p.{parent} = tree.id'
+        ') SELECT id FROM tree')
+    ANCESTORS_SQL = (
+        'WITH RECURSIVE tree (id, parent_id) AS ('
+        'SELECT {id}, {parent} FROM {table} WHERE {id} = %s '
+        'UNION '
+        'SELECT p.{id}, p.{parent} FROM {table} p '
+        'JOIN tree ON p.{id} = tree.parent_id'
+        ') SELECT id FROM tree')
+
+    def tree_ids(self, sql, property):
+        """
+        A subquery for the ids that ``sql`` walks to from ``property``, a
+        Property or its id.
+        """
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        parent = meta.get_field('parent_property').column
+        return SubquerySQL(sql.format(id=quote(meta.pk.column),
+                                      table=quote(meta.db_table),
+                                      parent=quote(parent)),
+                           [getattr(property, 'pk', property)])
+
+    def descendants(self, property, include_self=False):
+        """
+        Every Property below ``property``, however deep.
+        """
+        properties = self.filter(pk__in=self.tree_ids(self.DESCENDANTS_SQL,
+                                                      property))
+        if include_self:
+            return properties
+        return properties.exclude(pk=getattr(property, 'pk', property))
+
+    def ancestors(self, property, include_self=False):
+        """
+        Every Property above ``property`` up to its root.
+        """
+        properties = self.filter(pk__in=self.tree_ids(self.ANCESTORS_SQL,
+                                                      property))
+        if include_self:
+            return properties
+        return properties.exclude(pk=getattr(property, 'pk', property))
+
+    def subtree_stations(self, property):
+        """
+        The :model:`nodes.PropertyStation` of ``property`` and everything
+        below it, with their property and station, in one query.
+        """
+        return PropertyStation.objects\
+            .filter(property__in=self.tree_ids(self.DESCENDANTS_SQL, property))\
+            .select_related('property', 'station')
+
+
 class Property(models.Model):
     """
     Properties belong to :model:`nodes.Node`. They can be rented in exchange for
@@ -116,11 +199,14 @@ class Property(models.Model):
                                       through='PropertyStation',
                                       related_name='properties')
 
+    objects = PropertyQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
     class Meta:
         verbose_name_plural = 'properties'
+        indexes = [models.Index(fields=['name', 'id'])]
 
 
 class PropertyStation(models.Model):
@@ -188,3 +274,45 @@ class PropertyStation(models.Model):
     # wagon_part_workshop
     # weapon_workshop
     # wood_workbench
+
+
+class StationAvailability(models.Model):
+    """
+    A denormalised copy of each :model:`nodes.PropertyStation` with the
+    :model:`nodes.Node`, :model:`nodes.Territory` and :model:`nodes.Kingdom`
+    it is in, so stations can be looked up, filtered and counted by place
+    without joins. Kept current by :mod:`nodes.availability`.
+    """
+    property_station = models.OneToOneField(PropertyStation,
+                                            on_delete=models.CASCADE,
+                                            primary_key=True,
+                                            related_name='availability')
+    station = models.ForeignKey('crafting.Station',
+                                on_delete=models.CASCADE,
+                                related_name='availability')
+    max_level = models.IntegerField()
+    property = models.ForeignKey(Property,
+                                 on_delete=models.CASCADE,
+                                 related_name='station_availability')
+    property_name = models.CharField(max_length=100)
+    node = models.ForeignKey(Node,
+                             on_delete=models.CASCADE,
+                             related_name='station_availability')
+    node_name = models.CharField(max_length=100)
+    territory = models.ForeignKey(Territory,
+                                  on_delete=models.CASCADE,
+                                  related_name='station_availability')
+    territory_name = models.CharField(max_length=100)
+    kingdom = models.ForeignKey(Kingdom,
+                                on_delete=models.CASCADE,
+                                related_name='station_availability')
+    kingdom_name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return "Station {} at {}".format(self.station_id, self.property_name)
+
+    class Meta:
+        verbose_name_plural = 'station availability'
+        indexes = [models.Index(fields=['station', 'max_level']),
+                   models.Index(fields=['territory', 'station']),
+                   models.Index(fields=['kingdom', 'station'])]
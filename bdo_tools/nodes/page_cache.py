@@ -0,0 +1,61 @@
+"""
+Whole-page caching for detail views.
+
+Detail pages only change when an admin edits the data, so the rendered HTML is
+cached per object. Cache keys include the object's ``modified`` timestamp, so
+editing the object itself retires its page. Pages that show related objects are
+dropped explicitly by the signal handlers in :mod:`nodes.signals` through
+:func:`invalidate_detail_pages`.
+
+The cache is the one named by the ``DETAIL_PAGE_CACHE`` setting.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.http import Http404, HttpResponse
+
+
+def get_detail_cache():
+    return caches[settings.DETAIL_PAGE_CACHE]
+
+
+def detail_cache_key(model, pk, modified):
+    return 'detail:{}:{}:{}'.format(model._meta.label_lower, pk,
+                                    modified.timestamp())
+
+
+def invalidate_detail_pages(model, pks):
+    """
+    Drop the cached detail pages of the ``model`` objects with ``pks``.
+    """
+    pks = {pk for pk in pks if pk is not None}
+    if not pks:
+        return
+    keys = [detail_cache_key(model, pk, modified) for pk, modified
+            in model.objects.filter(pk__in=pks).values_list('pk', 'modified')]
+    get_detail_cache().delete_many(keys)
+
+
+class CachedDetailMixin:
+    """
+    Serve a ``DetailView`` from the detail page cache.
+
+    A cache hit costs one query to read the object's ``modified`` timestamp.
+    """
+    def get(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        modified = model.objects.filter(pk=kwargs['pk'])\
+                                .values_list('modified', flat=True)\
+                                .first()
+        if modified is None:
+            raise Http404('No {} with id {}'.format(model._meta.verbose_name,
+                                                    kwargs['pk']))
+        cache = get_detail_cache()
+        key = detail_cache_key(model, kwargs['pk'], modified)
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+
+        response = super().get(request, *args, **kwargs)
+        response.render()
+        cache.set(key, response.content, settings.DETAIL_PAGE_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,351 @@
+"""
+Point to point routes over territory partitions.
+
+Most of the ``connected_nodes`` network stays inside a :model:`nodes.Territory`
+and only its border nodes have edges into the next one.
+:class:`PartitionedGraph` splits a :class:`~nodes.graph.NodeGraph` by territory
+and precomputes, for every territory, the cheapest path from each of its border
+nodes to each of its nodes without leaving it. The border nodes form an overlay
+graph with those tables as shortcuts between the borders of a territory, plus
+the edges between territories.
+
+A route runs Dijkstra on the overlay only, entering it through the table of the
+start's territory and leaving through the end's, so a route across kingdoms
+never looks inside the territories it passes. Territory tables are independent
+of each other, so they can be computed in a process pool, and an edit inside
+one territory only recomputes that one.
+"""
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import heapq
+import threading
+
+import numpy as np
+
+from .graph import Path, get_graph
+
+UNREACHABLE = -1
+
+# Everything a territory's tables are computed from. ``adjacency`` and
+# ``borders`` hold local indexes into ``ids``.
+PartitionInput = namedtuple('PartitionInput', ['territory', 'ids', 'costs',
+                                               'adjacency', 'borders',
+                                               'fingerprint'])
+
+
+class Partition:
+    """
+    The nodes of one territory. ``nodes`` are their graph indexes,
+    ``borders`` the local indexes of those with an edge out of the territory,
+    and ``dist[k, j]`` and ``pred[k, j]`` the cost and previous local index
+    of the cheapest path from ``borders[k]`` to local node ``j`` that stays
+    inside. ``direct`` is from :func:`compute_tables`.
+    """
+    def __init__(self, source, nodes, dist, pred, direct):
+        self.territory = source.territory
+        self.fingerprint = source.fingerprint
+        self.costs = source.costs
+        self.adjacency = source.adjacency
+        self.borders = source.borders
+        self.nodes = nodes
+        self.dist = dist
+        self.pred = pred
+        self.direct = direct
+        self.local = {i: j for j, i in enumerate(nodes)}
+        # Graph index of each border to its table row
+        self.rows = {nodes[b]: k for k, b in enumerate(source.borders)}
+
+    def walk(self, row, j):
+        """
+        Return the graph indexes from local node ``j`` back to the border of
+        table ``row``.
+        """
+        pred = self.pred[row]
+        indexes = [self.nodes[j]]
+        while pred[j] != -1:
+            j = int(pred[j])
+            indexes.append(self.nodes[j])
+        return indexes
+
+    def search(self, source, target):
+        """
+        Return ``(cost, graph indexes)`` of the cheapest path between two
+        local nodes that stays inside, or ``None``.
+        """
+        dist, pred = local_dijkstra(self.costs, self.adjacency, source, target)
+        if dist[target] is None:
+            return None
+        indexes = [target]
+        while pred[indexes[-1]] != -1:
+            indexes.append(pred[indexes[-1]])
+        return dist[target], [self.nodes[j] for j in reversed(indexes)]
+
+
+def local_dijkstra(costs, adjacency, source, stop_at=None):
+    """
+    Dijkstra over one territory's adjacency lists. Returns ``(dist, prev)``
+    lists, exact up to ``stop_at`` if given.
+    """
+    dist = [None] * len(costs)
+    pred = [-1] * len(costs)
+    dist[source] = 0
+    heap = [(0, source)]
+    while heap:
+        d, i = heapq.heappop(heap)
+        if d > dist[i]:
+            continue
+        if i == stop_at:
+            break
+        for j in adjacency[i]:
+            nd = d + costs[j]
+            if dist[j] is None or nd < dist[j]:
+                dist[j] = nd
+                pred[j] = i
+                heapq.heappush(heap, (nd, j))
+    return dist, pred
+
+
+def compute_tables(source):
+    """
+    Return the ``(dist, pred, direct)`` arrays of a :class:`PartitionInput`.
+    ``direct[k, m]`` is whether the path from border ``k`` to border ``m``
+    passes no other border, as only those need a shortcut. Runs in pool
+    workers, so it only uses its argument.
+    """
+    count = len(source.costs)
+    dist = np.full((len(source.borders), count), UNREACHABLE, dtype=np.int64)
+    pred = np.full((len(source.borders), count), -1, dtype=np.int64)
+    direct = np.zeros((len(source.borders), len(source.borders)), dtype=bool)
+    is_border = [False] * count
+    for b in source.borders:
+        is_border[b] = True
+    for row, border in enumerate(source.borders):
+        border_dist, border_pred = local_dijkstra(source.costs,
+                                                  source.adjacency, border)
+        dist[row] = [UNREACHABLE if d is None else d for d in border_dist]
+        pred[row] = border_pred
+        for column, other in enumerate(source.borders):
+            j = border_pred[other]
+            while j != -1 and j != border and not is_border[j]:
+                j = border_pred[j]
+            direct[row, column] = j == border
+    return dist, pred, direct
+
+
+def partition_inputs(graph):
+    """
+    Split ``graph`` by territory. Returns ``(input, graph indexes)`` pairs.
+    """
+    members = defaultdict(list)
+    for i, territory in enumerate(graph.territories):
+        members[territory].append(i)
+    offsets, targets, territories = graph.offsets, graph.targets, graph.territories
+    for territory, nodes in sorted(members.items()):
+        local = {i: j for j, i in enumerate(nodes)}
+        adjacency = []
+        borders = []
+        for j, i in enumerate(nodes):
+            inside = [local[k] for k in targets[offsets[i]:offsets[i + 1]]
+                      if territories[k] == territory]
+            adjacency.append(inside)
+            if len(inside) < offsets[i + 1] - offsets[i]:
+                borders.append(j)
+        ids = [graph.ids[i] for i in nodes]
+        costs = [graph.costs[i] for i in nodes]
+        fingerprint = hashlib.sha1(repr((ids, costs, adjacency, borders))
+                                   .encode()).hexdigest()
+        yield PartitionInput(territory, ids, costs, adjacency, borders,
+                             fingerprint), nodes
+
+
+class PartitionedGraph:
+    """
+    A :class:`~nodes.graph.NodeGraph` split into :class:`Partition` by
+    territory, with the overlay of border nodes to route across them.
+
+    ``overlay`` maps the graph index of each border node to ``(index, cost,
+    partition)`` moves, where ``partition`` is the territory a shortcut
+    crosses or ``None`` for an edge between territories. ``rebuilt`` lists
+    the territories whose tables were computed rather than reused.
+    """
+    def __init__(self, graph, partitions, rebuilt):
+        self.graph = graph
+        self.fingerprint = graph.fingerprint
+        self.partitions = partitions
+        self.rebuilt = rebuilt
+        self.partition_of = [None] * len(graph)
+        for partition in partitions.values():
+            for i in partition.nodes:
+                self.partition_of[i] = partition
+
+        self.overlay = defaultdict(list)
+        offsets, targets, costs = graph.offsets, graph.targets, graph.costs
+        for partition in partitions.values():
+            borders = [partition.nodes[b] for b in partition.borders]
+            for row, u in enumerate(borders):
+                shortcuts = partition.dist[row, partition.borders].tolist()
+                direct = partition.direct[row].tolist()
+                for v, cost, needed in zip(borders, shortcuts, direct):
+                    if needed and v != u and cost != UNREACHABLE:
+                        self.overlay[u].append((v, cost, partition))
+                for v in targets[offsets[u]:offsets[u + 1]]:
+                    if self.partition_of[v] is not partition:
+                        self.overlay[u].append((v, costs[v], None))
+
+    @classmethod
+    def build(cls, graph, workers=None, previous=None):
+        """
+        Partition ``graph``, reusing the tables of territories unchanged
+        since ``previous`` and computing the rest in a pool of ``workers``
+        processes, or in this one if ``workers`` is not above one.
+        """
+        reusable = previous.partitions if previous is not None else {}
+        partitions = {}
+        todo = []
+        for source, nodes in partition_inputs(graph):
+            old = reusable.get(source.territory)
+            if old is not None and old.fingerprint == source.fingerprint:
+                partitions[source.territory] = Partition(source, nodes,
+                                                         old.dist, old.pred,
+                                                         old.direct)
+            else:
+                todo.append((source, nodes))
+
+        sources = [source for source, _ in todo]
+        if workers is not None and workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                tables = list(pool.map(compute_tables, sources,
+                                       chunksize=max(1, len(todo) // (4 * workers))))
+        else:
+            tables = [compute_tables(source) for source in sources]
+        for (source, nodes), table in zip(todo, tables):
+            partitions[source.territory] = Partition(source, nodes, *table)
+        return cls(graph, partitions, [source.territory for source in sources])
+
+    def updated(self, graph, workers=None):
+        """
+        Return the partitions of ``graph``, recomputing only the territories
+        that changed.
+        """
+        return PartitionedGraph.build(graph, workers=workers, previous=self)
+
+    def route(self, source_id, target_id):
+        """
+        Return the cheapest :class:`~nodes.graph.Path` from ``source_id`` to
+        ``target_id``, or ``None`` if there is none. The cost counts every
+        node entered after the start. Raises ``KeyError`` for unknown ids.
+        """
+        graph = self.graph
+        s, t = graph.index[source_id], graph.index[target_id]
+        if s == t:
+            return Path(cost=0, nodes=[source_id])
+        start, end = self.partition_of[s], self.partition_of[t]
+        s_local, t_local = start.local[s], end.local[t]
+
+        best = None
+        best_path = None
+        best_exit = None
+        if start is end:
+            direct = start.search(s_local, t_local)
+            if direct is not None:
+                best, best_path = direct
+
+        # Reversing a path swaps the start's cost for the end's
+        dist = {}
+        pred = {}
+        heap = []
+        for row, b in enumerate(start.borders):
+            d = int(start.dist[row, s_local])
+            if d != UNREACHABLE:
+                u = start.nodes[b]
+                dist[u] = d - graph.costs[s] + graph.costs[u]
+                pred[u] = None
+                heap.append((dist[u], u))
+        heapq.heapify(heap)
+        exits = {}
+        for row, b in enumerate(end.borders):
+            d = int(end.dist[row, t_local])
+            if d != UNREACHABLE:
+                exits[end.nodes[b]] = d
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if best is not None and d >= best:
+                break
+            if u in exits and (best is None or d + exits[u] < best):
+                best = d + exits[u]
+                best_exit = u
+            for v, cost, partition in self.overlay[u]:
+                nd = d + cost
+                if v not in dist or nd < dist[v]:
+                    dist[v] = nd
+                    pred[v] = (u, partition)
+                    heapq.heappush(heap, (nd, v))
+
+        if best is None:
+            return None
+        if best_exit is not None:
+            best_path = self.expand(s_local, best_exit, t_local, pred)
+        return Path(cost=best, nodes=[graph.ids[i] for i in best_path])
+
+    def expand(self, s_local, exit, t_local, pred):
+        """
+        Turn an overlay route ending at ``exit`` back into graph indexes.
+        """
+        moves = []
+        u = exit
+        while pred[u] is not None:
+            moves.append((pred[u], u))
+            u = pred[u][0]
+        moves.reverse()
+
+        start = self.partition_of[u]
+        indexes = start.walk(start.rows[u], s_local)
+        for (u, partition), v in moves:
+            if partition is None:
+                indexes.append(v)
+            else:
+                inside = partition.walk(partition.rows[u], partition.local[v])
+                indexes.extend(reversed(inside[:-1]))
+        end = self.partition_of[exit]
+        inside = end.walk(end.rows[exit], t_local)
+        indexes.extend(reversed(inside[:-1]))
+        return indexes
+
+
+_partitioned = None
+_partitioned_lock = threading.Lock()
+
+
+def get_partitioned_graph(graph=None):
+    """
+    Return the shared :class:`PartitionedGraph` for ``graph``, or the shared
+    graph, recomputing only the territories that changed since the last one.
+    The shared graph is rebuilt when another process edits the nodes, so this
+    follows those edits too.
+    """
+    global _partitioned
+    if graph is None:
+        graph = get_graph()
+    partitioned = _partitioned
+    if partitioned is not None and partitioned.fingerprint == graph.fingerprint:
+        return partitioned
+    with _partitioned_lock:
+        if _partitioned is None:
+            _partitioned = PartitionedGraph.build(graph)
+        elif _partitioned.fingerprint != graph.fingerprint:
+            _partitioned = _partitioned.updated(graph)
+        return _partitioned
+
+
+def invalidate_partitioned_graph():
+    """
+    Drop the shared :class:`PartitionedGraph` so the next route rebuilds
+    every territory.
+    """
+    global _partitioned
+    with _partitioned_lock:
+        _partitioned = None
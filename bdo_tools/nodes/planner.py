@@ -0,0 +1,78 @@
+"""
+Plans for claiming several :model:`nodes.Resource` at once.
+
+Reaching a set of resource nodes as cheaply as possible is the node-weighted
+Steiner tree problem, which is NP-hard. :func:`steiner_tree` uses the shortest
+path heuristic: grow a tree from every hub and repeatedly attach the cheapest
+remaining terminal. Each step is one early-exit Dijkstra, so a plan costs at
+most one graph search per target.
+"""
+from collections import namedtuple
+
+from .graph import get_graph
+
+Plan = namedtuple('Plan', ['cost', 'node_cost', 'resource_cost', 'nodes',
+                           'resources'])
+
+
+class PlanningError(ValueError):
+    """Raised when a plan cannot be made for the requested targets"""
+
+
+def steiner_tree(graph, node_ids):
+    """
+    Return ``(cost, node_ids)`` for a cheap connected set of nodes containing
+    a hub and every node in ``node_ids``.
+
+    ``cost`` is the contribution cost of the non-hub nodes in the tree.
+    Raises :class:`PlanningError` if a target cannot be reached from any hub.
+    """
+    try:
+        remaining = {graph.index[node_id] for node_id in node_ids}
+    except KeyError as e:
+        raise PlanningError('No node with id {}'.format(e.args[0]))
+    tree = set(graph.hubs)
+    remaining -= tree
+    cost = 0
+    while remaining:
+        dist, prev = graph.shortest_paths(tree, stop_at=remaining)
+        reached = [i for i in remaining if dist[i] is not None]
+        if not reached:
+            raise PlanningError('Node {} cannot be reached from a hub'.format(
+                graph.ids[next(iter(remaining))]))
+        nearest = min(reached, key=lambda i: dist[i])
+        cost += dist[nearest]
+        path = graph.walk_back(prev, nearest)
+        tree.update(path)
+        remaining.difference_update(path)
+    return cost, [graph.ids[i] for i in sorted(tree) if not graph.is_hub[i]]
+
+
+def plan_resources(resource_ids, graph=None):
+    """
+    Return a :class:`Plan` that claims every :model:`nodes.Resource` in
+    ``resource_ids``.
+
+    The plan's ``nodes`` are the non-hub nodes that must be invested in and
+    ``cost`` includes both the node and the resource contribution costs.
+    """
+    from .models import Resource
+
+    if graph is None:
+        graph = get_graph()
+    resource_ids = set(resource_ids)
+    resources = list(Resource.objects.filter(pk__in=resource_ids)
+                                     .values_list('id', 'node_id',
+                                                  'contribution_cost'))
+    missing = resource_ids - {resource_id for resource_id, _, _ in resources}
+    if missing:
+        raise PlanningError('No resource with id {}'.format(min(missing)))
+
+    node_cost, nodes = steiner_tree(graph,
+                                    {node_id for _, node_id, _ in resources})
+    resource_cost = sum(cost for _, _, cost in resources)
+    return Plan(cost=node_cost + resource_cost,
+                node_cost=node_cost,
+                resource_cost=resource_cost,
+                nodes=nodes,
+                resources=sorted(resource_ids))
@@ -0,0 +1,185 @@
+"""
+Search across nodes, territories, properties, materials and stations.
+
+On PostgreSQL :func:`search` runs one query over the indexes of migration
+``0006_search_indexes``: each word of the query matches as a word prefix
+through a ``tsvector`` index, and the whole query matches names with a
+similar spelling through a trigram index, so it copes with typos. Results
+are ranked by trigram similarity, with a boost for names starting with the
+query and for names containing every word. The facets count the matches of
+every type, whatever type the results are limited to.
+
+Other databases match word prefixes, without typo tolerance, from ``LIKE``
+scans ranked in Python. Words there start after one of ``WORD_SEPARATORS``,
+which covers the names of the game but not every separator PostgreSQL knows.
+The PostgreSQL search is tested only when the tests run on PostgreSQL.
+"""
+from collections import OrderedDict, namedtuple
+import re
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+
+# type: (model, columns matched); results show the first column
+SEARCH_TYPES = OrderedDict([
+    ('node', ('nodes.Node', ['name', 'node_manager'])),
+    ('territory', ('nodes.Territory', ['name'])),
+    ('property', ('nodes.Property', ['name'])),
+    ('material', ('crafting.Material', ['name'])),
+    ('station', ('crafting.Station', ['name'])),
+])
+
+# Shorter queries match too much of every table to be worth running
+MIN_QUERY_LENGTH = 2
+
+# Matches of each type ranked by the fallback
+FALLBACK_ROWS = 200
+
+WORDS = re.compile(r'[^\W_]+')
+# Characters a word follows in the names matched by the fallback
+WORD_SEPARATORS = (' ', '-', '(', '/', "'")
+
+SearchResult = namedtuple('SearchResult', ['type', 'id', 'name', 'score'])
+SearchResults = namedtuple('SearchResults', ['results', 'facets'])
+
+
+def search(query, type=None, limit=20):
+    """
+    Return the best ``limit`` :class:`SearchResult` for ``query``, of
+    ``type`` if given, and the number of matches of every type.
+    """
+    if type is not None and type not in SEARCH_TYPES:
+        raise ValueError('Unknown type {}'.format(type))
+    words = WORDS.findall(query)
+    facets = OrderedDict((name, 0) for name in SEARCH_TYPES)
+    if sum(len(word) for word in words) < MIN_QUERY_LENGTH:
+        return SearchResults(results=[], facets=facets)
+    query = ' '.join(words)
+    if connection.vendor == 'postgresql':
+        results, counts = _search_postgresql(query, words, type, limit)
+    else:
+        results, counts = _search_fallback(query, words, type, limit)
+    facets.update(counts)
+    return SearchResults(results=results, facets=facets)
+
+
+#
+# PostgreSQL
+#
+def _match(column):
+    return ("(to_tsvector('simple', {0}) @@ to_tsquery('simple', %(words)s) "
+            "OR UPPER({0}) %% UPPER(%(query)s))").format(column)
+
+
+def _score(column):
+    return ("COALESCE(similarity(UPPER({0}), UPPER(%(query)s)) "
+            "+ CASE WHEN UPPER({0}) LIKE UPPER(%(prefix)s) THEN 1 ELSE 0 END "
+            "+ CASE WHEN to_tsvector('simple', {0}) @@ "
+            "to_tsquery('simple', %(words)s) THEN 0.5 ELSE 0 END, 0)"
+            ).format(column)
+
+
+def _search_postgresql(query, words, type, limit):
+    quote = connection.ops.quote_name
+    branches = []
+    for name, (label, columns) in SEARCH_TYPES.items():
+        meta = apps.get_model(label)._meta
+        columns = [quote(meta.get_field(column).column) for column in columns]
+        score = _score(columns[0]) if len(columns) == 1 else \
+            'GREATEST({})'.format(', '.join(_score(c) for c in columns))
+        branches.append(
+            "SELECT CAST('{}' AS text) AS type, {} AS id, {} AS name, "
+            "CAST({} AS double precision) AS score FROM {} WHERE {}".format(
+                name, quote(meta.pk.column), columns[0], score,
+                quote(meta.db_table),
+                ' OR '.join(_match(column) for column in columns)))
+    sql = ('WITH matches AS ({}) '
+           '(SELECT type, id, name, score FROM matches {} '
+           'ORDER BY score DESC, name, id LIMIT %(limit)s) '
+           'UNION ALL '
+           '(SELECT type, NULL, NULL, COUNT(*) FROM matches GROUP BY type)'
+           ).format(' UNION ALL '.join(branches),
+                    'WHERE type = %(type)s' if type else '')
+    prefix = re.sub(r'([\\%_])', r'\\\1', query) + '%'
+    params = {
+        'query': query,
+        'words': ' & '.join(word + ':*' for word in words),
+        'prefix': prefix,
+        'type': type,
+        'limit': limit,
+    }
+    results = []
+    counts = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row_type, id, name, score in cursor.fetchall():
+            if id is None:
+                counts[row_type] = int(score)
+            else:
+                results.append(SearchResult(type=row_type, id=id, name=name,
+                                            score=score))
+    return results, counts
+
+
+#
+# Fallback
+#
+def trigrams(value):
+    """
+    The trigrams of ``value`` the way ``pg_trgm`` counts them.
+    """
+    grams = set()
+    for word in WORDS.findall(value.lower()):
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _fallback_score(query, query_grams, words, value):
+    if not value:
+        return 0
+    grams = trigrams(value)
+    union = len(grams | query_grams)
+    score = len(grams & query_grams) / union if union else 0
+    upper = value.upper()
+    if upper.startswith(query.upper()):
+        score += 1
+    value_words = WORDS.findall(upper)
+    if all(any(v.startswith(word.upper()) for v in value_words)
+           for word in words):
+        score += 0.5
+    return score
+
+
+def _search_fallback(query, words, type, limit):
+    query_grams = trigrams(query)
+    results = []
+    counts = {}
+    for name, (label, columns) in SEARCH_TYPES.items():
+        condition = Q()
+        for column in columns:
+            every_word = Q()
+            for word in words:
+                starts_word = Q(**{column + '__istartswith': word})
+                for separator in WORD_SEPARATORS:
+                    starts_word |= Q(**{column + '__icontains':
+                                        separator + word})
+                every_word &= starts_word
+            condition |= every_word
+        matches = apps.get_model(label).objects.filter(condition)
+        counts[name] = matches.count()
+        if type and name != type or not counts[name]:
+            continue
+        # Names starting with the query score highest, so rank those first
+        matches = matches.order_by(
+            Case(When(**{columns[0] + '__istartswith': query}, then=0),
+                 default=1, output_field=IntegerField()),
+            columns[0])
+        for row in matches.values_list('pk', *columns)[:FALLBACK_ROWS]:
+            score = max(_fallback_score(query, query_grams, words, value)
+                        for value in row[1:])
+            results.append(SearchResult(type=name, id=row[0], name=row[1],
+                                        score=score))
+    results.sort(key=lambda r: (-r.score, r.name, r.id))
+    return results[:limit], counts
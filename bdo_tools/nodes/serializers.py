@@ -0,0 +1,85 @@
+from rest_framework import serializers
+
+from bdo_tools.api import SparseFieldsMixin, SummarySerializer
+from . import models
+
+
+class KingdomSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    territories = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = models.Kingdom
+        fields = ('id', 'name', 'territories', 'modified')
+
+
+class TerritorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    kingdom = SummarySerializer(read_only=True)
+    nodes = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = models.Territory
+        fields = ('id', 'name', 'kingdom', 'nodes', 'modified')
+
+
+class NodeResourceSerializer(serializers.ModelSerializer):
+    material = SummarySerializer(read_only=True)
+
+    class Meta:
+        model = models.Resource
+        fields = ('id', 'material', 'contribution_cost')
+
+
+class NodeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    territory = SummarySerializer(read_only=True)
+    kingdom = SummarySerializer(source='territory.kingdom', read_only=True)
+    connected_nodes = serializers.PrimaryKeyRelatedField(many=True,
+                                                         read_only=True)
+    resources = NodeResourceSerializer(many=True, read_only=True)
+    properties = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = models.Node
+        fields = ('id', 'name', 'territory', 'kingdom', 'is_hub',
+                  'contribution_cost', 'node_manager', 'connected_nodes',
+                  'resources', 'properties', 'modified')
+
+
+class ResourceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    node = SummarySerializer(read_only=True)
+    material = SummarySerializer(read_only=True)
+
+    class Meta:
+        model = models.Resource
+        fields = ('id', 'node', 'material', 'contribution_cost', 'modified')
+
+
+class PropertyStationSummarySerializer(serializers.ModelSerializer):
+    station = SummarySerializer(read_only=True)
+
+    class Meta:
+        model = models.PropertyStation
+        fields = ('id', 'station', 'max_level')
+
+
+class PropertySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    node = SummarySerializer(read_only=True)
+    child_properties = serializers.PrimaryKeyRelatedField(many=True,
+                                                          read_only=True)
+    stations = PropertyStationSummarySerializer(source='propertystation_set',
+                                                many=True,
+                                                read_only=True)
+
+    class Meta:
+        model = models.Property
+        fields = ('id', 'name', 'node', 'parent_property', 'child_properties',
+                  'stations', 'modified')
+
+
+class PropertyStationSerializer(SparseFieldsMixin,
+                                serializers.ModelSerializer):
+    property = SummarySerializer(read_only=True)
+    station = SummarySerializer(read_only=True)
+
+    class Meta:
+        model = models.PropertyStation
+        fields = ('id', 'property', 'station', 'max_level', 'modified')
@@ -0,0 +1,258 @@
+from django.db.models.signals import (m2m_changed,
+                                      post_delete,
+                                      post_init,
+                                      post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from crafting.models import Material, Station
+from jobs.queue import enqueue_on_commit
+from . import graph
+from .autocomplete import update_autocomplete_index
+from .availability import refresh_station_availability
+from .facets import invalidate_facet_counts
+from .models import (Kingdom,
+                     Node,
+                     Property,
+                     PropertyStation,
+                     Resource,
+                     StationAvailability,
+                     Territory)
+from .page_cache import invalidate_detail_pages
+from .snapshot import SNAPSHOT_MODELS, invalidate_version
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+def node_changed(sender, **kwargs):
+    """Any Node change can move hubs, costs or names in the graph"""
+    graph.invalidate_graph()
+    enqueue_on_commit('nodes.build_hub_distances')
+
+
+@receiver(m2m_changed, sender=Node.connected_nodes.through)
+def connected_nodes_changed(sender, instance, action, pk_set, **kwargs):
+    """Edges were added or removed"""
+    if action == 'pre_clear':
+        # post_clear isn't told which nodes were disconnected
+        instance._cleared_node_ids = set(
+            instance.connected_nodes.values_list('pk', flat=True))
+    elif action.startswith('post_'):
+        graph.invalidate_graph()
+        enqueue_on_commit('nodes.build_hub_distances')
+        touched = set(pk_set or getattr(instance, '_cleared_node_ids', ()))
+        touched.add(instance.pk)
+        invalidate_detail_pages(Node, touched)
+        # Edges have no timestamp of their own, so mark both ends as modified
+        # for anything versioned by Node.modified
+        Node.objects.filter(pk__in=touched).update(modified=timezone.now())
+        invalidate_version()
+        enqueue_on_commit('nodes.build_snapshot')
+
+
+#
+# Detail page cache
+#
+# A saved object's own page is retired by its new modified timestamp. These
+# handlers drop the pages of the related objects that show it.
+#
+ORIGINAL_FIELDS = {
+    Resource: ['node_id'],
+    Property: ['node_id', 'parent_property_id'],
+    PropertyStation: ['property_id'],
+}
+
+
+def remember_original(sender, instance, **kwargs):
+    """Keep the loaded foreign keys to find the pages an object is moved off"""
+    instance._original = {field: instance.__dict__.get(field)
+                          for field in ORIGINAL_FIELDS[sender]}
+
+
+for model in ORIGINAL_FIELDS:
+    post_init.connect(remember_original, sender=model)
+
+
+def current_and_original(instance, field):
+    return {getattr(instance, field), instance._original.get(field)}
+
+
+@receiver(post_save, sender=Node)
+def node_saved(sender, instance, **kwargs):
+    invalidate_detail_pages(Node,
+                            instance.connected_nodes.values_list('pk', flat=True))
+    invalidate_detail_pages(Property,
+                            instance.properties.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Node)
+def node_deleted(sender, instance, **kwargs):
+    # The edges are gone by post_delete
+    invalidate_detail_pages(Node,
+                            instance.connected_nodes.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def resource_changed(sender, instance, **kwargs):
+    invalidate_detail_pages(Node, current_and_original(instance, 'node_id'))
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def property_changed(sender, instance, **kwargs):
+    invalidate_detail_pages(Node, current_and_original(instance, 'node_id'))
+    # Every property above shows this one in its subtree
+    parents = current_and_original(instance, 'parent_property_id')
+    children = Property.objects.filter(parent_property_id=instance.pk)\
+                               .values_list('pk', flat=True)
+    invalidate_detail_pages(Property,
+                            ancestors_of(parents) | set(children))
+
+
+@receiver(post_save, sender=PropertyStation)
+@receiver(post_delete, sender=PropertyStation)
+def property_station_changed(sender, instance, **kwargs):
+    invalidate_detail_pages(
+        Property, ancestors_of(current_and_original(instance, 'property_id')))
+
+
+@receiver(post_save, sender=Kingdom)
+def kingdom_saved(sender, instance, **kwargs):
+    invalidate_detail_pages(
+        Node, Node.objects.filter(territory__kingdom_id=instance.pk)
+                          .values_list('pk', flat=True))
+    invalidate_detail_pages(
+        Property, Property.objects.filter(node__territory__kingdom_id=instance.pk)
+                                  .values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Territory)
+def territory_saved(sender, instance, **kwargs):
+    invalidate_detail_pages(
+        Node, Node.objects.filter(territory_id=instance.pk)
+                          .values_list('pk', flat=True))
+    invalidate_detail_pages(
+        Property, Property.objects.filter(node__territory_id=instance.pk)
+                                  .values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Material)
+def material_saved(sender, instance, **kwargs):
+    invalidate_detail_pages(
+        Node, Resource.objects.filter(material_id=instance.pk)
+                              .values_list('node_id', flat=True))
+
+
+@receiver(post_save, sender=Station)
+def station_saved(sender, instance, **kwargs):
+    # Every property above one with the station lists it in its subtree. A
+    # station is on many properties, so the tree is walked from one query
+    # instead of one per property.
+    parents = dict(Property.objects.values_list('pk', 'parent_property_id'))
+    ids = set()
+    for property_id in PropertyStation.objects.filter(station_id=instance.pk)\
+                                              .values_list('property_id',
+                                                           flat=True):
+        while property_id is not None and property_id not in ids:
+            ids.add(property_id)
+            property_id = parents.get(property_id)
+    invalidate_detail_pages(Property, ids)
+
+
+def ancestors_of(property_ids):
+    """The ids of ``property_ids`` and every property above them"""
+    ids = set()
+    for property_id in property_ids - {None}:
+        ids.update(Property.objects.ancestors(property_id, include_self=True)
+                                   .values_list('pk', flat=True))
+    return ids
+
+
+#
+# Station availability rollup
+#
+# Deletes cascade to the rollup, so only saves are handled. Renames and moves
+# of nodes and above touch many rows and are applied with one UPDATE.
+#
+@receiver(post_save, sender=PropertyStation)
+def property_station_saved(sender, instance, **kwargs):
+    refresh_station_availability(PropertyStation.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Property)
+def property_saved(sender, instance, **kwargs):
+    refresh_station_availability(
+        PropertyStation.objects.filter(property_id=instance.pk))
+
+
+@receiver(post_save, sender=Node)
+def node_availability_changed(sender, instance, **kwargs):
+    territory = Territory.objects.select_related('kingdom')\
+                                 .get(pk=instance.territory_id)
+    StationAvailability.objects.filter(node_id=instance.pk).update(
+        node_name=instance.name,
+        territory_id=territory.pk,
+        territory_name=territory.name,
+        kingdom_id=territory.kingdom_id,
+        kingdom_name=territory.kingdom.name)
+
+
+@receiver(post_save, sender=Territory)
+def territory_availability_changed(sender, instance, **kwargs):
+    kingdom = Kingdom.objects.get(pk=instance.kingdom_id)
+    StationAvailability.objects.filter(territory_id=instance.pk).update(
+        territory_name=instance.name,
+        kingdom_id=kingdom.pk,
+        kingdom_name=kingdom.name)
+
+
+@receiver(post_save, sender=Kingdom)
+def kingdom_availability_changed(sender, instance, **kwargs):
+    StationAvailability.objects.filter(kingdom_id=instance.pk).update(
+        kingdom_name=instance.name)
+
+
+#
+# Snapshot
+#
+@receiver(post_save)
+@receiver(post_delete)
+def snapshot_data_changed(sender, **kwargs):
+    if sender._meta.label in SNAPSHOT_MODELS:
+        invalidate_version()
+        enqueue_on_commit('nodes.build_snapshot')
+
+
+#
+# Autocomplete index
+#
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def autocomplete_name_changed(sender, instance, **kwargs):
+    """Keep typeahead completions of this process current"""
+    update_autocomplete_index('node' if sender is Node else 'property',
+                              instance, deleted=kwargs['signal'] is post_delete)
+
+
+#
+# Facet counts
+#
+@receiver(post_save, sender=Kingdom)
+@receiver(post_delete, sender=Kingdom)
+@receiver(post_save, sender=Territory)
+@receiver(post_delete, sender=Territory)
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+@receiver(post_save, sender=PropertyStation)
+@receiver(post_delete, sender=PropertyStation)
+def facet_counts_changed(sender, **kwargs):
+    """Any of these can move a node or property between options"""
+    invalidate_facet_counts()
@@ -0,0 +1,224 @@
+"""
+A precomputed, compressed snapshot of the whole world.
+
+The snapshot holds every kingdom, territory, node, edge, resource, property,
+property station, material, station and recipe in one gzipped JSON document.
+It is identified by a version built from the row count and latest
+``modified`` timestamp of each model, which one query reads. Any change to the
+data gives a new version, so stale snapshots are never served, and clients
+holding the current version get a 304 without the snapshot being read or sent.
+
+The ``nodes.build_snapshot`` job builds the snapshot of each version once and
+saves it under ``settings.SNAPSHOT_DIR``, where every worker on the host
+serves it from. Requests never build it; until the job has saved the current
+version they get a 503.
+
+:func:`current_version` keeps the version in memory, so most requests, 304s
+included, run no query at all. The signal handlers drop it when this process
+edits the data, and edits made by other processes show within
+``SHARED_CACHE_RECHECK_SECONDS``.
+"""
+from collections import namedtuple
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from bdo_tools.shared_cache import table_stats
+from . import models
+
+SNAPSHOT_MODELS = [
+    'nodes.Kingdom',
+    'nodes.Territory',
+    'nodes.Node',
+    'nodes.Resource',
+    'nodes.Property',
+    'nodes.PropertyStation',
+    'crafting.Material',
+    'crafting.Station',
+    'crafting.Recipe',
+    'crafting.RecipeInput',
+    'crafting.RecipeOutput',
+]
+
+SUFFIX = '.json.gz'
+# Older versions kept for workers that have not noticed the change yet
+KEEP_VERSIONS = 2
+
+Version = namedtuple('Version', ['etag', 'last_modified'])
+Snapshot = namedtuple('Snapshot', ['version', 'content'])
+
+
+def get_version():
+    """
+    Return the current :class:`Version` of the data using a single query.
+
+    ``etag`` is a hash of the count and latest ``modified`` of each model and
+    ``last_modified`` is the latest ``modified`` of all of them, or ``None``
+    if there is no data.
+    """
+    stats = table_stats(SNAPSHOT_MODELS)
+    digest = hashlib.sha1(repr(stats).encode()).hexdigest()
+    timestamps = [to_datetime(latest) for _, latest in stats if latest]
+    return Version(etag=digest,
+                   last_modified=max(timestamps) if timestamps else None)
+
+
+_version = None
+
+
+def current_version():
+    """
+    Return :func:`get_version`, reading it again at most every
+    ``SHARED_CACHE_RECHECK_SECONDS``.
+    """
+    global _version
+    cached = _version
+    if cached is not None and time.monotonic() - cached[1] < \
+            settings.SHARED_CACHE_RECHECK_SECONDS:
+        return cached[0]
+    version = get_version()
+    _version = (version, time.monotonic())
+    return version
+
+
+def invalidate_version():
+    """
+    Drop the version kept by :func:`current_version`.
+    """
+    global _version
+    _version = None
+
+
+def to_datetime(value):
+    """
+    Normalize a raw ``modified`` value to an aware datetime. Some database
+    backends return text from raw queries.
+    """
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def build_data():
+    """
+    Return the whole world as plain Python data, with one query per model.
+    """
+    from crafting.models import Material, Recipe, RecipeInput, RecipeOutput, Station
+
+    # Each edge is stored in both directions; keep one of them
+    edges = models.Node.connected_nodes.through.objects\
+                                               .filter(from_node_id__lt=F('to_node_id'))\
+                                               .order_by('from_node_id', 'to_node_id')\
+                                               .values_list('from_node_id', 'to_node_id')
+    return {
+        'kingdoms': list(models.Kingdom.objects.order_by('id')
+                                       .values('id', 'name')),
+        'territories': list(models.Territory.objects.order_by('id')
+                                            .values('id', 'name', 'kingdom')),
+        'nodes': list(models.Node.objects.order_by('id')
+                                 .values('id', 'name', 'territory', 'is_hub',
+                                         'contribution_cost', 'node_manager')),
+        'edges': [list(edge) for edge in edges],
+        'resources': list(models.Resource.objects.order_by('id')
+                                         .values('id', 'node', 'material',
+                                                 'contribution_cost')),
+        'properties': list(models.Property.objects.order_by('id')
+                                          .values('id', 'name', 'node',
+                                                  'parent_property')),
+        'property_stations': list(models.PropertyStation.objects.order_by('id')
+                                                        .values('id', 'property',
+                                                                'station',
+                                                                'max_level')),
+        'materials': list(Material.objects.order_by('id').values('id', 'name')),
+        'stations': list(Station.objects.order_by('id').values('id', 'name')),
+        'recipes': list(Recipe.objects.order_by('id').values('id', 'name',
+                                                             'station')),
+        'recipe_inputs': list(RecipeInput.objects.order_by('id')
+                                         .values('recipe', 'material', 'quantity')),
+        'recipe_outputs': list(RecipeOutput.objects.order_by('id')
+                                           .values('recipe', 'material', 'quantity')),
+    }
+
+
+def build_snapshot(version):
+    """
+    Build the gzipped JSON :class:`Snapshot` for ``version``.
+    """
+    data = build_data()
+    data['version'] = version.etag
+    content = json.dumps(data, cls=DjangoJSONEncoder,
+                         separators=(',', ':')).encode()
+    buffer = io.BytesIO()
+    # A fixed mtime keeps the bytes, like the ETag, the same for every build
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as f:
+        f.write(content)
+    return Snapshot(version=version, content=buffer.getvalue())
+
+
+def snapshot_path(directory, version):
+    return os.path.join(directory, version.etag + SUFFIX)
+
+
+def save_snapshot(snapshot, directory=None):
+    """
+    Write ``snapshot`` to ``directory``, by default ``settings.SNAPSHOT_DIR``.
+    Readers only ever see complete files.
+    """
+    directory = directory or settings.SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, snapshot.version)
+    temporary = tempfile.NamedTemporaryFile('wb', prefix='.tmp-',
+                                            dir=directory, delete=False)
+    with temporary:
+        temporary.write(snapshot.content)
+    os.replace(temporary.name, path)
+
+    saved = sorted((os.path.join(directory, entry)
+                    for entry in os.listdir(directory)
+                    if entry.endswith(SUFFIX) and not entry.startswith('.')),
+                   key=os.path.getmtime)
+    for old in saved[:-KEEP_VERSIONS]:
+        if old != path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+def load_snapshot(version, directory=None):
+    """
+    Return the saved :class:`Snapshot` for ``version``, or ``None`` if it has
+    not been saved yet.
+    """
+    directory = directory or settings.SNAPSHOT_DIR
+    try:
+        with open(snapshot_path(directory, version), 'rb') as f:
+            return Snapshot(version=version, content=f.read())
+    except OSError:
+        return None
+
+
+def save_current_snapshot():
+    """
+    Build and save the snapshot of the current version, unless it is saved
+    already, and return it.
+    """
+    version = get_version()
+    snapshot = load_snapshot(version)
+    if snapshot is None:
+        snapshot = build_snapshot(version)
+        save_snapshot(snapshot)
+    return snapshot
@@ -1,13 +1,54 @@
-from django.db import IntegrityError
-from django.test import TestCase
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
 
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, QueryDict
+from django.test import (RequestFactory,
+                         SimpleTestCase,
+                         TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import numpy as np
+
+from bdo_tools import metrics
+from bdo_tools.asgi import ASGIApplication, build_environ
+from bdo_tools.pagination import encode_cursor
+from .admin import PropertyAdmin
+from .autocomplete import (get_autocomplete_index,
+                           invalidate_autocomplete_index)
+from .availability import rebuild_station_availability
+from .distances import HubDistances, get_hub_distances
+from .facets import invalidate_facet_counts
+from .generation import generate_world
+from .importing import WorldImportError, WorldImporter, export_world
+from .graph import NodeGraph, get_graph, invalidate_graph
+from .partitions import PartitionedGraph, invalidate_partitioned_graph
+from .planner import PlanningError, steiner_tree
+from .search import _search_fallback, _search_postgresql, search, trigrams
+from .snapshot import invalidate_version, save_current_snapshot
 from .models import (Kingdom,
                      Node,
                      Property,
                      PropertyStation,
                      Resource,
+                     StationAvailability,
                      Territory)
 from crafting.models import Material, Station
+from jobs.models import Job
 
 
 class KingdomTerritoryRelationTests(TestCase):
@@ -753,9 +794,2043 @@ class PropertyStationRelationTests(TestCase):
                          4)
 
 
+class NodeGraphTests(SimpleTestCase):
+    """
+    The in-memory NodeGraph should find the cheapest path from any hub.
+    """
+    def setUp(self):
+        # 1 (hub) - 2 (5) - 3 (1) - 4 (hub)
+        #            \               /
+        #             5 (10) --------
+        self.graph = NodeGraph([(1, 'Hub A', True, None),
+                                (2, 'Two', False, 5),
+                                (3, 'Three', False, 1),
+                                (4, 'Hub B', True, None),
+                                (5, 'Five', False, 10),
+                                (6, 'Island', False, 1)],
+                               [(1, 2), (2, 3), (3, 4), (2, 5), (5, 4)])
+
+    def test_neighbours(self):
+        self.assertEqual(self.graph.neighbours(2), [1, 3, 5])
+        self.assertEqual(self.graph.neighbours(6), [])
+
+    def test_hub(self):
+        """
+        A hub is reached from itself for free.
+        """
+        self.assertEqual(self.graph.cheapest_path(1), (0, [1]))
+
+    def test_nearest_hub(self):
+        """
+        Node 3 is cheaper to reach from Hub B than from Hub A.
+        """
+        self.assertEqual(self.graph.cheapest_path(3), (1, [4, 3]))
+        self.assertEqual(self.graph.cheapest_path(2), (5, [1, 2]))
+
+    def test_cheaper_detour(self):
+        """
+        Node 5 is cheapest directly from Hub B.
+        """
+        self.assertEqual(self.graph.cheapest_path(5), (10, [4, 5]))
+
+    def test_unreachable(self):
+        self.assertIsNone(self.graph.cheapest_path(6))
+
+    def test_unknown_node(self):
+        with self.assertRaises(KeyError):
+            self.graph.cheapest_path(99)
+
+
+class NodePathViewTests(TestCase):
+    """
+    The path endpoint should serve routes from the shared graph and notice
+    changes to the network.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.hub = create_node(name='Test Hub', is_hub=True,
+                              contribution_cost=None)
+        cls.node = create_node(name='Test Node', territory=cls.hub.territory)
+        cls.hub.connected_nodes.add(cls.node)
+
+    def setUp(self):
+        # The shared graph outlives the rolled back data of other tests
+        invalidate_graph()
+
+    def test_path(self):
+        response = self.client.get(reverse('nodes:nodes:path',
+                                           kwargs={'pk': self.node.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(),
+                         {'node': self.node.pk,
+                          'hub': self.hub.pk,
+                          'reachable': True,
+                          'cost': 2,
+                          'path': [{'id': self.hub.pk, 'name': 'Test Hub'},
+                                   {'id': self.node.pk, 'name': 'Test Node'}]})
+
+    def test_no_queries_once_built(self):
+        get_graph()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('nodes:nodes:path',
+                                    kwargs={'pk': self.node.pk}))
+
+    def test_unreachable(self):
+        node = create_node(name='Test Island', territory=self.hub.territory)
+        response = self.client.get(reverse('nodes:nodes:path',
+                                           kwargs={'pk': node.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['reachable'])
+
+    def test_edge_change(self):
+        """
+        Removing the only edge makes the node unreachable.
+        """
+        get_graph()
+        self.hub.connected_nodes.remove(self.node)
+        self.assertIsNone(get_graph().cheapest_path(self.node.pk))
+
+    def test_edit_elsewhere(self):
+        """
+        Edits without signals, as by another process, show after the recheck.
+        """
+        get_graph()
+        Node.objects.filter(pk=self.node.pk).update(contribution_cost=5,
+                                                    modified=timezone.now())
+        self.assertEqual(get_graph().cheapest_path(self.node.pk).cost, 2)
+        with override_settings(SHARED_CACHE_RECHECK_SECONDS=0):
+            self.assertEqual(get_graph().cheapest_path(self.node.pk).cost, 5)
+
+    def test_distances_saved_elsewhere(self):
+        """
+        After an edit by another process, the distances that process saved are
+        mapped rather than worked out again.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        url = reverse('nodes:nodes:path', kwargs={'pk': self.node.pk})
+        with override_settings(HUB_DISTANCE_DIR=directory):
+            self.client.get(url)
+            Node.objects.filter(pk=self.node.pk).update(contribution_cost=5,
+                                                        modified=timezone.now())
+            HubDistances.compute(NodeGraph.from_db()).save(directory)
+            self.assertEqual(self.client.get(url).json()['cost'], 2)
+            with override_settings(SHARED_CACHE_RECHECK_SECONDS=0), \
+                    mock.patch.object(HubDistances, 'save') as save:
+                self.assertEqual(self.client.get(url).json()['cost'], 5)
+            save.assert_not_called()
+
+    def test_from_hub(self):
+        other = create_node(name='Other Hub', is_hub=True,
+                            contribution_cost=None,
+                            territory=self.hub.territory)
+        other.connected_nodes.add(self.hub)
+        url = reverse('nodes:nodes:path', kwargs={'pk': self.node.pk})
+        data = self.client.get(url, {'hub': other.pk}).json()
+        self.assertEqual([node['id'] for node in data['path']],
+                         [other.pk, self.hub.pk, self.node.pk])
+        self.assertEqual(self.client.get(url, {'hub': self.node.pk})
+                                    .status_code, 400)
+        self.assertEqual(self.client.get(url, {'hub': 'x'}).status_code, 400)
+
+    def test_missing_node(self):
+        response = self.client.get(reverse('nodes:nodes:path',
+                                           kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+
+
+class SteinerTreeTests(SimpleTestCase):
+    """
+    The Steiner tree heuristic should share nodes between targets.
+    """
+    def setUp(self):
+        #          4 (1)   5 (1)
+        #            \     /
+        # 1 (hub) - 2 (3) - 3 (1)
+        #  \
+        #   6 (2) - 7 (2)
+        self.graph = NodeGraph([(1, 'Hub', True, None),
+                                (2, 'Two', False, 3),
+                                (3, 'Three', False, 1),
+                                (4, 'Four', False, 1),
+                                (5, 'Five', False, 1),
+                                (6, 'Six', False, 2),
+                                (7, 'Seven', False, 2),
+                                (8, 'Island', False, 1)],
+                               [(1, 2), (2, 3), (2, 4), (3, 5), (1, 6),
+                                (6, 7)])
+
+    def test_single_target(self):
+        self.assertEqual(steiner_tree(self.graph, [5]), (5, [2, 3, 5]))
+
+    def test_shared_path(self):
+        """
+        Nodes 4 and 5 both go through node 2, which is only paid for once.
+        """
+        self.assertEqual(steiner_tree(self.graph, [4, 5]), (6, [2, 3, 4, 5]))
+
+    def test_separate_branches(self):
+        self.assertEqual(steiner_tree(self.graph, [4, 7]),
+                         (8, [2, 4, 6, 7]))
+
+    def test_hub_target(self):
+        self.assertEqual(steiner_tree(self.graph, [1]), (0, []))
+
+    def test_unreachable(self):
+        with self.assertRaises(PlanningError):
+            steiner_tree(self.graph, [4, 8])
+
+
+class ResourcePlanViewTests(TestCase):
+    """
+    The plan endpoint should combine node and resource costs.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.hub = create_node(name='Test Hub', is_hub=True,
+                              contribution_cost=None)
+        territory = cls.hub.territory
+        cls.node1 = create_node(name='Test Node 1', territory=territory)
+        cls.node2 = create_node(name='Test Node 2', territory=territory)
+        cls.hub.connected_nodes.add(cls.node1)
+        cls.node1.connected_nodes.add(cls.node2)
+        cls.resource1 = create_resource(node=cls.node1)
+        cls.resource2 = create_resource(node=cls.node2, contribution_cost=3)
+
+    def setUp(self):
+        invalidate_graph()
+
+    def test_plan(self):
+        response = self.client.get(reverse('nodes:plan'), {
+            'resources': '{},{}'.format(self.resource1.pk, self.resource2.pk)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(),
+                         {'cost': 8,
+                          'node_cost': 4,
+                          'resource_cost': 4,
+                          'resources': sorted([self.resource1.pk,
+                                               self.resource2.pk]),
+                          'nodes': [{'id': self.node1.pk,
+                                     'name': 'Test Node 1'},
+                                    {'id': self.node2.pk,
+                                     'name': 'Test Node 2'}]})
+
+    def test_missing_resource(self):
+        response = self.client.get(reverse('nodes:plan'), {'resources': '0'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bad_resources(self):
+        response = self.client.get(reverse('nodes:plan'), {'resources': 'a'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('nodes:plan'))
+        self.assertEqual(response.status_code, 400)
+
+
+class UniqueNameTests(TestCase):
+    """
+    Kingdoms, Territories, Materials and Stations are looked up by name and
+    must not share one.
+    """
+    def test_kingdom(self):
+        Kingdom.objects.create(name='Test Kingdom')
+        with self.assertRaises(IntegrityError):
+            Kingdom.objects.create(name='Test Kingdom')
+
+    def test_territory(self):
+        kingdom = Kingdom.objects.create(name='Test Kingdom')
+        Territory.objects.create(name='Test Territory', kingdom=kingdom)
+        with self.assertRaises(IntegrityError):
+            Territory.objects.create(name='Test Territory', kingdom=kingdom)
+
+    def test_material(self):
+        Material.objects.create(name='Test Material')
+        with self.assertRaises(IntegrityError):
+            Material.objects.create(name='Test Material')
+
+    def test_station(self):
+        Station.objects.create(name='Test Station')
+        with self.assertRaises(IntegrityError):
+            Station.objects.create(name='Test Station')
+
+
+class ViewQueryCountTests(TestCase):
+    """
+    Every route should run a fixed number of queries, no matter how many rows
+    it shows. The data has several rows for every relation a template walks.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+
+    def assertRouteQueries(self, url_name, num, **kwargs):
+        """
+        Assert that the route renders successfully with ``num`` queries.
+        """
+        with self.assertNumQueries(num):
+            response = self.client.get(reverse(url_name, kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+
+    def test_main(self):
+        self.assertRouteQueries('nodes:main', 0)
+
+    def test_kingdom_list(self):
+        self.assertRouteQueries('nodes:kingdoms:list', 1)
+
+    def test_kingdom_detail(self):
+        self.assertRouteQueries('nodes:kingdoms:detail', 2,
+                                pk=self.world['kingdom'].pk)
+
+    def test_territory_list(self):
+        self.assertRouteQueries('nodes:territories:list', 1)
+
+    def test_territory_detail(self):
+        self.assertRouteQueries('nodes:territories:detail', 3,
+                                pk=self.world['territories'][0].pk)
+
+    def test_node_list(self):
+        """
+        One query for the rows and one for every facet count, which are then
+        cached.
+        """
+        self.assertRouteQueries('nodes:nodes:list', 2)
+
+    def test_node_detail(self):
+        """
+        A cached page costs one query to check that it is current.
+        """
+        self.assertRouteQueries('nodes:nodes:detail', 5,
+                                pk=self.world['nodes'][1].pk)
+        self.assertRouteQueries('nodes:nodes:detail', 1,
+                                pk=self.world['nodes'][1].pk)
+
+    def test_node_path(self):
+        """
+        The graph is built with two queries, after one for its version, and
+        then reused.
+        """
+        invalidate_graph()
+        self.assertRouteQueries('nodes:nodes:path', 3,
+                                pk=self.world['nodes'][1].pk)
+        self.assertRouteQueries('nodes:nodes:path', 0,
+                                pk=self.world['nodes'][2].pk)
+
+    def test_plan(self):
+        get_graph()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('nodes:plan'), {
+                'resources': ','.join(str(resource.pk) for resource
+                                      in self.world['resources'])})
+        self.assertEqual(response.status_code, 200)
+
+    def test_property_list(self):
+        self.assertRouteQueries('nodes:properties:list', 2)
+
+    def test_property_detail(self):
+        self.assertRouteQueries('nodes:properties:detail', 5,
+                                pk=self.world['properties'][0].pk)
+        self.assertRouteQueries('nodes:properties:detail', 1,
+                                pk=self.world['properties'][0].pk)
+
+
+class AdminQueryCountTests(TestCase):
+    """
+    Admin changelists should run the same number of queries no matter how
+    many rows they show.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+        cls.user = User.objects.create_superuser('admin', 'admin@test.com',
+                                                 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def count_queries(self, url_name):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertFlatChangelist(self, url_name, add_rows):
+        """
+        Assert that ``add_rows`` does not change the changelist query count.
+        """
+        before = self.count_queries(url_name)
+        add_rows()
+        self.assertEqual(self.count_queries(url_name), before)
+
+    def test_property_changelist(self):
+        def add_rows():
+            node = self.world['nodes'][0]
+            for i in range(5):
+                property = Property.objects.create(
+                    name='Extra Property {}'.format(i), node=node)
+                for station in self.world['stations']:
+                    PropertyStation.objects.create(property=property,
+                                                   station=station,
+                                                   max_level=1)
+        self.assertFlatChangelist('admin:nodes_property_changelist', add_rows)
+
+    def test_property_station_columns(self):
+        """
+        Station columns come from the prefetched stations in creation order.
+        """
+        model_admin = PropertyAdmin(Property, admin.site)
+        request = self.client.get('/').wsgi_request
+        property = model_admin.get_queryset(request)\
+                              .get(pk=self.world['properties'][0].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [model_admin.get_station_1(property),
+                 model_admin.get_station_2(property),
+                 model_admin.get_station_3(property),
+                 model_admin.get_station_4(property),
+                 model_admin.get_station_5(property)],
+                self.world['stations'] + [None, None])
+
+    def test_node_changelist(self):
+        def add_rows():
+            for i in range(5):
+                create_node(name='Extra Node {}'.format(i))
+        self.assertFlatChangelist('admin:nodes_node_changelist', add_rows)
+
+    def test_resource_changelist(self):
+        def add_rows():
+            for node in self.world['nodes']:
+                create_resource(node=node)
+        self.assertFlatChangelist('admin:nodes_resource_changelist', add_rows)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    List pages should be split with stable keyset cursors.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        territory = create_node(name='Test Node 0').territory
+        # Names sort in the opposite order to ids
+        for i in range(1, 7):
+            create_node(name='Test Node {}'.format(7 - i), territory=territory)
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('nodes:nodes:list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def names(self, response):
+        return [node.name for node in response.context['object_list']]
+
+    def follow(self, response, key):
+        query = QueryDict(response.context[key])
+        return self.get_page(**query.dict())
+
+    def test_first_page(self):
+        response = self.get_page(size=3, order='name')
+        self.assertEqual(self.names(response),
+                         ['Test Node 0', 'Test Node 1', 'Test Node 2'])
+        self.assertIsNone(response.context['previous_page_query'])
+        self.assertIsNotNone(response.context['next_page_query'])
+
+    def test_walk_forwards_and_back(self):
+        first = self.get_page(size=3, order='name')
+        second = self.follow(first, 'next_page_query')
+        self.assertEqual(self.names(second),
+                         ['Test Node 3', 'Test Node 4', 'Test Node 5'])
+        third = self.follow(second, 'next_page_query')
+        self.assertEqual(self.names(third), ['Test Node 6'])
+        self.assertIsNone(third.context['next_page_query'])
+        back = self.follow(third, 'previous_page_query')
+        self.assertEqual(self.names(back), self.names(second))
+        back = self.follow(back, 'previous_page_query')
+        self.assertEqual(self.names(back), self.names(first))
+        self.assertIsNone(back.context['previous_page_query'])
+
+    def test_id_order(self):
+        response = self.get_page(size=2)
+        self.assertEqual(self.names(response), ['Test Node 0', 'Test Node 6'])
+
+    def test_duplicate_names(self):
+        """
+        Rows with the same name are split by id without skipping any.
+        """
+        territory = Territory.objects.get()
+        for _ in range(3):
+            create_node(name='Test Node 1', territory=territory)
+        first = self.get_page(size=2, order='name')
+        second = self.follow(first, 'next_page_query')
+        third = self.follow(second, 'next_page_query')
+        self.assertEqual(self.names(first) + self.names(second)
+                         + self.names(third)[:2],
+                         ['Test Node 0'] + ['Test Node 1'] * 4 + ['Test Node 2'])
+
+    def test_constant_queries(self):
+        first = self.get_page(size=2, order='name')
+        query = QueryDict(first.context['next_page_query']).dict()
+        with self.assertNumQueries(1):
+            self.client.get(reverse('nodes:nodes:list'), query)
+
+    def test_page_size_limit(self):
+        response = self.get_page(size=0)
+        self.assertEqual(len(response.context['object_list']), 1)
+
+    def test_bad_parameters(self):
+        for params in ({'after': 'not a cursor'},
+                       {'before': 'not a cursor'},
+                       {'order': 'node_manager'},
+                       {'size': 'ten'}):
+            response = self.client.get(reverse('nodes:nodes:list'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()['errors']), list(params))
+
+    def test_wrong_cursor_types(self):
+        """
+        Cursors that decode but hold values of the wrong types are refused.
+        """
+        for values in ([{'a': 1}], ['x'], [[1]], [None], [float('inf')],
+                       ['Test Node 1', 'x']):
+            order = 'name' if len(values) == 2 else 'id'
+            response = self.client.get(reverse('nodes:nodes:list'),
+                                       {'after': encode_cursor(values),
+                                        'order': order})
+            self.assertEqual(response.status_code, 400, values)
+
+
+class APITests(TestCase):
+    """
+    The read-only API should stream bulk results with only requested fields.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+
+    def get_list(self, name, **params):
+        response = self.client.get('/api/{}/'.format(name), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content).decode())
+
+    def test_list(self):
+        nodes = self.get_list('nodes')
+        self.assertEqual([node['id'] for node in nodes],
+                         [node.pk for node in self.world['nodes']])
+        node = nodes[1]
+        self.assertEqual(node['kingdom'], {'id': self.world['kingdom'].pk,
+                                           'name': 'Test Kingdom'})
+        self.assertEqual(sorted(node['connected_nodes']),
+                         [n.pk for n in self.world['nodes']
+                          if n.name in ('Test Node 0', 'Test Node 2',
+                                        'Test Node 3', 'Test Node 4')])
+        self.assertEqual(len(node['resources']), 3)
+
+    def test_ids(self):
+        ids = [self.world['nodes'][3].pk, self.world['nodes'][1].pk]
+        nodes = self.get_list('nodes', ids=','.join(map(str, ids)))
+        self.assertEqual([node['id'] for node in nodes], sorted(ids))
+
+    def test_sparse_fields(self):
+        nodes = self.get_list('nodes', fields='id,name')
+        self.assertEqual(nodes[0], {'id': self.world['nodes'][0].pk,
+                                    'name': 'Test Node 0'})
+
+    def test_sparse_fields_skip_relations(self):
+        with self.assertNumQueries(2):
+            self.get_list('nodes', fields='id,name')
+
+    def test_constant_queries(self):
+        """
+        One query for the rows, one per prefetched relation and one to find
+        the end of the stream.
+        """
+        with self.assertNumQueries(5):
+            self.get_list('nodes')
+        with self.assertNumQueries(4):
+            self.get_list('properties')
+        with self.assertNumQueries(2):
+            self.get_list('property-stations')
+
+    def test_batches(self):
+        with mock.patch('nodes.api.NodeViewSet.stream_batch_size', 4):
+            nodes = self.get_list('nodes', fields='id')
+        self.assertEqual(len(nodes), len(self.world['nodes']))
+
+    def test_detail(self):
+        property = self.world['properties'][0]
+        response = self.client.get('/api/properties/{}/'.format(property.pk),
+                                   {'fields': 'name,stations'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], property.name)
+        self.assertEqual([s['max_level'] for s in response.json()['stations']],
+                         [1, 2, 3])
+
+    def test_bad_parameters(self):
+        for params in ({'fields': 'id,cost'}, {'ids': 'one'}):
+            response = self.client.get('/api/nodes/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+class SnapshotViewTests(TestCase):
+    """
+    The snapshot should describe the whole world, be built by its job and be
+    revalidated cheaply.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(SNAPSHOT_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        invalidate_version()
+        save_current_snapshot()
+
+    def get(self, **headers):
+        return self.client.get(reverse('nodes:snapshot'), **headers)
+
+    def test_gzip(self):
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content).decode())
+        self.assertEqual(len(data['nodes']), len(self.world['nodes']))
+        self.assertEqual(len(data['edges']), 7)
+        self.assertEqual(len(data['property_stations']),
+                         PropertyStation.objects.count())
+
+    def test_identity(self):
+        response = self.get()
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(json.loads(response.content.decode())['stations']),
+                         len(self.world['stations']))
+        self.assertNotEqual(response['ETag'],
+                            self.get(HTTP_ACCEPT_ENCODING='gzip')['ETag'])
+
+    def test_accept_encoding(self):
+        for header, gzipped in [('gzip;q=0', False),
+                                ('deflate, gzip;q=0.5', True),
+                                ('GZIP', True),
+                                ('*', True),
+                                ('*, gzip;q=0', False),
+                                ('identity', False)]:
+            response = self.get(HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(response.has_header('Content-Encoding'), gzipped,
+                             header)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.get()
+
+    def test_edit_elsewhere(self):
+        """
+        Edits without signals, as by another process, show after the recheck.
+        """
+        etag = self.get()['ETag']
+        Node.objects.filter(pk=self.world['nodes'][0].pk).update(
+            name='Renamed Node', modified=timezone.now())
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        save_current_snapshot()
+        with override_settings(SHARED_CACHE_RECHECK_SECONDS=0):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_not_built(self):
+        """
+        Requests never build the snapshot; they queue its job and ask the
+        client to retry.
+        """
+        Node.objects.filter(pk=self.world['nodes'][0].pk).update(
+            name='Renamed Node', modified=timezone.now())
+        invalidate_version()
+        Job.objects.all().delete()
+        with mock.patch('nodes.snapshot.build_data') as build_data:
+            response = self.get()
+        build_data.assert_not_called()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertTrue(Job.objects.filter(name='nodes.build_snapshot',
+                                           status=Job.QUEUED).exists())
+
+    def assertChanges(self, change):
+        etag = self.get()['ETag']
+        change()
+        run_on_commit()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 503)
+        self.assertTrue(Job.objects.filter(name='nodes.build_snapshot',
+                                           status=Job.QUEUED).exists())
+        save_current_snapshot()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_change_node(self):
+        node = self.world['nodes'][2]
+        node.name = 'Renamed Node'
+        self.assertChanges(node.save)
+
+    def test_change_edge(self):
+        nodes = self.world['nodes']
+        self.assertChanges(lambda: nodes[0].connected_nodes.add(nodes[5]))
+
+    def test_delete(self):
+        self.assertChanges(self.world['resources'][0].delete)
+
+
+class DetailPageCacheTests(TestCase):
+    """
+    Cached detail pages should be served until something they show changes.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+
+    def get(self, url_name, obj):
+        return self.client.get(reverse(url_name, kwargs={'pk': obj.pk}))\
+                          .content.decode()
+
+    def assertShows(self, url_name, obj, change, text):
+        """
+        Cache the page, make the change and check that the page shows
+        ``text`` afterwards.
+        """
+        self.assertNotIn(text, self.get(url_name, obj))
+        change()
+        self.assertIn(text, self.get(url_name, obj))
+
+    def rename(self, obj, name):
+        def change():
+            # Leave the shared test data untouched
+            fresh = type(obj).objects.get(pk=obj.pk)
+            fresh.name = name
+            fresh.save()
+        return change
+
+    def test_own_change(self):
+        node = self.world['nodes'][1]
+        self.assertShows('nodes:nodes:detail', node,
+                         self.rename(node, 'Renamed Node'), 'Renamed Node')
+
+    def test_neighbour_change(self):
+        nodes = self.world['nodes']
+        self.assertShows('nodes:nodes:detail', nodes[1],
+                         self.rename(nodes[2], 'Renamed Neighbour'),
+                         'Renamed Neighbour')
+
+    def test_edge_change(self):
+        nodes = self.world['nodes']
+        self.assertShows('nodes:nodes:detail', nodes[5],
+                         lambda: nodes[1].connected_nodes.add(nodes[5]),
+                         'Test Node 1')
+
+    def test_edge_clear(self):
+        nodes = self.world['nodes']
+        self.get('nodes:nodes:detail', nodes[3])
+        nodes[1].connected_nodes.clear()
+        self.assertNotIn('Test Node 1', self.get('nodes:nodes:detail', nodes[3]))
+
+    def test_resource_change(self):
+        node = self.world['nodes'][3]
+        self.assertShows('nodes:nodes:detail', node,
+                         lambda: create_resource(node=node,
+                                                 contribution_cost=99),
+                         '<td>99</td>')
+
+    def test_property_change(self):
+        parent = self.world['properties'][0]
+        child = self.world['properties'][1]
+        self.assertShows('nodes:properties:detail', parent,
+                         self.rename(child, 'Renamed Child'), 'Renamed Child')
+        self.assertShows('nodes:nodes:detail', parent.node,
+                         self.rename(parent, 'Renamed Parent'),
+                         'Renamed Parent')
+
+    def test_property_moved(self):
+        """
+        The page of the node a property moved off no longer shows it.
+        """
+        property = Property.objects.get(pk=self.world['properties'][0].pk)
+        old_node = property.node
+        link = reverse('nodes:properties:detail', kwargs={'pk': property.pk})
+        self.assertIn(link, self.get('nodes:nodes:detail', old_node))
+        property.node = self.world['nodes'][5]
+        property.save()
+        self.assertNotIn(link, self.get('nodes:nodes:detail', old_node))
+
+    def test_property_station_change(self):
+        property = self.world['properties'][0]
+        self.assertShows('nodes:properties:detail', property,
+                         lambda: PropertyStation.objects.create(
+                             property=property,
+                             station=Station.objects.create(name='New Station'),
+                             max_level=1),
+                         'New Station')
+
+    def test_related_renames(self):
+        node = self.world['nodes'][1]
+        parent = self.world['properties'][4]
+        child = self.world['properties'][5]
+        self.assertShows('nodes:nodes:detail', node,
+                         self.rename(node.territory, 'Renamed Territory'),
+                         'Renamed Territory')
+        self.assertShows('nodes:properties:detail', child,
+                         self.rename(self.world['kingdom'], 'Renamed Kingdom'),
+                         'Renamed Kingdom')
+        self.assertShows('nodes:nodes:detail', node,
+                         self.rename(self.world['materials'][0],
+                                     'Renamed Material'),
+                         'Renamed Material')
+        # Shown by the parent in the stations of its subtree
+        self.assertShows('nodes:properties:detail', parent,
+                         self.rename(self.world['stations'][0],
+                                     'Renamed Station'),
+                         'Renamed Station')
+
+
 #
+class GenerateWorldTests(TestCase):
+    """
+    generate_world builds a connected, symmetrical world of the requested size
+    and benchmark_views can measure every page of it.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.size = generate_world(kingdoms=2, territories_per_kingdom=2,
+                                  nodes=36, hub_every=3, materials=5,
+                                  stations=4, recipes=3, seed=1)
+
+    def setUp(self):
+        invalidate_graph()
+
+    def test_counts(self):
+        self.assertEqual(self.size.kingdoms, Kingdom.objects.count())
+        self.assertEqual(self.size.territories, 4)
+        self.assertEqual(self.size.nodes, 36)
+        self.assertEqual(self.size.resources, Resource.objects.count())
+        self.assertEqual(self.size.properties, Property.objects.count())
+        self.assertEqual(self.size.property_stations,
+                         PropertyStation.objects.count())
+        self.assertEqual(self.size.property_stations,
+                         StationAvailability.objects.count())
+        self.assertTrue(Property.objects.filter(parent_property__isnull=False)
+                                        .exists())
+        self.assertEqual(Node.objects.filter(is_hub=True).count(), 4)
+
+    def test_edges_are_symmetrical(self):
+        through = Node.connected_nodes.through.objects
+        self.assertEqual(through.count(), 2 * self.size.edges)
+        for a, b in through.values_list('from_node_id', 'to_node_id'):
+            self.assertTrue(through.filter(from_node_id=b, to_node_id=a).exists())
+
+    def test_connected(self):
+        graph = get_graph()
+        for node_id in graph.ids:
+            self.assertIsNotNone(graph.cheapest_path(node_id))
+
+    def test_same_seed_same_world(self):
+        generate_world(kingdoms=2, territories_per_kingdom=2, nodes=36,
+                       hub_every=3, materials=5, stations=4, recipes=3, seed=1,
+                       prefix='Again')
+
+        def world(prefix):
+            return list(Node.objects.filter(name__startswith=prefix)
+                                    .order_by('id')
+                                    .values_list('contribution_cost',
+                                                 'connected_nodes__name'))
+
+        self.assertEqual(
+            world('Generated'),
+            [(cost, name.replace('Again', 'Generated') if name else name)
+             for cost, name in world('Again')])
+
+    def test_benchmark_views(self):
+        out = StringIO()
+        err = StringIO()
+        call_command('benchmark_views', repeat=1, stdout=out, stderr=err)
+        self.assertEqual(err.getvalue(), '')
+        self.assertIn('nodes:nodes detail', out.getvalue())
+        self.assertIn('crafting:stations detail', out.getvalue())
+
+
+class ImportWorldTests(TestCase):
+    """
+    import_world reads dumps written by export_world, creating new rows and
+    updating existing ones by name.
+    """
+    def setUp(self):
+        invalidate_graph()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, kind, records):
+        with open(os.path.join(self.directory, kind + '.jsonl'), 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+    def read(self, directory, kind):
+        with open(os.path.join(directory, kind + '.jsonl')) as f:
+            return sorted(f)
+
+    def test_round_trip(self):
+        create_world()
+        export_world(self.directory)
+        Kingdom.objects.all().delete()
+        Material.objects.all().delete()
+        Station.objects.all().delete()
+
+        report = WorldImporter(self.directory, batch_size=4).run()
+        self.assertEqual(report['nodes']['created'], 6)
+        self.assertEqual(report['edges']['created'], 7)
+        self.assertEqual(report['properties']['created'], 24)
+        self.assertEqual(report['property_stations']['created'], 72)
+        self.assertEqual(StationAvailability.objects.count(), 72)
+        again = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, again)
+        export_world(again)
+        for kind in ('kingdoms', 'territories', 'materials', 'stations', 'nodes',
+                     'edges', 'resources', 'properties', 'property_stations'):
+            self.assertEqual(self.read(self.directory, kind),
+                             self.read(again, kind))
+
+    def test_reimport_updates(self):
+        world = create_world()
+        export_world(self.directory)
+        Node.objects.filter(pk=world['nodes'][1].pk).update(contribution_cost=9)
+
+        report = WorldImporter(self.directory).run()
+        self.assertEqual(report['nodes'],
+                         {'created': 0, 'updated': 6, 'unchanged': 0})
+        self.assertEqual(report['edges'], {'created': 0, 'deleted': 0})
+        self.assertEqual(Node.objects.get(pk=world['nodes'][1].pk)
+                             .contribution_cost, 1)
+        self.assertEqual(Node.objects.count(), 6)
+
+    def test_csv(self):
+        with open(os.path.join(self.directory, 'kingdoms.csv'), 'w') as f:
+            f.write('name\nTest Kingdom\n')
+        with open(os.path.join(self.directory, 'territories.csv'), 'w') as f:
+            f.write('name,kingdom\nTest Territory,Test Kingdom\n')
+        with open(os.path.join(self.directory, 'nodes.csv'), 'w') as f:
+            f.write('name,territory,is_hub,contribution_cost,node_manager\n'
+                    'Hub,Test Territory,true,,\n'
+                    'Farm,Test Territory,false,2,Manager\n')
+
+        WorldImporter(self.directory).run()
+        hub = Node.objects.get(name='Hub')
+        farm = Node.objects.get(name='Farm')
+        self.assertEqual((hub.is_hub, hub.contribution_cost, hub.node_manager),
+                         (True, None, None))
+        self.assertEqual((farm.is_hub, farm.contribution_cost, farm.node_manager),
+                         (False, 2, 'Manager'))
+
+    def test_unknown_reference(self):
+        self.write('territories', [{'name': 'Test Territory',
+                                    'kingdom': 'Nowhere'}])
+        with self.assertRaises(WorldImportError):
+            WorldImporter(self.directory).run()
+
+    def test_parent_later_in_file(self):
+        create_node(name='Test Node')
+        self.write('properties', [
+            {'name': 'Child', 'node': 'Test Node', 'parent_property': 'Parent'},
+            {'name': 'Parent', 'node': 'Test Node', 'parent_property': None},
+        ])
+
+        WorldImporter(self.directory).run()
+        self.assertEqual(Property.objects.get(name='Child').parent_property,
+                         Property.objects.get(name='Parent'))
+
+    def test_edges_match_dump(self):
+        world = create_world()
+        nodes = world['nodes']
+        before = Node.objects.get(pk=nodes[5].pk).modified
+        self.write('edges', [{'node': node.name, 'connected_node': next_node.name}
+                             for node, next_node in zip(nodes, nodes[1:])])
+
+        report = WorldImporter(self.directory).run()
+        self.assertEqual(report['edges'], {'created': 0, 'deleted': 0})
+        self.assertEqual(nodes[1].connected_nodes.count(), 4)
+
+        report = WorldImporter(self.directory, sync=True).run()
+        self.assertEqual(report['edges'], {'created': 0, 'deleted': 2})
+        self.assertEqual(set(nodes[1].connected_nodes.all()),
+                         {nodes[0], nodes[2]})
+        self.assertEqual(set(nodes[3].connected_nodes.all()),
+                         {nodes[2], nodes[4]})
+        self.assertEqual(Node.objects.get(pk=nodes[5].pk).modified, before)
+        self.assertGreater(Node.objects.get(pk=nodes[4].pk).modified, before)
+
+    def test_sync_unchanged(self):
+        create_world()
+        export_world(self.directory)
+
+        with CaptureQueriesContext(connection) as queries:
+            report = WorldImporter(self.directory, sync=True).run()
+        self.assertEqual(report['nodes'], {'created': 0, 'updated': 0,
+                                           'unchanged': 6})
+        self.assertEqual(report['property_stations']['unchanged'], 72)
+        for query in queries:
+            self.assertFalse(query['sql'].startswith(('INSERT', 'UPDATE',
+                                                      'DELETE')), query['sql'])
+
+    def test_sync_changes(self):
+        world = create_world()
+        export_world(self.directory)
+        nodes = [json.loads(line) for line in self.read(self.directory, 'nodes')]
+        for node in nodes:
+            if node['name'] == 'Test Node 2':
+                node['contribution_cost'] = 5
+        self.write('nodes', nodes)
+        resources = [json.loads(line)
+                     for line in self.read(self.directory, 'resources')]
+        self.write('resources', resources[1:])
+        properties = [json.loads(line)
+                      for line in self.read(self.directory, 'properties')]
+        self.write('properties', properties + [
+            {'name': 'New', 'node': 'Test Node 5',
+             'parent_property': 'Test Node 5 Property'}])
+        untouched = Node.objects.get(pk=world['nodes'][3].pk).modified
+
+        importer = WorldImporter(self.directory, sync=True)
+        report = importer.run()
+        self.assertEqual(report['nodes']['updated'], 1)
+        self.assertEqual(report['resources']['deleted'], 1)
+        self.assertEqual(report['properties']['created'], 1)
+        self.assertEqual(
+            importer.changes,
+            [('nodes', 'updated', (world['nodes'][2].territory_id,
+                                   'Test Node 2')),
+             ('resources', 'deleted', (world['nodes'][1].pk,
+                                       world['materials'][0].pk)),
+             ('properties', 'created', (world['nodes'][5].pk, 'New'))])
+        self.assertEqual(Node.objects.get(pk=world['nodes'][2].pk)
+                             .contribution_cost, 5)
+        self.assertEqual(Node.objects.get(pk=world['nodes'][3].pk).modified,
+                         untouched)
+        self.assertFalse(Resource.objects.filter(pk=world['resources'][0].pk)
+                                         .exists())
+        self.assertEqual(Property.objects.get(name='New').parent_property,
+                         world['properties'][20])
+
+    def test_sync_duplicate_node_names(self):
+        kingdom = Kingdom.objects.create(name='Test Kingdom')
+        territories = [Territory.objects.create(name='Territory {}'.format(i),
+                                                kingdom=kingdom)
+                       for i in range(2)]
+        hub = create_node(name='Hub', territory=territories[0], is_hub=True)
+        for territory in territories:
+            farm = create_node(name='Farm', territory=territory)
+            create_resource(node=farm)
+            farm.connected_nodes.add(hub)
+        export_world(self.directory)
+
+        report = WorldImporter(self.directory, sync=True).run()
+        self.assertEqual(report['nodes'], {'created': 0, 'updated': 0,
+                                           'unchanged': 3})
+        self.assertEqual(report['resources']['deleted'], 0)
+        self.assertEqual(report['edges'], {'created': 0, 'deleted': 0})
+        self.assertEqual((Node.objects.count(), Resource.objects.count(),
+                          Node.connected_nodes.through.objects.count()),
+                         (3, 2, 4))
+
+    def test_reimport_duplicate_node_names(self):
+        kingdom = Kingdom.objects.create(name='Test Kingdom')
+        territories = [Territory.objects.create(name='Territory {}'.format(i),
+                                                kingdom=kingdom)
+                       for i in range(2)]
+        hub = create_node(name='Hub', territory=territories[0], is_hub=True)
+        for territory in territories:
+            farm = create_node(name='Farm', territory=territory)
+            create_resource(node=farm)
+            farm.connected_nodes.add(hub)
+        export_world(self.directory)
+
+        report = WorldImporter(self.directory).run()
+        self.assertEqual(report['nodes']['created'], 0)
+        self.assertEqual(report['resources']['created'], 0)
+        self.assertEqual(report['edges'], {'created': 0, 'deleted': 0})
+        again = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, again)
+        export_world(again)
+        for kind in ('nodes', 'edges', 'resources'):
+            self.assertEqual(self.read(self.directory, kind),
+                             self.read(again, kind))
+
+    def test_ambiguous_reference(self):
+        kingdom = Kingdom.objects.create(name='Test Kingdom')
+        territories = [Territory.objects.create(name='Territory {}'.format(i),
+                                                kingdom=kingdom)
+                       for i in range(2)]
+        for territory in territories:
+            create_node(name='Farm', territory=territory)
+        self.write('properties', [{'name': 'House', 'node': 'Farm'}])
+        with self.assertRaisesRegex(WorldImportError, 'More than one node'):
+            WorldImporter(self.directory).run()
+
+        self.write('properties', [{'name': 'House', 'node': 'Farm',
+                                   'node_territory': 'Territory 1'}])
+        WorldImporter(self.directory).run()
+        self.assertEqual(Property.objects.get(name='House').node.territory,
+                         territories[1])
+
+    def test_duplicate_record(self):
+        self.write('kingdoms', [{'name': 'Test Kingdom'}])
+        self.write('territories', [{'name': 'Test Territory',
+                                    'kingdom': 'Test Kingdom'}])
+        self.write('nodes', [{'name': 'Farm', 'territory': 'Test Territory'},
+                             {'name': 'Farm', 'territory': 'Test Territory'}])
+        with self.assertRaisesRegex(WorldImportError, 'Duplicate'):
+            WorldImporter(self.directory).run()
+
+
+class PropertyTreeTests(TestCase):
+    """
+    Tree queries should walk any depth of parent_property in one query.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        node = create_node()
+        cls.stations = [Station.objects.create(name='Tree Station {}'.format(i))
+                        for i in range(2)]
+
+        def create(name, parent=None):
+            return Property.objects.create(name=name, node=node,
+                                           parent_property=parent)
+        # root -> a -> (b -> d, c); other is a separate tree
+        cls.root = create('Root')
+        cls.a = create('A', cls.root)
+        cls.b = create('B', cls.a)
+        cls.c = create('C', cls.a)
+        cls.d = create('D', cls.b)
+        cls.other = create('Other')
+        create('Other Child', cls.other)
+        for property, station in ((cls.root, 0), (cls.b, 1), (cls.d, 0),
+                                  (cls.other, 1)):
+            PropertyStation.objects.create(property=property,
+                                           station=cls.stations[station],
+                                           max_level=1)
+
+    def names(self, properties):
+        return sorted(property.name for property in properties)
+
+    def test_descendants(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names(Property.objects.descendants(self.root)),
+                             ['A', 'B', 'C', 'D'])
+        self.assertEqual(self.names(Property.objects.descendants(self.b.pk,
+                                                                 include_self=True)),
+                         ['B', 'D'])
+        self.assertEqual(list(Property.objects.descendants(self.c)), [])
+
+    def test_ancestors(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names(Property.objects.ancestors(self.d)),
+                             ['A', 'B', 'Root'])
+        self.assertEqual(self.names(Property.objects.ancestors(self.root,
+                                                               include_self=True)),
+                         ['Root'])
+
+    def test_subtree_stations(self):
+        with self.assertNumQueries(1):
+            stations = [(ps.property.name, ps.station.name) for ps
+                        in Property.objects.subtree_stations(self.a)]
+        self.assertEqual(sorted(stations), [('B', 'Tree Station 1'),
+                                            ('D', 'Tree Station 0')])
+
+    def test_chained(self):
+        self.assertEqual(self.names(Property.objects.filter(name__lt='C')
+                                                    .descendants(self.root)),
+                         ['A', 'B'])
+
+    def test_cycle(self):
+        Property.objects.filter(pk=self.root.pk).update(parent_property=self.d)
+        self.assertEqual(self.names(Property.objects.descendants(self.a)),
+                         ['B', 'C', 'D', 'Root'])
+
+    def test_detail_page(self):
+        response = self.client.get(reverse('nodes:properties:detail',
+                                           kwargs={'pk': self.root.pk}))
+        subtree = [(depth, property.name)
+                   for depth, property in response.context['subtree']]
+        self.assertEqual(subtree, [(1, 'A'), (2, 'B'), (3, 'D'), (2, 'C')])
+        self.assertContains(response, 'Tree Station 1')
+
+    def test_detail_page_follows_grandchildren(self):
+        url = reverse('nodes:properties:detail', kwargs={'pk': self.root.pk})
+        self.client.get(url)
+        d = Property.objects.get(pk=self.d.pk)
+        d.name = 'Renamed D'
+        d.save()
+        self.assertContains(self.client.get(url), 'Renamed D')
+        PropertyStation.objects.filter(property=self.d).update(max_level=7)
+        PropertyStation.objects.get(property=self.d).save()
+        self.assertContains(self.client.get(url), 'Tree Station 0 7')
+
+
+class HubDistancesTests(SimpleTestCase):
+    """
+    Hub distance matrices should match Dijkstra from each hub, survive being
+    saved and mapped, and be repaired to the same result as a recompute.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(HUB_DISTANCE_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Same network as NodeGraphTests
+        self.nodes = [(1, 'Hub A', True, None), (2, 'Two', False, 5),
+                      (3, 'Three', False, 1), (4, 'Hub B', True, None),
+                      (5, 'Five', False, 10), (6, 'Island', False, 1)]
+        self.edges = [(1, 2), (2, 3), (3, 4), (2, 5), (5, 4)]
+        self.distances = HubDistances.compute(NodeGraph(self.nodes, self.edges))
+
+    def test_distance(self):
+        self.assertEqual(self.distances.distance(1, 3), 6)
+        self.assertEqual(self.distances.distance(4, 2), 6)
+        self.assertEqual(self.distances.distance(1, 5), 15)
+        self.assertIsNone(self.distances.distance(1, 6))
+        with self.assertRaises(KeyError):
+            self.distances.distance(2, 3)
+
+    def test_nearest_hub(self):
+        self.assertEqual(self.distances.nearest_hub(3), 4)
+        self.assertEqual(self.distances.nearest_hub(2), 1)
+        self.assertEqual(self.distances.nearest_hub(1), 1)
+        self.assertIsNone(self.distances.nearest_hub(6))
+
+    def test_path(self):
+        self.assertEqual(self.distances.path(3), (1, [4, 3]))
+        self.assertEqual(self.distances.path(3, hub_id=1), (6, [1, 2, 3]))
+        self.assertIsNone(self.distances.path(6))
+
+    def test_save_and_map(self):
+        self.distances.save(self.directory)
+        loaded = HubDistances.load(self.directory)
+        self.assertIsInstance(loaded.dist, np.memmap)
+        self.assertFalse(loaded.dist.flags.writeable)
+        self.assertEqual(loaded.fingerprint, self.distances.fingerprint)
+        self.assertEqual(loaded.path(5), (10, [4, 5]))
+
+    def test_shared_versions(self):
+        graph = NodeGraph(self.nodes, self.edges)
+        first = get_hub_distances(graph)
+        self.assertIsInstance(first.dist, np.memmap)
+        self.assertIs(get_hub_distances(graph), first)
+
+        changed = NodeGraph(self.nodes, self.edges + [(3, 6)])
+        second = get_hub_distances(changed)
+        self.assertEqual(second.path(6), (2, [4, 3, 6]))
+        self.assertEqual(HubDistances.load(self.directory).fingerprint,
+                         changed.fingerprint)
+        # Back to a version already on disk
+        self.assertEqual(get_hub_distances(graph).fingerprint,
+                         graph.fingerprint)
+
+    def test_repair_edges_and_costs(self):
+        nodes = self.nodes[:1] + [(2, 'Two', False, 1)] + self.nodes[2:]
+        graph = NodeGraph(nodes, [(1, 2), (2, 3), (3, 6), (5, 4)])
+        # Four changes to six nodes would normally recompute
+        with mock.patch('nodes.distances.REPAIR_LIMIT', 1):
+            repaired = self.distances.updated(graph)
+        self.assertIsNotNone(repaired)
+        self.assertDistancesEqual(repaired, HubDistances.compute(graph))
+
+    def test_new_hub_recomputes(self):
+        nodes = self.nodes[:2] + [(3, 'Three', True, None)] + self.nodes[3:]
+        self.assertIsNone(self.distances.updated(NodeGraph(nodes, self.edges)))
+
+    def test_random_repairs(self):
+        rng = random.Random(0)
+        size = 60
+        nodes = [(i, str(i), i % 12 == 0, rng.randint(1, 9)) for i in range(size)]
+        edges = {(i, i + 1) for i in range(size - 1)}
+        edges.update((rng.randrange(size), rng.randrange(size)) for _ in range(40))
+        edges = {(a, b) for a, b in edges if a != b}
+        distances = HubDistances.compute(NodeGraph(nodes, edges))
+        for _ in range(30):
+            change = rng.choice(['add', 'remove', 'cost'])
+            if change == 'add':
+                edges.add((rng.randrange(size), rng.randrange(size)))
+                edges = {(a, b) for a, b in edges if a != b}
+            elif change == 'remove':
+                edges.remove(rng.choice(sorted(edges)))
+            else:
+                i = rng.randrange(size)
+                nodes[i] = nodes[i][:3] + (rng.randint(1, 9),)
+            graph = NodeGraph(nodes, edges)
+            distances = distances.updated(graph)
+            self.assertDistancesEqual(distances, HubDistances.compute(graph))
+
+    def assertDistancesEqual(self, distances, expected):
+        """
+        Assert equal costs and that every predecessor lies on a cheapest path,
+        since ties may be broken differently.
+        """
+        self.assertEqual(distances.fingerprint, expected.fingerprint)
+        self.assertEqual(distances.dist.tolist(), expected.dist.tolist())
+        self.assertEqual(distances.nearest.tolist(), expected.nearest.tolist())
+        for row in range(len(distances.hubs)):
+            for i, p in enumerate(distances.pred[row].tolist()):
+                d = distances.dist[row, i]
+                if p == -1:
+                    self.assertIn(d, (-1, 0))
+                else:
+                    self.assertEqual(d, distances.dist[row, p] +
+                                     distances.costs[i])
+                    self.assertIn(p, distances.targets[distances.offsets[i]:
+                                                       distances.offsets[i + 1]])
+
+
+class StationAvailabilityTests(TestCase):
+    """
+    The station availability rollup should always match what a rebuild from
+    the normalised tables gives.
+    """
+    def setUp(self):
+        self.world = create_world()
+
+    def rollup(self):
+        return sorted(StationAvailability.objects.values_list(
+            'property_station_id', 'station_id', 'max_level', 'property_id',
+            'property_name', 'node_id', 'node_name', 'territory_id',
+            'territory_name', 'kingdom_id', 'kingdom_name'))
+
+    def assertCurrent(self):
+        """
+        Assert that the rollup is what a rebuild from scratch would write.
+        """
+        current = self.rollup()
+        self.assertEqual(rebuild_station_availability(), len(current))
+        self.assertEqual(current, self.rollup())
+
+    def test_created(self):
+        self.assertEqual(StationAvailability.objects.count(),
+                         PropertyStation.objects.count())
+        self.assertCurrent()
+
+    def test_property_station_change(self):
+        property_station = PropertyStation.objects.first()
+        property_station.max_level = 9
+        property_station.save()
+        self.assertEqual(property_station.availability.max_level, 9)
+        self.assertCurrent()
+
+    def test_property_station_delete(self):
+        PropertyStation.objects.first().delete()
+        self.assertCurrent()
+
+    def test_property_moved(self):
+        property = self.world['properties'][0]
+        property.name = 'Moved Property'
+        property.node = self.world['nodes'][4]
+        property.save()
+        self.assertEqual(set(property.station_availability.values_list(
+            'property_name', 'node_name', 'territory_id')),
+            {('Moved Property', 'Test Node 4', self.world['territories'][1].pk)})
+        self.assertCurrent()
+
+    def test_node_moved(self):
+        node = self.world['nodes'][1]
+        node.name = 'Renamed Node'
+        node.territory = self.world['territories'][2]
+        node.save()
+        self.assertCurrent()
+
+    def test_territory_moved(self):
+        kingdom = Kingdom.objects.create(name='Other Kingdom')
+        territory = self.world['territories'][0]
+        territory.name = 'Renamed Territory'
+        territory.kingdom = kingdom
+        territory.save()
+        self.assertCurrent()
+
+    def test_kingdom_renamed(self):
+        kingdom = self.world['kingdom']
+        kingdom.name = 'Renamed Kingdom'
+        kingdom.save()
+        self.assertCurrent()
+
+    def test_node_delete(self):
+        self.world['nodes'][1].delete()
+        self.assertCurrent()
+
+    def test_rebuild_command(self):
+        expected = self.rollup()
+        StationAvailability.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_station_availability', stdout=out)
+        self.assertIn('Rebuilt {} rows'.format(len(expected)), out.getvalue())
+        self.assertEqual(self.rollup(), expected)
+
+
+class PartitionedGraphTests(SimpleTestCase):
+    """
+    Routes over territory partitions should cost the same as Dijkstra on the
+    whole graph, follow real edges, and an edit should only recompute its own
+    territory.
+    """
+    def random_graph(self, rng, size=120, territories=6):
+        nodes = [(i, str(i), i % 15 == 0, rng.randint(1, 9),
+                  i * territories // size + 1) for i in range(size)]
+        edges = {(i, i + 1) for i in range(size - 1) if rng.random() < 0.9}
+        edges.update((rng.randrange(size), rng.randrange(size))
+                     for _ in range(size // 2))
+        return nodes, {(a, b) for a, b in edges if a != b}
+
+    def assertRoutesMatch(self, graph, partitioned, pairs):
+        for source, target in pairs:
+            s, t = graph.index[source], graph.index[target]
+            dist, _ = graph.shortest_paths([s], stop_at={t})
+            path = partitioned.route(source, target)
+            if dist[t] is None:
+                self.assertIsNone(path)
+                continue
+            self.assertEqual(path.cost, dist[t])
+            self.assertEqual((path.nodes[0], path.nodes[-1]), (source, target))
+            for a, b in zip(path.nodes, path.nodes[1:]):
+                self.assertIn(b, graph.neighbours(a))
+            self.assertEqual(sum(graph.costs[graph.index[n]]
+                                 for n in path.nodes[1:]), path.cost)
+
+    def test_routes_match_dijkstra(self):
+        rng = random.Random(0)
+        for _ in range(5):
+            graph = NodeGraph(*self.random_graph(rng))
+            partitioned = PartitionedGraph.build(graph)
+            pairs = [(rng.randrange(120), rng.randrange(120))
+                     for _ in range(60)]
+            self.assertRoutesMatch(graph, partitioned, pairs)
+
+    def test_shortcut_through_other_territory(self):
+        """
+        Two nodes of one territory can be cheaper to join through another.
+        """
+        nodes = [(1, 'A1', False, 1, 1), (2, 'A2', False, 50, 1),
+                 (3, 'A3', False, 1, 1), (4, 'B1', False, 1, 2)]
+        graph = NodeGraph(nodes, [(1, 2), (2, 3), (1, 4), (4, 3)])
+        self.assertEqual(PartitionedGraph.build(graph).route(1, 3),
+                         (2, [1, 4, 3]))
+
+    def test_unknown_node(self):
+        graph = NodeGraph([(1, 'One', True, None, 1)], [])
+        with self.assertRaises(KeyError):
+            PartitionedGraph.build(graph).route(1, 2)
+
+    def test_edit_rebuilds_one_territory(self):
+        rng = random.Random(1)
+        nodes, edges = self.random_graph(rng)
+        partitioned = PartitionedGraph.build(NodeGraph(nodes, edges))
+        self.assertEqual(len(partitioned.rebuilt), 6)
+        # Node 31 is in territory 2
+        nodes[31] = nodes[31][:3] + (100,) + nodes[31][4:]
+        graph = NodeGraph(nodes, edges)
+        updated = partitioned.updated(graph)
+        self.assertEqual(updated.rebuilt, [2])
+        self.assertRoutesMatch(graph, updated,
+                               [(rng.randrange(120), rng.randrange(120))
+                                for _ in range(60)])
+
+    def test_process_pool(self):
+        graph = NodeGraph(*self.random_graph(random.Random(2)))
+        pooled = PartitionedGraph.build(graph, workers=2)
+        inline = PartitionedGraph.build(graph)
+        for territory, partition in inline.partitions.items():
+            self.assertEqual(pooled.partitions[territory].dist.tolist(),
+                             partition.dist.tolist())
+
+
+class NodeRouteViewTests(TestCase):
+    """
+    The route endpoint should serve point to point paths across territories.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.start = create_node(name='Start')
+        other = Territory.objects.create(name='Other Territory',
+                                         kingdom=cls.start.territory.kingdom)
+        cls.middle = create_node(name='Middle', is_hub=True,
+                                 contribution_cost=None, territory=other)
+        cls.end = create_node(name='End', territory=cls.start.territory)
+        cls.middle.connected_nodes.add(cls.start, cls.end)
+
+    def setUp(self):
+        invalidate_graph()
+        invalidate_partitioned_graph()
+
+    def test_route(self):
+        response = self.client.get(reverse('nodes:nodes:route',
+                                           kwargs={'pk': self.start.pk}),
+                                   {'to': self.end.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(),
+                         {'from': self.start.pk,
+                          'to': self.end.pk,
+                          'reachable': True,
+                          'cost': 2,
+                          'path': [{'id': self.start.pk, 'name': 'Start'},
+                                   {'id': self.middle.pk, 'name': 'Middle'},
+                                   {'id': self.end.pk, 'name': 'End'}]})
+
+    def test_unreachable(self):
+        node = create_node(name='Island', territory=self.start.territory)
+        response = self.client.get(reverse('nodes:nodes:route',
+                                           kwargs={'pk': self.start.pk}),
+                                   {'to': node.pk})
+        self.assertFalse(response.json()['reachable'])
+
+    def test_bad_requests(self):
+        url = reverse('nodes:nodes:route', kwargs={'pk': self.start.pk})
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'to': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'to': 0}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('nodes:nodes:route',
+                                                 kwargs={'pk': 0}),
+                                         {'to': self.end.pk}).status_code, 404)
+
+
+class ASGITests(SimpleTestCase):
+    """
+    The ASGI entry point should translate requests for the WSGI application
+    and send heavy views to their own pool.
+    """
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': '/nodes/plan/',
+        'root_path': '',
+        'query_string': b'resources=1,2',
+        'headers': [(b'host', b'localhost'), (b'content-type', b'text/plain'),
+                    (b'content-length', b'5'), (b'accept', b'a'),
+                    (b'accept', b'b')],
+        'server': ('localhost', 8000),
+        'client': ('10.0.0.1', 5000),
+    }
+
+    def echo(self, environ, start_response):
+        start_response('201 Created', [('Content-Type', 'text/plain'),
+                                       ('X-Thread', str(threading.get_ident()))])
+        return [environ['PATH_INFO'].encode('latin-1'), b'?',
+                environ['QUERY_STRING'].encode('latin-1'), b' ',
+                environ['wsgi.input'].read()]
+
+    def call(self, app, scope, sent=None):
+        bodies = [{'type': 'http.request', 'body': b'he', 'more_body': True},
+                  {'type': 'http.request', 'body': b'llo'}]
+        sent = [] if sent is None else sent
+
+        async def receive():
+            return bodies.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(app(scope, receive, send))
+        finally:
+            loop.close()
+        return sent
+
+    def test_environ(self):
+        environ = build_environ(self.scope, b'hello')
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(environ['PATH_INFO'], '/nodes/plan/')
+        self.assertEqual(environ['QUERY_STRING'], 'resources=1,2')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['CONTENT_LENGTH'], '5')
+        self.assertEqual(environ['HTTP_ACCEPT'], 'a,b')
+        self.assertEqual(environ['SERVER_PORT'], '8000')
+        self.assertEqual(environ['REMOTE_ADDR'], '10.0.0.1')
+        self.assertEqual(environ['wsgi.input'].read(), b'hello')
+
+    def test_response(self):
+        app = ASGIApplication(self.echo, 1, 1, ['nodes:plan'])
+        self.addCleanup(app.shutdown)
+        start, *bodies = self.call(app, self.scope)
+        self.assertEqual(start['status'], 201)
+        self.assertIn((b'content-type', b'text/plain'), start['headers'])
+        self.assertEqual(b''.join(body['body'] for body in bodies),
+                         b'/nodes/plan/?resources=1,2 hello')
+        self.assertTrue(all(body['more_body'] for body in bodies[:-1]))
+        self.assertFalse(bodies[-1].get('more_body'))
+
+    def test_streaming(self):
+        """
+        Each chunk is sent before the next one is produced.
+        """
+        sent = []
+
+        def stream(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            for i in range(3):
+                yield str(i).encode()
+                # Everything before this chunk is out by now
+                self.assertEqual(len(sent), i + 1)
+
+        app = ASGIApplication(stream, 1, 0, [])
+        self.addCleanup(app.shutdown)
+        self.call(app, self.scope, sent)
+        self.assertEqual([message.get('body') for message in sent],
+                         [None, b'0', b'1', b'2'])
+
+    def test_pools(self):
+        app = ASGIApplication(self.echo, 1, 1, ['nodes:plan'])
+        self.addCleanup(app.shutdown)
+        self.assertTrue(app.is_heavy('/nodes/plan/'))
+        self.assertFalse(app.is_heavy('/nodes/nodes/'))
+        self.assertFalse(app.is_heavy('/missing/'))
+
+        def thread(path):
+            start = self.call(app, dict(self.scope, path=path))[0]
+            return dict(start['headers'])[b'x-thread']
+
+        self.assertEqual(thread('/nodes/plan/'), thread('/nodes/plan/'))
+        self.assertEqual(thread('/nodes/nodes/'), thread('/missing/'))
+        self.assertNotEqual(thread('/nodes/plan/'), thread('/nodes/nodes/'))
+
+    def test_shared_pool(self):
+        app = ASGIApplication(self.echo, 2, 0, ['nodes:plan'])
+        self.addCleanup(app.shutdown)
+        self.assertFalse(app.is_heavy('/nodes/plan/'))
+
+    def test_startup(self):
+        started = []
+        app = ASGIApplication(self.echo, 1, 0, [],
+                              startup=[lambda: started.append(True)])
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(app({'type': 'lifespan'}, receive, send))
+        finally:
+            loop.close()
+        self.assertEqual(started, [True])
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+
+
+class MetricsTests(TestCase):
+    """
+    The metrics middleware should count each request against its route and
+    serve the histograms in the Prometheus format.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.node = create_node(name='Test Node')
+
+    def setUp(self):
+        patcher = mock.patch('bdo_tools.metrics._metrics', metrics.Metrics())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.log = os.path.join(self.directory, 'slow', 'requests.log')
+
+    def test_route_metrics(self):
+        self.client.get(reverse('nodes:nodes:detail',
+                                kwargs={'pk': self.node.pk}))
+        histograms = metrics.get_metrics().routes['nodes:nodes:detail']
+        self.assertEqual(sum(histograms['queries'].counts), 1)
+        self.assertGreater(histograms['queries'].sum, 0)
+        self.assertGreater(histograms['response_bytes'].sum, 0)
+
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE bdo_request_seconds histogram', text)
+        self.assertIn('bdo_request_seconds_count{route="nodes:nodes:detail"} 1',
+                      text)
+        self.assertIn('bdo_queries_bucket{route="nodes:nodes:detail",'
+                      'le="+Inf"} 1', text)
+        self.assertIn('bdo_responses_total{route="nodes:nodes:detail",'
+                      'status="200"} 1', text)
+
+    def test_buckets(self):
+        histogram = metrics.Histogram([1, 5])
+        for value in (0, 1, 2, 5, 6):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 2, 1])
+        self.assertEqual(histogram.sum, 14)
+
+    @override_settings(METRICS_SLOW_SECONDS=0, METRICS_SLOW_SAMPLE_RATE=1)
+    def test_duplicates_and_slow_trace(self):
+        def get_response(request):
+            Node.objects.filter(pk=self.node.pk).exists()
+            Node.objects.filter(pk=self.node.pk).exists()
+            Node.objects.count()
+            return HttpResponse('ok')
+
+        with self.settings(METRICS_SLOW_LOG=self.log):
+            metrics.MetricsMiddleware(get_response)(
+                RequestFactory().get('/somewhere/'))
+        histograms = metrics.get_metrics().routes['unresolved']
+        self.assertEqual(histograms['queries'].sum, 3)
+        self.assertEqual(histograms['duplicate_queries'].sum, 1)
+        with open(self.log) as f:
+            trace = json.loads(f.readline())
+        self.assertEqual(trace['path'], '/somewhere/')
+        self.assertEqual(trace['queries'], 3)
+        self.assertEqual(len(trace['repeated']), 1)
+        self.assertEqual(trace['repeated'][0]['count'], 2)
+
+    def test_fast_requests_not_traced(self):
+        with self.settings(METRICS_SLOW_LOG=self.log):
+            self.client.get(reverse('nodes:main'))
+        self.assertFalse(os.path.exists(self.log))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class SearchViewTests(TestCase):
+    """
+    Search should find every type by word prefix, rank names starting with
+    the query first and count the matches of each type.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+        cls.velia = create_node(name='Velia', node_manager='Bahar')
+        Material.objects.create(name='Velvet')
+
+    def search(self, **params):
+        response = self.client.get(reverse('nodes:search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_types_and_facets(self):
+        data = self.search(q='test')
+        self.assertEqual(data['facets'], {'node': 6,
+                                          'territory': 4,
+                                          'property': 24,
+                                          'material': 3,
+                                          'station': 3})
+        self.assertEqual(len(data['results']), 20)
+
+    def test_ranking(self):
+        data = self.search(q='vel')
+        self.assertEqual([(r['type'], r['name']) for r in data['results']],
+                         [('node', 'Velia'), ('material', 'Velvet')])
+        self.assertEqual(data['results'][0]['url'],
+                         reverse('nodes:nodes:detail',
+                                 kwargs={'pk': self.velia.pk}))
+
+    def test_words(self):
+        names = [r['name'] for r in self.search(q='node 3 prop')['results']]
+        self.assertEqual(names[0], 'Test Node 3 Property')
+        self.assertTrue(all(name.startswith('Test Node 3 Property')
+                            for name in names))
+
+    def test_node_manager(self):
+        data = self.search(q='bahar')
+        self.assertEqual([r['id'] for r in data['results']], [self.velia.pk])
+
+    def test_type_filter(self):
+        data = self.search(q='test', type='station', limit=2)
+        self.assertEqual([r['type'] for r in data['results']],
+                         ['station', 'station'])
+        self.assertEqual(data['facets']['node'], 6)
+
+    def test_short_query(self):
+        data = self.search(q='v')
+        self.assertEqual(data['results'], [])
+        self.assertEqual(set(data['facets'].values()), {0})
+
+    def test_bad_requests(self):
+        url = reverse('nodes:search')
+        self.assertEqual(self.client.get(url, {'q': 'test', 'type': 'x'})
+                         .status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'test', 'limit': 'x'})
+                         .status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'test', 'limit': 500})
+                         .status_code, 400)
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('Cat'), {'  c', ' ca', 'cat', 'at '})
+
+    def test_fallback_word_prefix(self):
+        _, counts = _search_fallback('erty', ['erty'], None, 20)
+        self.assertEqual(counts['property'], 0)
+        _, counts = _search_fallback('prop', ['prop'], None, 20)
+        self.assertEqual(counts['property'], 24)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs PostgreSQL')
+class PostgreSQLSearchTests(TestCase):
+    """
+    The PostgreSQL search should find everything the fallback finds, and
+    names with a typo too.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        create_world()
+        cls.velia = create_node(name='Velia', node_manager='Bahar')
+
+    def test_matches_fallback(self):
+        for query in ('test', 'node 3 prop', 'vel', 'bahar', 'erty'):
+            words = query.split()
+            results, counts = _search_postgresql(query, words, None, 100)
+            expected, expected_counts = _search_fallback(query, words, None,
+                                                         100)
+            self.assertLessEqual({(r.type, r.id) for r in expected},
+                                 {(r.type, r.id) for r in results}, query)
+            for type, count in expected_counts.items():
+                self.assertGreaterEqual(counts.get(type, 0), count, query)
+        results, _ = _search_postgresql('node 3 prop', ['node', '3', 'prop'],
+                                        None, 20)
+        self.assertEqual(results[0].name, 'Test Node 3 Property')
+
+    def test_typo(self):
+        results = search('Vellia').results
+        self.assertEqual((results[0].type, results[0].id),
+                         ('node', self.velia.pk))
+
+
+class AutocompleteTests(TestCase):
+    """
+    Completions should come from memory, first words first, and follow
+    edits made here through signals and elsewhere through the version check.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.velia = create_node(name='Velia')
+        cls.town = create_node(name='Old Velia Town')
+        cls.property = Property.objects.create(name='Velia Residence 1',
+                                               node=cls.velia)
+        cls.material = Material.objects.create(name='velvet')
+        cls.station = Station.objects.create(name='Loom of Velia')
+
+    def setUp(self):
+        invalidate_autocomplete_index()
+        self.addCleanup(invalidate_autocomplete_index)
+
+    def complete(self, prefix, **kwargs):
+        return [(c.type, c.name)
+                for c in get_autocomplete_index().complete(prefix, **kwargs)]
+
+    def test_complete(self):
+        self.assertEqual(self.complete('VEL'),
+                         [('node', 'Velia'),
+                          ('property', 'Velia Residence 1'),
+                          ('material', 'velvet'),
+                          ('station', 'Loom of Velia'),
+                          ('node', 'Old Velia Town')])
+        self.assertEqual(self.complete('vel', limit=2),
+                         [('node', 'Velia'), ('property', 'Velia Residence 1')])
+        self.assertEqual(self.complete('velia t'), [('node', 'Old Velia Town')])
+        self.assertEqual(self.complete('vel', type='station'),
+                         [('station', 'Loom of Velia')])
+        self.assertEqual(self.complete(' '), [])
+
+    def test_signals(self):
+        get_autocomplete_index()
+        node = create_node(name='Velia Farm')
+        self.assertEqual(self.complete('velia f'), [])
+        run_on_commit()
+        self.assertIn(('node', 'Velia Farm'), self.complete('velia f'))
+        node.name = 'Heidel Farm'
+        node.save()
+        run_on_commit()
+        self.assertEqual(self.complete('velia f'), [])
+        self.assertEqual(self.complete('heid'), [('node', 'Heidel Farm')])
+        Material.objects.get(pk=self.material.pk).delete()
+        run_on_commit()
+        self.assertNotIn(('material', 'velvet'), self.complete('vel'))
+        Station.objects.create(name='Velia Anvil')
+        run_on_commit()
+        self.assertIn(('station', 'Velia Anvil'), self.complete('vel'))
+
+    def test_rollback(self):
+        get_autocomplete_index()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                create_node(name='Velia Farm')
+                Material.objects.create(name='velvet')
+        run_on_commit()
+        self.assertEqual(self.complete('velia f'), [])
+
+    def test_concurrent_reads(self):
+        index = get_autocomplete_index()
+        errors = []
+
+        def read():
+            try:
+                for _ in range(200):
+                    index.complete('vel')
+            except Exception as e:
+                errors.append(e)
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(200):
+            index.update('material', -i - 1, 'Velvet {}'.format(i))
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+
+    def test_recheck(self):
+        get_autocomplete_index()
+        # Edits without signals, as by another process
+        Node.objects.filter(pk=self.velia.pk).update(name='Calpheon',
+                                                     modified=timezone.now())
+        self.assertEqual(self.complete('calph'), [])
+        with override_settings(SHARED_CACHE_RECHECK_SECONDS=0):
+            self.assertEqual(self.complete('calph'), [('node', 'Calpheon')])
+
+    def test_view(self):
+        get_autocomplete_index()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('nodes:autocomplete'),
+                                       {'q': 'velv'})
+        self.assertEqual(response.json(), {'results': [
+            {'type': 'material', 'id': self.material.pk, 'name': 'velvet'}]})
+        self.assertEqual(self.client.get(reverse('nodes:autocomplete'),
+                                         {'q': 'v', 'type': 'x'}).status_code,
+                         400)
+
+
+class FacetTests(TestCase):
+    """
+    The node and property lists should filter by every facet and count the
+    options of each facet with the other filters applied, in one query.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = create_world()
+
+    def setUp(self):
+        invalidate_facet_counts()
+
+    def facets(self, name, **filters):
+        response = self.client.get(reverse(name), filters)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['count'], {facet: {option['value']: option['count']
+                                       for option in options}
+                               for facet, options in data['facets'].items()}
+
+    def test_node_facets(self):
+        territories = self.world['territories']
+        materials = self.world['materials']
+        stations = self.world['stations']
+        with self.assertNumQueries(1):
+            count, facets = self.facets('nodes:nodes:facets')
+        self.assertEqual(count, 6)
+        self.assertEqual(facets['territory'], {t.pk: 2 for t in territories})
+        self.assertEqual(facets['is_hub'], {True: 1, False: 5})
+        self.assertEqual(facets['material'], {m.pk: 2 for m in materials})
+        self.assertEqual(facets['station'], {s.pk: 6 for s in stations})
+        self.assertEqual(facets['level'], {1: 6, 2: 6, 3: 6})
+        self.assertEqual(facets['cost'], {1: 5})
+
+        count, facets = self.facets('nodes:nodes:facets',
+                                    territory=territories[0].pk)
+        self.assertEqual(count, 2)
+        # The other territories can still be picked
+        self.assertEqual(facets['territory'], {t.pk: 2 for t in territories})
+        self.assertEqual(facets['is_hub'], {True: 1, False: 1})
+
+    def test_cache(self):
+        self.facets('nodes:nodes:facets')
+        with self.assertNumQueries(0):
+            self.facets('nodes:nodes:facets')
+        Resource.objects.filter(material=self.world['materials'][0]).delete()
+        create_resource(node=self.world['nodes'][3],
+                        material=self.world['materials'][1])
+        _, facets = self.facets('nodes:nodes:facets')
+        self.assertEqual(facets['material'], {self.world['materials'][1].pk: 3,
+                                              self.world['materials'][2].pk: 2})
+
+    def test_filters(self):
+        stations = self.world['stations']
+        for filters, expected in [
+                ({'material': self.world['materials'][0].pk}, 2),
+                ({'is_hub': 'true'}, 1),
+                ({'min_cost': 1, 'max_cost': 1}, 5),
+                ({'kingdom': self.world['kingdom'].pk}, 6),
+                # Level 1 is the only level of the first station
+                ({'station': stations[0].pk, 'min_level': 2}, 0),
+                ({'station': stations[2].pk, 'min_level': 2}, 6)]:
+            count, _ = self.facets('nodes:nodes:facets', **filters)
+            self.assertEqual(count, expected, filters)
+        _, facets = self.facets('nodes:nodes:facets', station=stations[0].pk)
+        self.assertEqual(facets['level'], {1: 6})
+
+    def test_property_facets(self):
+        territory = self.world['territories'][1]
+        count, facets = self.facets('nodes:properties:facets',
+                                    territory=territory.pk,
+                                    station=self.world['stations'][1].pk)
+        self.assertEqual(count, 8)
+        self.assertEqual(set(facets), {'territory', 'kingdom', 'station',
+                                       'level'})
+        self.assertEqual(facets['level'], {2: 8})
+
+    def test_list(self):
+        territory = self.world['territories'][0]
+        response = self.client.get(reverse('nodes:nodes:list'),
+                                   {'territory': territory.pk})
+        self.assertEqual(response.context['filtered_count'], 2)
+        self.assertEqual(len(response.context['object_list']), 2)
+        title, options = response.context['facets'][0]
+        self.assertEqual(title, 'Territory')
+        selected = [query for option, query in options if option.selected]
+        # Picking the selected territory again clears it
+        self.assertEqual(selected, [''])
+        self.assertContains(response, territory.name)
+
+    def test_bad_filters(self):
+        for params in ({'territory': 'x'}, {'min_level': -1},
+                       {'is_hub': 'yes'}):
+            response = self.client.get(reverse('nodes:nodes:list'), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_bad_filter_errors(self):
+        """
+        Malformed filters are answered with the form errors, not logged as a
+        security event.
+        """
+        for name in ('nodes:nodes:list', 'nodes:nodes:facets'):
+            with self.assertRaises(AssertionError):
+                with self.assertLogs('django.security'):
+                    response = self.client.get(reverse(name),
+                                               {'min_cost': 'abc'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()['errors']), ['min_cost'])
+
+
 # Helper Methods
 #
+def run_on_commit():
+    """
+    Run the on_commit callbacks held back by the transaction of the test.
+    """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
 def create_node(**create_args):
     """
     Create a Node with select optional default values.
@@ -767,21 +2842,73 @@ def create_node(**create_args):
     if 'node_manager' not in create_args:
         create_args['node_manager'] = 'Test Manager'
     if 'territory' not in create_args:
-        create_args['territory'] = Territory.objects.create(name='Test Territory',
-                                                            kingdom=Kingdom.objects.create(name='Test Kingdom'))
+        kingdom, _ = Kingdom.objects.get_or_create(name='Test Kingdom')
+        create_args['territory'], _ = Territory.objects.get_or_create(name='Test Territory',
+                                                                      defaults={'kingdom': kingdom})
     elif create_args['territory'] is None:
         create_args.pop('territory')
     return Node.objects.create(**create_args)
 
 
+material_numbers = itertools.count()
+
+
 def create_resource(**create_args):
     """
     Create a Resource with select optional default values.
     """
     if 'material' not in create_args:
-        create_args['material'] = Material.objects.create(name='Test Material')
+        # Material names are unique
+        create_args['material'] = Material.objects.create(name='Test Material {}'.format(next(material_numbers)))
     elif create_args['material'] is None:
         create_args.pop('material')
     if 'contribution_cost' not in create_args:
         create_args['contribution_cost'] = 1
     return Resource.objects.create(**create_args)
+
+
+def create_world():
+    """
+    Create a small world where every relation shown by a page has several
+    rows. Returns a dict of the created objects.
+    """
+    kingdom = Kingdom.objects.create(name='Test Kingdom')
+    territories = [Territory.objects.create(name='Test Territory {}'.format(i),
+                                            kingdom=kingdom)
+                   for i in range(3)]
+    nodes = [create_node(name='Test Node {}'.format(i),
+                         territory=territories[i % 3],
+                         is_hub=i == 0,
+                         contribution_cost=None if i == 0 else 1)
+             for i in range(6)]
+    for node, next_node in zip(nodes, nodes[1:]):
+        node.connected_nodes.add(next_node)
+    nodes[1].connected_nodes.add(nodes[3], nodes[4])
+    materials = [Material.objects.create(name='Test Material {}'.format(i))
+                 for i in range(3)]
+    resources = [create_resource(node=node, material=material)
+                 for node in nodes[1:3] for material in materials]
+    stations = [Station.objects.create(name='Test Station {}'.format(i))
+                for i in range(3)]
+    properties = []
+    for node in nodes:
+        parent = Property.objects.create(name='{} Property'.format(node.name),
+                                         node=node)
+        properties.append(parent)
+        for i in range(3):
+            child = Property.objects.create(name='{} {}'.format(parent.name, i),
+                                            node=node,
+                                            parent_property=parent)
+            properties.append(child)
+        for i, station in enumerate(stations):
+            for property in [parent] + properties[-3:]:
+                PropertyStation.objects.create(property=property,
+                                               station=station,
+                                               max_level=i + 1)
+    return {'kingdom': kingdom,
+            'territories': territories,
+            'nodes': nodes,
+            'materials': materials,
+            'resources': resources,
+            'stations': stations,
+            'properties': properties}
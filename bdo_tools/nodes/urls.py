@@ -1,26 +1,32 @@
 from django.conf.urls import include, url
-from django.views.generic import DetailView, ListView, TemplateView
+from django.views.generic import TemplateView
 
-from . import models
+from . import views
 
 kingdoms_patterns = [
-    url(r'^(?P<pk>[0-9]+)/$', DetailView.as_view(model=models.Kingdom), name='detail'),
-    url(r'^$', ListView.as_view(model=models.Kingdom), name='list'),
+    url(r'^(?P<pk>[0-9]+)/$', views.KingdomDetailView.as_view(), name='detail'),
+    url(r'^$', views.KingdomListView.as_view(), name='list'),
 ]
 
 territories_patterns = [
-    url(r'^(?P<pk>[0-9]+)/$', DetailView.as_view(model=models.Territory), name='detail'),
-    url(r'^$', ListView.as_view(model=models.Territory), name='list'),
+    url(r'^(?P<pk>[0-9]+)/$', views.TerritoryDetailView.as_view(), name='detail'),
+    url(r'^$', views.TerritoryListView.as_view(), name='list'),
 ]
 
 nodes_patterns = [
-    url(r'^(?P<pk>[0-9]+)/$', DetailView.as_view(model=models.Node), name='detail'),
-    url(r'^$', ListView.as_view(model=models.Node), name='list'),
+    url(r'^(?P<pk>[0-9]+)/$', views.NodeDetailView.as_view(), name='detail'),
+    url(r'^(?P<pk>[0-9]+)/path/$', views.NodePathView.as_view(), name='path'),
+    url(r'^(?P<pk>[0-9]+)/route/$', views.NodeRouteView.as_view(), name='route'),
+    url(r'^facets/$', views.FacetsView.as_view(faceting=views.NodeListView.faceting),
+        name='facets'),
+    url(r'^$', views.NodeListView.as_view(), name='list'),
 ]
 
 properties_patterns = [
-    url(r'^(?P<pk>[0-9]+)/$', DetailView.as_view(model=models.Property), name='detail'),
-    url(r'^$', ListView.as_view(model=models.Property), name='list'),
+    url(r'^(?P<pk>[0-9]+)/$', views.PropertyDetailView.as_view(), name='detail'),
+    url(r'^facets/$', views.FacetsView.as_view(faceting=views.PropertyListView.faceting),
+        name='facets'),
+    url(r'^$', views.PropertyListView.as_view(), name='list'),
 ]
 
 app_name = 'nodes'
@@ -29,5 +35,9 @@ urlpatterns = [
     url(r'^territories/', include(territories_patterns, namespace='territories')),
     url(r'^nodes/', include(nodes_patterns, namespace='nodes')),
     url(r'^properties/', include(properties_patterns, namespace='properties')),
+    url(r'^plan/$', views.ResourcePlanView.as_view(), name='plan'),
+    url(r'^snapshot/$', views.SnapshotView.as_view(), name='snapshot'),
+    url(r'^search/$', views.SearchView.as_view(), name='search'),
+    url(r'^autocomplete/$', views.AutocompleteView.as_view(), name='autocomplete'),
     url(r'^$', TemplateView.as_view(template_name='nodes/main.html'), name='main'),
 ]
@@ -1,3 +1,447 @@
-from django.shortcuts import render
+import gzip
 
-# Create your views here.
+from django.db.models import Count, Max, Prefetch
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.urls import reverse
+from django.utils.http import http_date, quote_etag
+from django.views.generic import DetailView, ListView, View
+
+from bdo_tools.pagination import KeysetPaginationMixin
+from bdo_tools.query import InvalidQuery, InvalidQueryMixin
+from jobs.queue import enqueue
+from . import models
+from .autocomplete import AUTOCOMPLETE_TYPES, get_autocomplete_index
+from .distances import get_hub_distances
+from .facets import RANGE_FACETS, FacetFilterForm, Faceting
+from .graph import get_graph
+from .page_cache import CachedDetailMixin
+from .partitions import get_partitioned_graph
+from .planner import PlanningError, plan_resources
+from .search import SEARCH_TYPES, search
+from .snapshot import current_version, load_snapshot
+
+
+#
+# Facets
+#
+FACET_TITLES = {
+    'territory': 'Territory',
+    'kingdom': 'Kingdom',
+    'is_hub': 'Hub',
+    'material': 'Material',
+    'station': 'Station',
+    'level': 'Station level',
+    'cost': 'Contribution cost',
+}
+
+
+class FacetedListMixin(InvalidQueryMixin):
+    """
+    Filter a list by the query parameters of :class:`FacetFilterForm` and add
+    the options of every facet of ``faceting``, with their counts, to the
+    context. Invalid filters get a 400 with the form errors.
+    """
+    faceting = None
+    # Options shown per facet, most common first, besides the selected ones
+    facet_option_limit = 10
+
+    def get_filters(self):
+        if not hasattr(self, '_filters'):
+            form = FacetFilterForm(self.request.GET)
+            if not form.is_valid():
+                raise InvalidQuery({field: list(errors) for field, errors
+                                    in form.errors.items()})
+            self._filters = form.cleaned_data
+        return self._filters
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            self.faceting.conditions(self.get_filters()))
+
+    def get_option_query(self, facet, option):
+        """
+        The query string that toggles ``option`` of ``facet``, from the
+        first page.
+        """
+        query = self.request.GET.copy()
+        for key in ('after', 'before'):
+            query.pop(key, None)
+        keys = ['min_' + facet, 'max_' + facet] if facet in RANGE_FACETS \
+            else [facet]
+        for key in keys:
+            query.pop(key, None)
+        if not option.selected:
+            value = option.value
+            if isinstance(value, bool):
+                value = 'true' if value else 'false'
+            for key in keys:
+                query[key] = value
+        return query.urlencode()
+
+    def get_context_data(self, **kwargs):
+        count, facets = self.faceting.cached_counts(self.get_filters())
+        kwargs['filtered_count'] = count
+        kwargs['facets'] = []
+        for facet, options in facets.items():
+            common = sorted(options, key=lambda o: -o.count)
+            shown = set(common[:self.facet_option_limit])
+            shown.update(option for option in options if option.selected)
+            kwargs['facets'].append((
+                FACET_TITLES[facet],
+                [(option, self.get_option_query(facet, option))
+                 for option in options if option in shown]))
+        return super().get_context_data(**kwargs)
+
+
+class FacetsView(FacetedListMixin, View):
+    """
+    The number of rows of a list matching its filters and the counts of the
+    options of every facet, as JSON.
+    """
+    def get(self, request):
+        count, facets = self.faceting.cached_counts(self.get_filters())
+        return JsonResponse({
+            'count': count,
+            'facets': {facet: [option._asdict() for option in options]
+                       for facet, options in facets.items()},
+        })
+
+
+#
+# Kingdoms
+#
+class KingdomDetailView(DetailView):
+    queryset = models.Kingdom.objects.prefetch_related('territories')
+
+
+class KingdomListView(KeysetPaginationMixin, ListView):
+    model = models.Kingdom
+
+
+#
+# Territories
+#
+class TerritoryDetailView(DetailView):
+    queryset = models.Territory.objects.select_related('kingdom')\
+                                       .prefetch_related('nodes')
+
+    def get_context_data(self, **kwargs):
+        """Count the properties with each station from the rollup"""
+        context = super().get_context_data(**kwargs)
+        context['stations'] = self.object.station_availability\
+            .values('station_id', 'station__name')\
+            .annotate(properties=Count('pk'), max_level=Max('max_level'))\
+            .order_by('station__name')
+        return context
+
+
+class TerritoryListView(KeysetPaginationMixin, ListView):
+    queryset = models.Territory.objects.select_related('kingdom')
+
+
+#
+# Nodes
+#
+class NodeDetailView(CachedDetailMixin, DetailView):
+    queryset = models.Node.objects.select_related('territory__kingdom')\
+        .prefetch_related(
+            'connected_nodes',
+            Prefetch('resources',
+                     queryset=models.Resource.objects.select_related('material')),
+            Prefetch('properties',
+                     queryset=models.Property.objects.select_related('parent_property')))
+
+
+class NodeListView(KeysetPaginationMixin, FacetedListMixin, ListView):
+    queryset = models.Node.objects.select_related('territory__kingdom')
+    faceting = Faceting(models.Node.objects.all(),
+                        ['territory', 'kingdom', 'is_hub', 'material',
+                         'station', 'level', 'cost'])
+
+
+class NodePathView(View):
+    """
+    The cheapest contribution point path to a :model:`nodes.Node` from the
+    nearest hub, or from the hub given as ``?hub=<id>``, as JSON.
+    """
+    def get(self, request, pk):
+        graph = get_graph()
+        pk = int(pk)
+        if pk not in graph:
+            raise Http404('No node with id {}'.format(pk))
+        distances = get_hub_distances(graph)
+        hub = request.GET.get('hub')
+        if hub is not None:
+            try:
+                hub = int(hub)
+            except ValueError:
+                return JsonResponse({'error': 'hub must be a node id'},
+                                    status=400)
+            if hub not in distances.rows:
+                return JsonResponse({'error': 'Node {} is not a hub'.format(hub)},
+                                    status=400)
+        path = distances.path(pk, hub)
+        if path is None:
+            return JsonResponse({'node': pk,
+                                 'hub': hub,
+                                 'reachable': False,
+                                 'cost': None,
+                                 'path': []})
+        return JsonResponse({
+            'node': pk,
+            'hub': path.nodes[0],
+            'reachable': True,
+            'cost': path.cost,
+            'path': [{'id': node_id, 'name': graph.names[graph.index[node_id]]}
+                     for node_id in path.nodes],
+        })
+
+
+class NodeRouteView(View):
+    """
+    The cheapest contribution point path from a :model:`nodes.Node` to the
+    node given as ``?to=<id>``, as JSON.
+    """
+    def get(self, request, pk):
+        graph = get_graph()
+        pk = int(pk)
+        if pk not in graph:
+            raise Http404('No node with id {}'.format(pk))
+        try:
+            to = int(request.GET['to'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'to must be a node id'}, status=400)
+        if to not in graph:
+            return JsonResponse({'error': 'No node with id {}'.format(to)},
+                                status=400)
+        path = get_partitioned_graph(graph).route(pk, to)
+        if path is None:
+            return JsonResponse({'from': pk,
+                                 'to': to,
+                                 'reachable': False,
+                                 'cost': None,
+                                 'path': []})
+        return JsonResponse({
+            'from': pk,
+            'to': to,
+            'reachable': True,
+            'cost': path.cost,
+            'path': [{'id': node_id, 'name': graph.names[graph.index[node_id]]}
+                     for node_id in path.nodes],
+        })
+
+
+#
+# Properties
+#
+class PropertyDetailView(CachedDetailMixin, DetailView):
+    queryset = models.Property.objects\
+        .select_related('node__territory__kingdom', 'parent_property')\
+        .prefetch_related(
+            Prefetch('propertystation_set',
+                     queryset=models.PropertyStation.objects.select_related('station')))
+
+    def get_context_data(self, **kwargs):
+        """
+        Add ``subtree``, every property below this one as ``(depth,
+        property)`` in depth first order, with their stations.
+        """
+        context = super().get_context_data(**kwargs)
+        descendants = models.Property.objects.descendants(self.object)\
+            .order_by('name', 'id')\
+            .prefetch_related(
+                Prefetch('propertystation_set',
+                         queryset=models.PropertyStation.objects.select_related('station')))
+        children = {}
+        for property in descendants:
+            children.setdefault(property.parent_property_id, []).append(property)
+        subtree = []
+        stack = [(1, child) for child in reversed(children.get(self.object.pk, []))]
+        while stack:
+            depth, property = stack.pop()
+            subtree.append((depth, property))
+            stack.extend((depth + 1, child)
+                         for child in reversed(children.get(property.pk, [])))
+        context['subtree'] = subtree
+        return context
+
+
+class PropertyListView(KeysetPaginationMixin, FacetedListMixin, ListView):
+    queryset = models.Property.objects.select_related('node__territory__kingdom')
+    faceting = Faceting(models.Property.objects.all(),
+                        ['territory', 'kingdom', 'station', 'level'],
+                        node='node__', owner='property_id')
+
+
+#
+# Planning
+#
+class ResourcePlanView(View):
+    """
+    The cheapest set of :model:`nodes.Node` to invest in to claim several
+    :model:`nodes.Resource`, as JSON. Resources are passed as a comma
+    separated ``resources`` query parameter.
+    """
+    def get(self, request):
+        try:
+            resource_ids = [int(resource_id) for resource_id
+                            in request.GET.get('resources', '').split(',')
+                            if resource_id]
+        except ValueError:
+            return JsonResponse({'error': 'resources must be a comma '
+                                          'separated list of ids'},
+                                status=400)
+        if not resource_ids:
+            return JsonResponse({'error': 'No resources requested'},
+                                status=400)
+        graph = get_graph()
+        try:
+            plan = plan_resources(resource_ids, graph)
+        except PlanningError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({
+            'cost': plan.cost,
+            'node_cost': plan.node_cost,
+            'resource_cost': plan.resource_cost,
+            'resources': plan.resources,
+            'nodes': [{'id': node_id, 'name': graph.names[graph.index[node_id]]}
+                      for node_id in plan.nodes],
+        })
+
+
+#
+# Snapshot
+#
+def accepts_gzip(accept_encoding):
+    """
+    Whether an ``Accept-Encoding`` header allows gzip, explicitly or through
+    ``*``, with a quality above zero.
+    """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        coding, *params = coding.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    quality = qualities.get('gzip', qualities.get('x-gzip',
+                                                  qualities.get('*', 0.0)))
+    return quality > 0
+
+
+class SnapshotView(View):
+    """
+    The whole world as one JSON document, gzipped when the client accepts it.
+    Clients that send back the ETag or Last-Modified of their copy get a 304
+    while the data is unchanged. Until the ``nodes.build_snapshot`` job has
+    saved the current version, clients get a 503 and are asked to retry.
+    """
+    retry_after = 10
+
+    def get(self, request):
+        version = current_version()
+        use_gzip = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        # Each encoding is a different representation with its own ETag
+        etag = quote_etag(version.etag + ('-gzip' if use_gzip else ''))
+        last_modified = (int(version.last_modified.timestamp())
+                         if version.last_modified else None)
+
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            snapshot = load_snapshot(version)
+            if snapshot is None:
+                # Folded into the job queued by the edit, if there was one
+                enqueue('nodes.build_snapshot')
+                response = HttpResponse('The snapshot is being built.',
+                                        content_type='text/plain', status=503)
+                response['Retry-After'] = self.retry_after
+                return response
+            if use_gzip:
+                response = HttpResponse(snapshot.content,
+                                        content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(gzip.decompress(snapshot.content),
+                                        content_type='application/json')
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+#
+# Search
+#
+# URL name of the detail page of each search result type
+SEARCH_DETAIL_URLS = {
+    'node': 'nodes:nodes:detail',
+    'territory': 'nodes:territories:detail',
+    'property': 'nodes:properties:detail',
+    'material': 'crafting:materials:detail',
+    'station': 'crafting:stations:detail',
+}
+
+
+class SearchView(View):
+    """
+    Nodes, territories, properties, materials and stations matching ``?q=``,
+    best first, as JSON. ``type`` limits the results to one type and
+    ``limit`` sets how many are returned; ``facets`` counts the matches of
+    every type.
+    """
+    max_limit = 50
+
+    def get(self, request):
+        type = request.GET.get('type') or None
+        if type is not None and type not in SEARCH_TYPES:
+            return JsonResponse({'error': 'type must be one of {}'.format(
+                ', '.join(SEARCH_TYPES))}, status=400)
+        try:
+            limit = int(request.GET.get('limit', 20))
+        except ValueError:
+            return JsonResponse({'error': 'limit must be a number'}, status=400)
+        if not 1 <= limit <= self.max_limit:
+            return JsonResponse({'error': 'limit must be between 1 and '
+                                          '{}'.format(self.max_limit)},
+                                status=400)
+        query = request.GET.get('q', '')
+        found = search(query, type=type, limit=limit)
+        return JsonResponse({
+            'query': query,
+            'facets': found.facets,
+            'results': [{'type': result.type,
+                         'id': result.id,
+                         'name': result.name,
+                         'score': round(result.score, 4),
+                         'url': reverse(SEARCH_DETAIL_URLS[result.type],
+                                        kwargs={'pk': result.id})}
+                        for result in found.results],
+        })
+
+
+class AutocompleteView(View):
+    """
+    Node, material, station and property names starting with ``?q=``, from
+    the in-memory index, as JSON. ``type`` limits them to one type.
+    """
+    limit = 10
+
+    def get(self, request):
+        type = request.GET.get('type') or None
+        if type is not None and type not in AUTOCOMPLETE_TYPES:
+            return JsonResponse({'error': 'type must be one of {}'.format(
+                ', '.join(AUTOCOMPLETE_TYPES))}, status=400)
+        completions = get_autocomplete_index().complete(
+            request.GET.get('q', ''), type=type, limit=self.limit)
+        return JsonResponse({'results': [{'type': completion.type,
+                                          'id': completion.id,
+                                          'name': completion.name}
+                                         for completion in completions]})